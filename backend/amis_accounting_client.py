@@ -1,6 +1,8 @@
 import requests
 import json
+import threading
 from datetime import datetime
+from backend import misa_http
 
 class AmisAccountingClient:
     def __init__(self, app_id, access_code, company_code=None, base_url="https://actapp.misa.vn"):
@@ -16,6 +18,7 @@ class AmisAccountingClient:
         self.base_url = base_url.rstrip("/")
         self.token = None
         self.token_expiry = None
+        self._token_lock = threading.Lock() # Sync fetches pages from several threads
 
     def get_token(self):
         """
@@ -31,7 +34,7 @@ class AmisAccountingClient:
         
         try:
             print(f"[ACT-AUTH] Connecting to {url}...")
-            resp = requests.post(url, json=payload, headers={"Content-Type": "application/json"}, timeout=30)
+            resp = misa_http.request(self.base_url, "POST", url, json=payload, headers={"Content-Type": "application/json"}, timeout=30)
             
             if resp.status_code == 200:
                 data = resp.json()
@@ -39,6 +42,7 @@ class AmisAccountingClient:
                     # Token is inside 'Data' string
                     inner_data = json.loads(data.get("Data", "{}"))
                     self.token = inner_data.get("access_token")
+                    self.token_expiry = misa_http.token_expiry(self.token, inner_data.get("expires_in"))
                     print(f"[ACT-AUTH] Success! Token: {self.token[:10]}...")
                     return self.token
                 else:
@@ -50,9 +54,24 @@ class AmisAccountingClient:
             print(f"[ACT-AUTH] Exception: {e}")
         return None
 
+    def ensure_token(self):
+        """Refresh the token shortly before it expires (once, even with concurrent callers)."""
+        if misa_http.token_is_fresh(self.token, self.token_expiry):
+            return self.token
+        with self._token_lock:
+            if not misa_http.token_is_fresh(self.token, self.token_expiry):
+                self.get_token()
+        return self.token
+
+    def invalidate_token(self, token):
+        """Forget a token the server rejected (unless another thread already replaced it)."""
+        with self._token_lock:
+            if self.token == token:
+                self.token = None
+                self.token_expiry = None
+
     def _get_headers(self):
-        if not self.token:
-            self.get_token()
+        self.ensure_token()
         
         headers = {
             "Content-Type": "application/json",
@@ -70,8 +89,7 @@ class AmisAccountingClient:
         Fetches Dictionary Data from MISA AMIS Accounting.
         Target URL: /apir/sync/actopen/get_dictionary
         """
-        if not self.token:
-            self.get_token()
+        token = self.ensure_token()
             
         endpoint = "apir/sync/actopen/get_dictionary"
         url = f"{self.base_url}/{endpoint}"
@@ -79,7 +97,7 @@ class AmisAccountingClient:
         # User defined headers that work (No Authorization Bearer, No CompanyCode)
         headers = {
             "Content-Type": "application/json",
-            "X-MISA-AccessToken": self.token
+            "X-MISA-AccessToken": token
         }
         
         payload = {
@@ -93,7 +111,13 @@ class AmisAccountingClient:
         # try:
         print(f"[ACT-DICT] Fetching Type {data_type}...")
         # print(f"Payload: {json.dumps(payload)}") 
-        resp = requests.post(url, json=payload, headers=headers, timeout=60)
+        resp = misa_http.request(self.base_url, "POST", url, json=payload, headers=headers, timeout=60)
+
+        # Token revoked/expired early: refresh once and retry
+        if resp.status_code == 401:
+            self.invalidate_token(token)
+            headers["X-MISA-AccessToken"] = self.ensure_token()
+            resp = misa_http.request(self.base_url, "POST", url, json=payload, headers=headers, timeout=60)
         
         # --- UNICODE FIX FORCE ---
         resp.encoding = 'utf-8' 
@@ -153,7 +177,7 @@ class AmisAccountingClient:
         headers = self._get_headers()
         
         try:
-            resp = requests.request(method, url, headers=headers, params=params, json=payload, timeout=30)
+            resp = misa_http.request(self.base_url, method, url, headers=headers, params=params, json=payload, timeout=30)
             resp.raise_for_status()
             
             return resp.json()
@@ -0,0 +1,237 @@
+"""
+Compare sp_RollingSupplyPlanning (v1, week cursor) with sp_RollingSupplyPlanning_v2 (set-based).
+Seeds the same BENCH- data, runs both procedures, diffs the rows and prints the timings.
+
+Usage: python -m backend.compare_rolling_procedures [num_skus] [horizon_months] [--install]
+"""
+import os
+import sys
+import time
+import random
+from datetime import date, datetime, timedelta
+
+import pandas as pd
+from sqlalchemy import text
+
+from backend.database import SessionLocal, engine
+from backend.models import (
+    DimProducts, DimProductGroups, FactForecasts, FactPurchases,
+    FactOpeningStock, FactRollingInventory
+)
+from backend.services.rolling_calc import RollingPlanningEngine
+
+BENCH_PREFIX = "BENCH-"
+BENCH_GROUP = "BENCH_GRP"
+BENCH_WAREHOUSE = "BENCH"
+BENCH_PROFILE = "STD"
+COMPARE_COLUMNS = ['opening_stock', 'forecast_demand', 'incoming_supply', 'planned_supply', 'closing_stock', 'net_requirement', 'min_stock_policy']
+TOLERANCE = 1e-6
+
+PROCEDURE_DIR = os.path.join(os.path.dirname(__file__), "database", "procedures")
+
+
+def install_procedures():
+    """(Re)create both procedures from the .sql files."""
+    with engine.connect() as conn:
+        for file_name in ("sp_RollingSupplyPlanning.sql", "sp_RollingSupplyPlanning_v2.sql"):
+            with open(os.path.join(PROCEDURE_DIR, file_name), encoding="utf-8") as f:
+                print(f"Installing {file_name}...")
+                conn.execute(text(f.read()))
+        conn.commit()
+
+
+def cleanup(db):
+    sku_filter = f"{BENCH_PREFIX}%"
+    db.query(FactRollingInventory).filter(FactRollingInventory.sku_id.like(sku_filter)).delete(synchronize_session=False)
+    db.query(FactForecasts).filter(FactForecasts.sku_id.like(sku_filter)).delete(synchronize_session=False)
+    db.query(FactPurchases).filter(FactPurchases.sku_id.like(sku_filter)).delete(synchronize_session=False)
+    db.query(FactOpeningStock).filter(FactOpeningStock.sku_id.like(sku_filter)).delete(synchronize_session=False)
+    db.query(DimProducts).filter(DimProducts.sku_id.like(sku_filter)).delete(synchronize_session=False)
+    db.query(DimProductGroups).filter(DimProductGroups.group_id == BENCH_GROUP).delete(synchronize_session=False)
+    db.commit()
+
+
+def seed(db, num_skus, horizon_months, run_date):
+    """Random but reproducible SKUs, monthly forecasts, purchases and opening stock."""
+    rnd = random.Random(42)
+    today = datetime.now().date()
+
+    db.add(DimProductGroups(group_id=BENCH_GROUP, group_name="Benchmark"))
+    db.flush()
+
+    products, forecasts, purchases, opening = [], [], [], []
+    first_month = run_date.replace(day=1) - timedelta(days=1)
+    first_month = first_month.replace(day=1)
+
+    for i in range(num_skus):
+        sku = f"{BENCH_PREFIX}{i:05d}"
+        products.append({
+            'sku_id': sku,
+            'product_name': f"Benchmark {i}",
+            'group_id': BENCH_GROUP,
+            'moq': rnd.choice([1, 10, 24, 50, 100]),
+            'avg_weekly_sales': round(rnd.uniform(0, 200), 2),
+            'is_active': True
+        })
+
+        y, m = first_month.year, first_month.month
+        for _ in range(horizon_months + 2):
+            forecasts.append({
+                'run_date': today,
+                'sku_id': sku,
+                'forecast_date': date(y, m, 1),
+                'quantity_predicted': round(rnd.uniform(0, 1000), 2),
+                'model_used': 'BENCH'
+            })
+            m += 1
+            if m > 12:
+                m = 1
+                y += 1
+
+        for j in range(rnd.randint(0, 6)):
+            purchases.append({
+                'transaction_id': f"{sku}_PO{j}",
+                'sku_id': sku,
+                'order_date': datetime.combine(run_date + timedelta(days=rnd.randint(0, horizon_months * 30)), datetime.min.time()),
+                'quantity': rnd.choice([50, 100, 250, 500]),
+                'purchase_type': 'PLANNED',
+                'order_id': f"BENCH_PO{j}",
+                'source': 'BENCH',
+                'warehouse_id': BENCH_WAREHOUSE
+            })
+
+        opening.append({
+            'stock_date': run_date - timedelta(days=7),
+            'warehouse_id': BENCH_WAREHOUSE,
+            'sku_id': sku,
+            'quantity': round(rnd.uniform(0, 2000), 2)
+        })
+
+    db.bulk_insert_mappings(DimProducts, products)
+    db.bulk_insert_mappings(FactForecasts, forecasts)
+    db.bulk_insert_mappings(FactPurchases, purchases)
+    db.bulk_insert_mappings(FactOpeningStock, opening)
+    db.commit()
+    print(f"Seeded {len(products)} SKUs, {len(forecasts)} forecasts, {len(purchases)} purchases.")
+
+
+def seed_manual_edits(db, rnd=None):
+    """
+    Flag ~5% of the calculated cells as planner edits (manual planned supply / opening stock),
+    plus ~1% off-grid manual rows (mid-week dates, as written by the vectorized engine).
+    """
+    rnd = rnd or random.Random(7)
+    rows = db.query(FactRollingInventory.planning_id, FactRollingInventory.sku_id, FactRollingInventory.bucket_date).filter(
+        FactRollingInventory.sku_id.like(f"{BENCH_PREFIX}%"),
+        FactRollingInventory.warehouse_id == BENCH_WAREHOUSE,
+        FactRollingInventory.profile_id == BENCH_PROFILE
+    ).all()
+    edits, off_grid = [], []
+    for planning_id, sku_id, bucket_date in rows:
+        roll = rnd.random()
+        if roll < 0.03:
+            edits.append({'planning_id': planning_id, 'planned_supply': rnd.choice([0, 40, 120, 500]), 'is_manual_planned': True})
+        elif roll < 0.05:
+            edits.append({'planning_id': planning_id, 'opening_stock': round(rnd.uniform(0, 1500), 2), 'is_manual_opening': True})
+        elif roll < 0.06:
+            off_grid.append({
+                'sku_id': sku_id, 'warehouse_id': BENCH_WAREHOUSE, 'profile_id': BENCH_PROFILE,
+                'bucket_date': bucket_date + timedelta(days=3), 'planned_supply': rnd.choice([10, 75]),
+                'is_manual_planned': True, 'is_manual_opening': False
+            })
+    db.bulk_update_mappings(FactRollingInventory, edits)
+    db.bulk_insert_mappings(FactRollingInventory, off_grid)
+    db.commit()
+    print(f"Flagged {len(edits)} cells as manual edits, added {len(off_grid)} off-grid manual rows.")
+
+
+def snapshot(db):
+    query = db.query(FactRollingInventory).filter(
+        FactRollingInventory.sku_id.like(f"{BENCH_PREFIX}%"),
+        FactRollingInventory.warehouse_id == BENCH_WAREHOUSE,
+        FactRollingInventory.profile_id == BENCH_PROFILE
+    )
+    df = pd.read_sql(query.statement, db.bind)
+    df['bucket_date'] = pd.to_datetime(df['bucket_date'])
+    return df.sort_values(['sku_id', 'bucket_date']).reset_index(drop=True)
+
+
+def run_version(db, version, horizon_months, run_date):
+    planner = RollingPlanningEngine(db)
+    t0 = time.perf_counter()
+    planner.run_sql_procedure(
+        horizon_months=horizon_months,
+        profile_id=BENCH_PROFILE,
+        group_id=BENCH_GROUP,
+        warehouse_id=BENCH_WAREHOUSE,
+        run_date=run_date,
+        procedure_version=version
+    )
+    elapsed = time.perf_counter() - t0
+    return snapshot(db), elapsed
+
+
+def compare(df_v1, df_v2):
+    keys = ['sku_id', 'bucket_date']
+    merged = df_v1[keys + COMPARE_COLUMNS].merge(
+        df_v2[keys + COMPARE_COLUMNS], on=keys, how='outer', suffixes=('_v1', '_v2'), indicator=True
+    )
+    missing = merged[merged['_merge'] != 'both']
+    both = merged[merged['_merge'] == 'both']
+
+    mismatches = {}
+    for col in COMPARE_COLUMNS:
+        diff = (both[f"{col}_v1"].fillna(0) - both[f"{col}_v2"].fillna(0)).abs()
+        bad = both[diff > TOLERANCE]
+        if not bad.empty:
+            mismatches[col] = bad[keys + [f"{col}_v1", f"{col}_v2"]]
+    return missing, mismatches
+
+
+def main():
+    args = [a for a in sys.argv[1:] if not a.startswith('--')]
+    num_skus = int(args[0]) if len(args) > 0 else 200
+    horizon_months = int(args[1]) if len(args) > 1 else 12
+    run_date = datetime.now().date()
+
+    if '--install' in sys.argv:
+        install_procedures()
+
+    db = SessionLocal()
+    try:
+        print("Cleaning previous benchmark data...")
+        cleanup(db)
+        seed(db, num_skus, horizon_months, run_date)
+
+        # Both versions must keep the planner's manual edits
+        run_version(db, 'v1', horizon_months, run_date)
+        seed_manual_edits(db)
+
+        print("\n--- v1 (cursor) ---")
+        df_v1, t_v1 = run_version(db, 'v1', horizon_months, run_date)
+        print(f"Rows: {len(df_v1)} | Time: {t_v1:.2f}s")
+
+        print("\n--- v2 (set-based) ---")
+        df_v2, t_v2 = run_version(db, 'v2', horizon_months, run_date)
+        print(f"Rows: {len(df_v2)} | Time: {t_v2:.2f}s")
+
+        missing, mismatches = compare(df_v1, df_v2)
+        print("\n--- Result ---")
+        if t_v2 > 0:
+            print(f"Speedup: {t_v1 / t_v2:.1f}x")
+        if missing.empty and not mismatches:
+            print("✅ Outputs match.")
+        else:
+            if not missing.empty:
+                print(f"❌ {len(missing)} rows present in only one version:")
+                print(missing.head(10).to_string())
+            for col, bad in mismatches.items():
+                print(f"❌ {col}: {len(bad)} mismatching rows")
+                print(bad.head(10).to_string())
+    finally:
+        cleanup(db)
+        db.close()
+
+
+if __name__ == "__main__":
+    main()
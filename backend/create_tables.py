@@ -4,7 +4,9 @@ from backend.models import (
     DimProducts, DimWarehouses, DimVendors, DimProductGroups, 
     FactRollingInventory, FactInventorySnapshots, FactOpeningStock,
     FactPurchases, FactSales, FactForecasts, FactPurchasePlans,
-    PlanningPolicies, PlanningDistributionProfile
+    PlanningPolicies, PlanningDistributionProfile, PlanningDirtySkus,
+    DimProductGroupClosure, FactForecastState, FactSalesDaily, FactPurchasesDaily, FactOrderPlan,
+    SystemJobs
 )
 
 def create_tables():
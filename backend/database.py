@@ -52,6 +52,15 @@ def init_db():
     # ------------------------------------------
     # ------------------------------------------
 
+    # --- BULK INSERT: opt-in fast_executemany ---
+    # Kept off globally (see unicode notes above); statements executed with
+    # .execution_options(fast_executemany=True) get it per cursor.
+    @event.listens_for(engine, "before_cursor_execute")
+    def enable_fast_executemany(conn, cursor, statement, parameters, context, executemany):
+        if executemany and context is not None and context.execution_options.get("fast_executemany"):
+            if hasattr(cursor, "fast_executemany"):
+                cursor.fast_executemany = True
+
     SessionLocal = sessionmaker(autocommit=False, autoflush=False, bind=engine)
     print(f"DATABASE INITIALIZED: {os.getenv('DB_SERVER')}/{os.getenv('DB_DATABASE')}")
 
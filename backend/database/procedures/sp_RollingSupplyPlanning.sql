@@ -3,7 +3,8 @@ CREATE OR ALTER PROCEDURE sp_RollingSupplyPlanning
     @ProfileID NVARCHAR(50) = 'STD',
     @GroupID NVARCHAR(50) = NULL,
     @WarehouseID NVARCHAR(50) = 'ALL',
-    @RunDate DATE = NULL
+    @RunDate DATE = NULL,
+    @SkuList NVARCHAR(MAX) = NULL -- Comma-separated SKUs to recalculate (NULL = every SKU in scope)
 AS
 BEGIN
     SET NOCOUNT ON;
@@ -38,9 +39,41 @@ BEGIN
     FROM Dim_Products p
     LEFT JOIN Planning_Policies pol ON p.policy_id = pol.policy_id
     WHERE (@GroupID IS NULL OR p.group_id = @GroupID OR p.category = @GroupID)
-      AND (@GroupID <> 'ALL' OR @GroupID IS NULL);
-
-    -- 3. Cleanup Existing Data
+      AND (@GroupID <> 'ALL' OR @GroupID IS NULL)
+      AND (@SkuList IS NULL OR p.sku_id IN (SELECT LTRIM(RTRIM(value)) FROM STRING_SPLIT(@SkuList, ',')));
+
+    -- 3. Keep Manual Edits (planner overrides survive the recalculation)
+    -- Cells are mapped to the weekly bucket containing them: rows written by the vectorized engine
+    -- (1/8/15/22 buckets) are off this grid. Per week: planned supplies add up, the earliest
+    -- manual opening wins.
+    SELECT
+        x.sku_id,
+        x.BucketDate,
+        MAX(CASE WHEN x.OpeningRank = 1 THEN x.ManualOpening END) AS ManualOpening,
+        SUM(x.ManualPlanned) AS ManualPlanned
+    INTO #Manual
+    FROM (
+        SELECT T.sku_id,
+            DATEADD(DAY, DATEDIFF(DAY, @StartDate, T.bucket_date) / 7 * 7, @StartDate) AS BucketDate,
+            CASE WHEN T.is_manual_opening = 1 THEN T.opening_stock END AS ManualOpening,
+            CASE WHEN T.is_manual_planned = 1 THEN T.planned_supply END AS ManualPlanned,
+            ROW_NUMBER() OVER (
+                PARTITION BY T.sku_id, DATEDIFF(DAY, @StartDate, T.bucket_date) / 7
+                ORDER BY CASE WHEN T.is_manual_opening = 1 THEN 0 ELSE 1 END, T.bucket_date
+            ) AS OpeningRank
+        FROM Fact_Rolling_Inventory T
+        INNER JOIN #ProductParams S ON T.sku_id = S.sku_id
+        WHERE T.bucket_date >= @StartDate 
+          AND T.bucket_date <= @EndDate
+          AND ((@WarehouseID IS NULL) OR (T.warehouse_id = @WarehouseID))
+          AND T.profile_id = @ProfileID
+          AND (T.is_manual_opening = 1 OR T.is_manual_planned = 1)
+    ) x
+    GROUP BY x.sku_id, x.BucketDate;
+
+    CREATE CLUSTERED INDEX IX_Manual ON #Manual(sku_id, BucketDate);
+
+    -- 3b. Cleanup Existing Data
     DELETE T
     FROM Fact_Rolling_Inventory T
     INNER JOIN #ProductParams S ON T.sku_id = S.sku_id
@@ -130,21 +163,25 @@ BEGIN
     BEGIN
         -- Insert Step: Snapshot Current State
         -- MinStock = (AvgWeekly / 7) * SafetyDays
-        INSERT INTO Fact_Rolling_Inventory (sku_id, warehouse_id, bucket_date, profile_id, opening_stock, forecast_demand, incoming_supply, planned_supply, closing_stock, net_requirement, min_stock_policy)
+        -- A manual opening replaces the carried stock, a manual planned supply is kept as is
+        INSERT INTO Fact_Rolling_Inventory (sku_id, warehouse_id, bucket_date, profile_id, opening_stock, forecast_demand, incoming_supply, planned_supply, closing_stock, net_requirement, min_stock_policy, is_manual_opening, is_manual_planned)
         SELECT 
             st.sku_id,
             @WarehouseID,
             @WeekCursor,
             @ProfileID,
-            st.CurrentStock,
+            ISNULL(m.ManualOpening, st.CurrentStock),
             ISNULL(fc.Qty, 0),
             ISNULL(inc.Qty, 0),
+            ISNULL(m.ManualPlanned, 0), 
             0, 
             0, 
-            0, 
-            (p.avg_sales / 7.0) * p.safety_days -- Dynamic Min Stock
+            (p.avg_sales / 7.0) * p.safety_days, -- Dynamic Min Stock
+            CASE WHEN m.ManualOpening IS NOT NULL THEN 1 ELSE 0 END,
+            CASE WHEN m.ManualPlanned IS NOT NULL THEN 1 ELSE 0 END
         FROM #RunningState st
         INNER JOIN #ProductParams p ON st.sku_id = p.sku_id
+        LEFT JOIN #Manual m ON m.sku_id = st.sku_id AND m.BucketDate = @WeekCursor
         LEFT JOIN (
             SELECT sku_id, SUM(Qty) as Qty 
             FROM #Forecasts 
@@ -159,6 +196,7 @@ BEGIN
         ) inc ON st.sku_id = inc.sku_id;
 
         -- Update Calculation Step: Use Dynamic MinStock
+        -- (every step joins #ProductParams: only the SKUs in scope are rewritten)
         UPDATE T
         SET 
             net_requirement = CASE 
@@ -167,9 +205,10 @@ BEGIN
                 ELSE 0 
             END
         FROM Fact_Rolling_Inventory T
+        INNER JOIN #ProductParams p ON T.sku_id = p.sku_id
         WHERE T.bucket_date = @WeekCursor AND T.warehouse_id = @WarehouseID AND T.profile_id = @ProfileID;
 
-        -- 2. Planned Supply = Roundup(NetReq / MOQ) * MOQ
+        -- 2. Planned Supply = Roundup(NetReq / MOQ) * MOQ (manual planned supply left as entered)
         UPDATE T
         SET planned_supply = CASE 
                 WHEN net_requirement > 0 
@@ -178,12 +217,14 @@ BEGIN
             END
         FROM Fact_Rolling_Inventory T
         INNER JOIN #ProductParams p ON T.sku_id = p.sku_id
-        WHERE T.bucket_date = @WeekCursor AND T.warehouse_id = @WarehouseID AND T.profile_id = @ProfileID;
+        WHERE T.bucket_date = @WeekCursor AND T.warehouse_id = @WarehouseID AND T.profile_id = @ProfileID
+          AND T.is_manual_planned = 0;
 
         -- 3. Closing Stock
         UPDATE T
         SET closing_stock = ISNULL(opening_stock, 0) + ISNULL(incoming_supply, 0) + ISNULL(planned_supply, 0) - ISNULL(forecast_demand, 0)
         FROM Fact_Rolling_Inventory T
+        INNER JOIN #ProductParams p ON T.sku_id = p.sku_id
         WHERE T.bucket_date = @WeekCursor AND T.warehouse_id = @WarehouseID AND T.profile_id = @ProfileID;
 
         -- 4. Pass Closing to Next Opening
@@ -206,5 +247,6 @@ BEGIN
     DROP TABLE #Incoming;
     DROP TABLE #InitialStock;
     DROP TABLE #RunningState;
+    DROP TABLE #Manual;
 
 END
@@ -0,0 +1,249 @@
+CREATE OR ALTER PROCEDURE sp_RollingSupplyPlanning_v2
+    @HorizonMonths INT = 12,
+    @ProfileID NVARCHAR(50) = 'STD',
+    @GroupID NVARCHAR(50) = NULL,
+    @WarehouseID NVARCHAR(50) = 'ALL',
+    @RunDate DATE = NULL,
+    @SkuList NVARCHAR(MAX) = NULL -- Comma-separated SKUs to recalculate (NULL = every SKU in scope)
+AS
+BEGIN
+    -- Set-based version of sp_RollingSupplyPlanning (no week cursor).
+    -- Same parameters, same output rows. The whole horizon is built in #Grid
+    -- and written to Fact_Rolling_Inventory with a single INSERT.
+    --
+    -- Why this works without a loop:
+    --   S(t)  = InitialStock + running SUM(incoming - forecast)      (stock before any plan)
+    --   P(t)  = cumulative planned supply up to bucket t
+    -- Planned supply only ever tops stock up to MinStock in MOQ multiples, so
+    --   P(t)  = running MAX( CEILING((MinStock - S(k)) / MOQ) * MOQ, 0 )  for k <= t
+    -- and every output column follows from S(t), P(t) and P(t-1).
+    -- Manual edits (is_manual_opening / is_manual_planned) are kept, as in v1:
+    --   a manual planned supply is part of S(t) and its bucket gets no computed top-up;
+    --   a manual opening restarts S(t) and P(t) (one running segment per manual opening).
+    SET NOCOUNT ON;
+
+    -- 1. Configuration & Time Setup (identical to v1)
+    DECLARE @StartDate DATE;
+    IF @RunDate IS NOT NULL
+        SET @StartDate = DATEADD(dd, -(DATEPART(dw, @RunDate)-1), CAST(@RunDate AS DATE));
+    ELSE
+        SET @StartDate = DATEADD(dd, -(DATEPART(dw, GETDATE())-1), CAST(GETDATE() AS DATE));
+
+    DECLARE @EndDate DATE = DATEADD(MONTH, @HorizonMonths, @StartDate);
+
+    -- 2. Filter Scope (Products) & Dictionary
+    CREATE TABLE #ProductParams (
+        sku_id NVARCHAR(50) PRIMARY KEY,
+        avg_sales FLOAT,
+        safety_days INT,
+        moq FLOAT
+    );
+
+    DECLARE @DefaultSafetyDays INT = 15;
+    SELECT TOP 1 @DefaultSafetyDays = safety_stock_days FROM Planning_Policies WHERE is_default = 1;
+
+    INSERT INTO #ProductParams (sku_id, avg_sales, safety_days, moq)
+    SELECT
+        p.sku_id,
+        ISNULL(p.avg_weekly_sales, 0),
+        ISNULL(pol.safety_stock_days, @DefaultSafetyDays),
+        ISNULL(NULLIF(p.moq, 0), 1)
+    FROM Dim_Products p
+    LEFT JOIN Planning_Policies pol ON p.policy_id = pol.policy_id
+    WHERE (@GroupID IS NULL OR p.group_id = @GroupID OR p.category = @GroupID)
+      AND (@GroupID <> 'ALL' OR @GroupID IS NULL)
+      AND (@SkuList IS NULL OR p.sku_id IN (SELECT LTRIM(RTRIM(value)) FROM STRING_SPLIT(@SkuList, ',')));
+
+    -- 3. Keep Manual Edits (same as v1: mapped to the containing weekly bucket)
+    SELECT
+        x.sku_id,
+        x.BucketDate,
+        MAX(CASE WHEN x.OpeningRank = 1 THEN x.ManualOpening END) AS ManualOpening,
+        SUM(x.ManualPlanned) AS ManualPlanned
+    INTO #Manual
+    FROM (
+        SELECT T.sku_id,
+            DATEADD(DAY, DATEDIFF(DAY, @StartDate, T.bucket_date) / 7 * 7, @StartDate) AS BucketDate,
+            CASE WHEN T.is_manual_opening = 1 THEN T.opening_stock END AS ManualOpening,
+            CASE WHEN T.is_manual_planned = 1 THEN T.planned_supply END AS ManualPlanned,
+            ROW_NUMBER() OVER (
+                PARTITION BY T.sku_id, DATEDIFF(DAY, @StartDate, T.bucket_date) / 7
+                ORDER BY CASE WHEN T.is_manual_opening = 1 THEN 0 ELSE 1 END, T.bucket_date
+            ) AS OpeningRank
+        FROM Fact_Rolling_Inventory T
+        INNER JOIN #ProductParams S ON T.sku_id = S.sku_id
+        WHERE T.bucket_date >= @StartDate
+          AND T.bucket_date <= @EndDate
+          AND ((@WarehouseID IS NULL) OR (T.warehouse_id = @WarehouseID))
+          AND T.profile_id = @ProfileID
+          AND (T.is_manual_opening = 1 OR T.is_manual_planned = 1)
+    ) x
+    GROUP BY x.sku_id, x.BucketDate;
+
+    -- 3b. Cleanup Existing Data
+    DELETE T
+    FROM Fact_Rolling_Inventory T
+    INNER JOIN #ProductParams S ON T.sku_id = S.sku_id
+    WHERE T.bucket_date >= @StartDate
+      AND T.bucket_date <= @EndDate
+      AND ((@WarehouseID IS NULL) OR (T.warehouse_id = @WarehouseID))
+      AND T.profile_id = @ProfileID;
+
+    -- 4. Buckets (weekly, from a tally instead of a WHILE loop)
+    DECLARE @BucketCount INT = DATEDIFF(DAY, @StartDate, @EndDate) / 7 + 1;
+
+    SELECT TOP (@BucketCount)
+        CAST(ROW_NUMBER() OVER (ORDER BY (SELECT NULL)) AS INT) AS BucketIdx
+    INTO #Tally
+    FROM sys.all_objects a CROSS JOIN sys.all_objects b;
+
+    SELECT BucketIdx, CAST(DATEADD(WEEK, BucketIdx - 1, @StartDate) AS DATE) AS BucketDate
+    INTO #Buckets
+    FROM #Tally;
+
+    CREATE UNIQUE CLUSTERED INDEX IX_Buckets ON #Buckets(BucketDate);
+
+    -- #Forecasts (same split as v1: monthly forecast -> 4 weeks from the 1st)
+    SELECT
+        f.sku_id,
+        CAST(DATEADD(WEEK, W.WeekIdx - 1, f.forecast_date) AS DATE) as FDate,
+        SUM(f.quantity_predicted *
+            CASE W.WeekIdx
+                WHEN 1 THEN COALESCE(prof.week1, 0.25)
+                WHEN 2 THEN COALESCE(prof.week2, 0.25)
+                WHEN 3 THEN COALESCE(prof.week3, 0.25)
+                WHEN 4 THEN COALESCE(prof.week4, 0.25)
+                ELSE 0
+            END
+        ) as Qty
+    INTO #Forecasts
+    FROM Fact_Forecasts f
+    INNER JOIN #ProductParams s ON f.sku_id = s.sku_id
+    LEFT JOIN Dim_Products p ON f.sku_id = p.sku_id
+    LEFT JOIN Planning_Distribution_Profiles prof ON prof.profile_id = COALESCE(p.distribution_profile_id, @ProfileID)
+    CROSS JOIN (VALUES (1), (2), (3), (4)) AS W(WeekIdx)
+    WHERE f.forecast_date BETWEEN DATEADD(MONTH, -1, @StartDate) AND @EndDate
+      AND DAY(f.forecast_date) = 1
+    GROUP BY f.sku_id, CAST(DATEADD(WEEK, W.WeekIdx - 1, f.forecast_date) AS DATE);
+
+    -- #Incoming
+    SELECT p.sku_id, CAST(p.order_date AS DATE) as PDate, SUM(p.quantity) as Qty
+    INTO #Incoming
+    FROM Fact_Purchases p
+    INNER JOIN #ProductParams s ON p.sku_id = s.sku_id
+    WHERE p.order_date BETWEEN @StartDate AND @EndDate
+    GROUP BY p.sku_id, CAST(p.order_date AS DATE);
+
+    -- #InitialStock
+    SELECT os.sku_id, SUM(os.quantity) as Qty
+    INTO #InitialStock
+    FROM Fact_Opening_Stock os
+    INNER JOIN #ProductParams s ON os.sku_id = s.sku_id
+    WHERE os.stock_date = (SELECT MAX(stock_date) FROM Fact_Opening_Stock WHERE stock_date <= @StartDate)
+      AND (@WarehouseID IS NULL OR os.warehouse_id = @WarehouseID OR @WarehouseID = 'ALL')
+    GROUP BY os.sku_id;
+
+    -- 5. Bucket the daily inputs ([BucketDate, BucketDate + 7) like v1)
+    SELECT f.sku_id, b.BucketIdx, SUM(f.Qty) AS Qty
+    INTO #BucketForecast
+    FROM #Forecasts f
+    INNER JOIN #Buckets b ON f.FDate >= b.BucketDate AND f.FDate < DATEADD(DAY, 7, b.BucketDate)
+    GROUP BY f.sku_id, b.BucketIdx;
+
+    CREATE CLUSTERED INDEX IX_BucketForecast ON #BucketForecast(sku_id, BucketIdx);
+
+    SELECT i.sku_id, b.BucketIdx, SUM(i.Qty) AS Qty
+    INTO #BucketIncoming
+    FROM #Incoming i
+    INNER JOIN #Buckets b ON i.PDate >= b.BucketDate AND i.PDate < DATEADD(DAY, 7, b.BucketDate)
+    GROUP BY i.sku_id, b.BucketIdx;
+
+    CREATE CLUSTERED INDEX IX_BucketIncoming ON #BucketIncoming(sku_id, BucketIdx);
+
+    -- 6. Grid: one row per SKU x Bucket with the pre-plan running stock S(t)
+    --    Segment = manual openings so far; a segment starts from its manual opening
+    --    (segment 0 from the initial stock)
+    SELECT
+        p.sku_id,
+        b.BucketIdx,
+        b.BucketDate,
+        ISNULL(fc.Qty, 0) AS Forecast,
+        ISNULL(inc.Qty, 0) AS Incoming,
+        (p.avg_sales / 7.0) * p.safety_days AS MinStock,
+        p.moq AS Moq,
+        ISNULL(init.Qty, 0) AS InitialStock,
+        m.ManualOpening,
+        m.ManualPlanned,
+        COUNT(m.ManualOpening) OVER (PARTITION BY p.sku_id ORDER BY b.BucketIdx ROWS UNBOUNDED PRECEDING) AS Segment
+    INTO #GridInputs
+    FROM #ProductParams p
+    CROSS JOIN #Buckets b
+    LEFT JOIN #InitialStock init ON init.sku_id = p.sku_id
+    LEFT JOIN #BucketForecast fc ON fc.sku_id = p.sku_id AND fc.BucketIdx = b.BucketIdx
+    LEFT JOIN #BucketIncoming inc ON inc.sku_id = p.sku_id AND inc.BucketIdx = b.BucketIdx
+    LEFT JOIN #Manual m ON m.sku_id = p.sku_id AND m.BucketDate = b.BucketDate;
+
+    SELECT
+        g.*,
+        ISNULL(g.ManualPlanned, 0) AS ManualSupply,
+        ISNULL(MAX(g.ManualOpening) OVER (PARTITION BY g.sku_id, g.Segment), g.InitialStock)
+            + SUM(g.Incoming - g.Forecast + ISNULL(g.ManualPlanned, 0))
+              OVER (PARTITION BY g.sku_id, g.Segment ORDER BY g.BucketIdx ROWS UNBOUNDED PRECEDING) AS RunningStock
+    INTO #Grid
+    FROM #GridInputs g;
+
+    -- 7. Cumulative planned supply P(t) (running max of MOQ-rounded deficits, per segment)
+    ;WITH Req AS (
+        SELECT g.*,
+            CASE WHEN g.ManualPlanned IS NOT NULL THEN 0
+                 WHEN g.MinStock - g.RunningStock > 0
+                 THEN CEILING((g.MinStock - g.RunningStock) / g.Moq) * g.Moq
+                 ELSE 0
+            END AS RequiredTopUp
+        FROM #Grid g
+    ),
+    Cum AS (
+        SELECT r.*,
+            MAX(r.RequiredTopUp) OVER (PARTITION BY r.sku_id, r.Segment ORDER BY r.BucketIdx ROWS UNBOUNDED PRECEDING) AS CumPlanned
+        FROM Req r
+    ),
+    Prev AS (
+        SELECT c.*,
+            LAG(c.CumPlanned, 1, 0) OVER (PARTITION BY c.sku_id, c.Segment ORDER BY c.BucketIdx) AS PrevCumPlanned
+        FROM Cum c
+    )
+    -- 8. Single bulk write
+    INSERT INTO Fact_Rolling_Inventory (sku_id, warehouse_id, bucket_date, profile_id, opening_stock, forecast_demand, incoming_supply, planned_supply, closing_stock, net_requirement, min_stock_policy, is_manual_opening, is_manual_planned)
+    SELECT
+        x.sku_id,
+        @WarehouseID,
+        x.BucketDate,
+        @ProfileID,
+        x.RunningStock - x.Incoming + x.Forecast - x.ManualSupply + x.PrevCumPlanned,
+        x.Forecast,
+        x.Incoming,
+        x.ManualSupply + x.CumPlanned - x.PrevCumPlanned,
+        x.RunningStock + x.CumPlanned,
+        CASE WHEN x.MinStock - (x.RunningStock - x.ManualSupply + x.PrevCumPlanned) > 0
+             THEN x.MinStock - (x.RunningStock - x.ManualSupply + x.PrevCumPlanned)
+             ELSE 0
+        END,
+        x.MinStock,
+        CASE WHEN x.ManualOpening IS NOT NULL THEN 1 ELSE 0 END,
+        CASE WHEN x.ManualPlanned IS NOT NULL THEN 1 ELSE 0 END
+    FROM Prev x;
+
+    -- Cleanup
+    DROP TABLE #Tally;
+    DROP TABLE #Buckets;
+    DROP TABLE #ProductParams;
+    DROP TABLE #Forecasts;
+    DROP TABLE #Incoming;
+    DROP TABLE #InitialStock;
+    DROP TABLE #BucketForecast;
+    DROP TABLE #BucketIncoming;
+    DROP TABLE #Manual;
+    DROP TABLE #GridInputs;
+    DROP TABLE #Grid;
+
+END
@@ -8,7 +8,7 @@ app = FastAPI(
 )
 
 
-from backend.routers import dashboard_analytics, data_management, planning, system, vendors, planning_rolling, debug_router, planning_settings, planning_order
+from backend.routers import dashboard_analytics, data_management, planning, system, vendors, planning_rolling, debug_router, planning_settings, planning_order, jobs
 
 app.include_router(dashboard_analytics.router)
 app.include_router(data_management.router)
@@ -18,8 +18,20 @@ app.include_router(vendors.router)
 app.include_router(planning_rolling.router)
 app.include_router(planning_settings.router)
 app.include_router(planning_order.router)
+app.include_router(jobs.router)
 app.include_router(debug_router.router)
 
+# Background job runner (sync / forecast / calculation jobs, services/job_queue.py)
+from backend.services.job_queue import job_runner
+
+@app.on_event("startup")
+def start_job_runner():
+    job_runner.start()
+
+@app.on_event("shutdown")
+def stop_job_runner():
+    job_runner.stop()
+
 # CORS Configuration (Allow Frontend to connect)
 origins = [
     "http://localhost:3000",
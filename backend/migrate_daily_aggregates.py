@@ -0,0 +1,22 @@
+from backend.database import SessionLocal, engine
+from backend.models import FactSalesDaily, FactPurchasesDaily
+from backend.services.daily_aggregates import DailyAggregates
+
+def migrate_daily_aggregates():
+    try:
+        print("Creating Fact_Sales_Daily / Fact_Purchases_Daily if missing...")
+        FactSalesDaily.__table__.create(bind=engine, checkfirst=True)
+        FactPurchasesDaily.__table__.create(bind=engine, checkfirst=True)
+
+        db = SessionLocal()
+        try:
+            DailyAggregates(db).rebuild()
+            db.commit()
+            print("Daily aggregate tables built successfully.")
+        finally:
+            db.close()
+    except Exception as e:
+        print(f"Migration Failed: {e}")
+
+if __name__ == "__main__":
+    migrate_daily_aggregates()
@@ -0,0 +1,20 @@
+from backend.database import engine
+from sqlalchemy import text
+
+def migrate_dirty_skus_version():
+    with engine.connect() as conn:
+        try:
+            # Check if column exists
+            result = conn.execute(text("SELECT COL_LENGTH('Planning_Dirty_SKUs', 'version')")).scalar()
+            if result is None:
+                print("Adding 'version' column to Planning_Dirty_SKUs...")
+                conn.execute(text("ALTER TABLE Planning_Dirty_SKUs ADD version INT NOT NULL DEFAULT 1"))
+                conn.commit()
+                print("Migration Successful.")
+            else:
+                print("Column 'version' already exists.")
+        except Exception as e:
+            print(f"Migration Failed: {e}")
+
+if __name__ == "__main__":
+    migrate_dirty_skus_version()
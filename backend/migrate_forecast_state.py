@@ -0,0 +1,21 @@
+from backend.database import SessionLocal, engine
+from backend.models import FactForecastState
+from backend.services.forecast_state import ForecastState
+
+def migrate_forecast_state():
+    try:
+        print("Creating Fact_Forecast_State if missing...")
+        FactForecastState.__table__.create(bind=engine, checkfirst=True)
+
+        db = SessionLocal()
+        try:
+            ForecastState(db).refresh(full=True)
+            db.commit()
+            print("Forecast state built successfully.")
+        finally:
+            db.close()
+    except Exception as e:
+        print(f"Migration Failed: {e}")
+
+if __name__ == "__main__":
+    migrate_forecast_state()
@@ -0,0 +1,21 @@
+from backend.database import SessionLocal, engine
+from backend.models import DimProductGroupClosure
+from backend.services.group_closure import GroupClosure
+
+def migrate_group_closure():
+    try:
+        print("Creating Dim_Product_Group_Closure if missing...")
+        DimProductGroupClosure.__table__.create(bind=engine, checkfirst=True)
+
+        db = SessionLocal()
+        try:
+            GroupClosure(db).rebuild()
+            db.commit()
+            print("Closure table built successfully.")
+        finally:
+            db.close()
+    except Exception as e:
+        print(f"Migration Failed: {e}")
+
+if __name__ == "__main__":
+    migrate_group_closure()
@@ -0,0 +1,22 @@
+from backend.database import engine
+from backend.models import SystemJobs
+from sqlalchemy import text
+
+def migrate_jobs():
+    try:
+        print("Creating System_Jobs if missing...")
+        SystemJobs.__table__.create(bind=engine, checkfirst=True)
+
+        with engine.connect() as conn:
+            # Added after the first version of the table
+            result = conn.execute(text("SELECT COL_LENGTH('System_Jobs', 'not_before')")).scalar()
+            if result is None:
+                print("Adding 'not_before' column to System_Jobs...")
+                conn.execute(text("ALTER TABLE System_Jobs ADD not_before DATETIME NULL"))
+                conn.commit()
+        print("Migration Successful.")
+    except Exception as e:
+        print(f"Migration Failed: {e}")
+
+if __name__ == "__main__":
+    migrate_jobs()
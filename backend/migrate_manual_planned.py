@@ -0,0 +1,20 @@
+from backend.database import engine
+from sqlalchemy import text
+
+def migrate_manual_planned():
+    with engine.connect() as conn:
+        try:
+            # Check if column exists
+            result = conn.execute(text("SELECT COL_LENGTH('Fact_Rolling_Inventory', 'is_manual_planned')")).scalar()
+            if result is None:
+                print("Adding 'is_manual_planned' column to Fact_Rolling_Inventory...")
+                conn.execute(text("ALTER TABLE Fact_Rolling_Inventory ADD is_manual_planned BIT DEFAULT 0 WITH VALUES"))
+                conn.commit()
+                print("Migration Successful.")
+            else:
+                print("Column 'is_manual_planned' already exists.")
+        except Exception as e:
+            print(f"Migration Failed: {e}")
+
+if __name__ == "__main__":
+    migrate_manual_planned()
@@ -0,0 +1,21 @@
+from backend.database import SessionLocal, engine
+from backend.models import FactOrderPlan
+from backend.services.order_plan import OrderPlanSnapshot
+
+def migrate_order_plan():
+    try:
+        print("Creating Fact_Order_Plan if missing...")
+        FactOrderPlan.__table__.create(bind=engine, checkfirst=True)
+
+        db = SessionLocal()
+        try:
+            count = OrderPlanSnapshot(db).refresh()
+            db.commit()
+            print(f"Order plan built successfully ({count} SKUs).")
+        finally:
+            db.close()
+    except Exception as e:
+        print(f"Migration Failed: {e}")
+
+if __name__ == "__main__":
+    migrate_order_plan()
@@ -0,0 +1,20 @@
+from backend.database import SessionLocal, engine
+from sqlalchemy import text
+
+def migrate_plan_profile():
+    with engine.connect() as conn:
+        try:
+            # Check if column exists
+            result = conn.execute(text("SELECT COL_LENGTH('Fact_Purchase_Plans', 'profile_id')")).scalar()
+            if result is None:
+                print("Adding 'profile_id' column to Fact_Purchase_Plans...")
+                conn.execute(text("ALTER TABLE Fact_Purchase_Plans ADD profile_id NVARCHAR(50) NULL"))
+                conn.commit()
+                print("Migration Successful.")
+            else:
+                print("Column 'profile_id' already exists.")
+        except Exception as e:
+            print(f"Migration Failed: {e}")
+
+if __name__ == "__main__":
+    migrate_plan_profile()
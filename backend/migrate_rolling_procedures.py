@@ -0,0 +1,12 @@
+from backend.compare_rolling_procedures import install_procedures
+
+def migrate_rolling_procedures():
+    # sp_RollingSupplyPlanning(_v2): @SkuList (SKU-scoped incremental runs), manual edits kept
+    try:
+        install_procedures()
+        print("Migration Successful.")
+    except Exception as e:
+        print(f"Migration Failed: {e}")
+
+if __name__ == "__main__":
+    migrate_rolling_procedures()
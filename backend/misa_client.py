@@ -2,6 +2,11 @@ import requests
 import json
 from datetime import datetime
 
+try:
+    from backend import misa_http
+except ImportError:
+    import misa_http
+
 class MisaClient:
     def __init__(self, app_id, access_key, base_url="https://crmconnect.misa.vn"):
         """
@@ -14,6 +19,7 @@ class MisaClient:
         self.access_key = access_key
         self.base_url = base_url.rstrip("/")
         self.token = None
+        self.token_expiry = None
     
     def get_token(self):
         """
@@ -29,12 +35,13 @@ class MisaClient:
              "client_secret": self.access_key
         }
         try:
-            response = requests.post(url, json=payload, headers={"Content-Type": "application/json"})
+            response = misa_http.request(self.base_url, "POST", url, json=payload, headers={"Content-Type": "application/json"}, timeout=30)
             response.raise_for_status()
             data = response.json()
             if data.get("success"):
                 # The token is in data['data'] based on swagger example
                 self.token = data.get("data")
+                self.token_expiry = misa_http.token_expiry(self.token)
                 return self.token
             else:
                 print(f"Token Generation Failed: {data}")
@@ -44,7 +51,7 @@ class MisaClient:
             return None
 
     def _get_headers(self):
-        if not self.token:
+        if not misa_http.token_is_fresh(self.token, self.token_expiry):
             self.get_token()
         
         return {
@@ -63,7 +70,8 @@ class MisaClient:
         headers = self._get_headers()
         
         try:
-            response = requests.request(
+            response = misa_http.request(
+                self.base_url,
                 method=method,
                 url=url,
                 headers=headers,
@@ -1,6 +1,8 @@
 import requests
 import json
+import threading
 from datetime import datetime
+from backend import misa_http
 
 class MisaCrmV2Client:
     def __init__(self, client_id, client_secret, company_code, base_url="https://amisapp.misa.vn/crm/gc/api/public/api/v2"):
@@ -9,6 +11,8 @@ class MisaCrmV2Client:
         self.company_code = company_code
         self.base_url = base_url.rstrip("/")
         self.token = None
+        self.token_expiry = None
+        self._token_lock = threading.Lock()
 
     def authenticate(self):
         """
@@ -22,11 +26,12 @@ class MisaCrmV2Client:
         }
         
         try:
-            resp = requests.post(url, json=payload, timeout=30)
+            resp = misa_http.request(self.base_url, "POST", url, json=payload, timeout=30)
             if resp.status_code == 200:
                 data = resp.json()
                 if data.get("success"):
                     self.token = data.get("data")
+                    self.token_expiry = misa_http.token_expiry(self.token)
                     return self.token
                 else:
                     raise Exception(f"Auth Failed: {data.get('code')} - {data.get('data')}")
@@ -35,13 +40,57 @@ class MisaCrmV2Client:
         except Exception as e:
             raise Exception(f"Connection Error: {e}")
 
+    def ensure_token(self):
+        """Re-authenticate shortly before the token expires (once, even with concurrent callers)."""
+        if misa_http.token_is_fresh(self.token, self.token_expiry):
+            return self.token
+        with self._token_lock:
+            if not misa_http.token_is_fresh(self.token, self.token_expiry):
+                self.authenticate()
+        return self.token
+
+    def _get(self, url, headers, params):
+        """GET over the pooled session; a 401 forces one re-authentication + retry."""
+        token = headers["authorization"][len("Bearer "):]
+        resp = misa_http.request(self.base_url, "GET", url, headers=headers, params=params, timeout=30)
+        if resp.status_code == 401:
+            with self._token_lock:
+                if self.token == token:
+                    self.token = None
+                    self.token_expiry = None
+            headers["authorization"] = f"Bearer {self.ensure_token()}"
+            resp = misa_http.request(self.base_url, "GET", url, headers=headers, params=params, timeout=30)
+        return resp
+
+    def get_stocks(self):
+        """
+        Fetch Stocks (Warehouses).
+        Endpoint: /Stocks
+        """
+        self.ensure_token()
+        url = f"{self.base_url}/Stocks"
+        headers = {
+            "authorization": f"Bearer {self.token}",
+            "clientid": self.client_id,
+            "companycode": self.company_code
+        }
+        try:
+            resp = self._get(url, headers, None)
+            if resp.status_code == 200:
+                data = resp.json()
+                if data.get("success") or str(data.get("code")) == "0":
+                    return data.get("data") or []
+            print(f"DEBUG API ERROR: {resp.status_code} {resp.text[:200]}")
+            return []
+        except Exception as e:
+            raise Exception(f"Stock Fetch Error: {e}")
+
     def get_product_ledger(self, stock_id=None, page=1, page_size=100):
         """
         Fetch Inventory (Product Ledger).
         Endpoint: /Stocks/product_ledger
         """
-        if not self.token:
-            self.authenticate()
+        self.ensure_token()
 
         url = f"{self.base_url}/Stocks/product_ledger"
         headers = {
@@ -65,7 +114,7 @@ class MisaCrmV2Client:
         headers["companycode"] = self.company_code
 
         try:
-            resp = requests.get(url, headers=headers, params=params, timeout=30)
+            resp = self._get(url, headers, params)
             if resp.status_code == 200:
                 data = resp.json()
                 # API quirks: success might be missing/false but code=0 and data present implies success
@@ -90,8 +139,7 @@ class MisaCrmV2Client:
         Fetch Inventory Item Categories (Product Groups).
         Endpoint: /InventoryItemCategories
         """
-        if not self.token:
-            self.authenticate()
+        self.ensure_token()
 
         url = f"{self.base_url}/InventoryItemCategories"
         headers = {
@@ -106,7 +154,7 @@ class MisaCrmV2Client:
         }
         
         try:
-            resp = requests.get(url, headers=headers, params=params, timeout=30)
+            resp = self._get(url, headers, params)
             if resp.status_code == 200:
                 data = resp.json()
                 items_data = data.get("data")
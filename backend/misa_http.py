@@ -0,0 +1,100 @@
+"""
+Shared HTTP transport for the MISA clients (ACT, CRM v2, CRM Connect).
+- One keep-alive requests.Session per base URL (connection pool reused across pages/threads)
+- gzip/deflate negotiated explicitly (requests decodes transparently)
+- Per base URL counters: requests, errors, bytes on the wire vs decoded
+- Token expiry helpers so clients refresh before the token dies instead of after a 401
+"""
+
+import json
+import time
+import base64
+import threading
+from datetime import datetime, timedelta
+
+import requests
+from requests.adapters import HTTPAdapter
+
+POOL_SIZE = 10 # >= sync prefetch window (see SyncService.prefetch_pages)
+DEFAULT_TOKEN_TTL = timedelta(minutes=50) # When MISA does not tell us the expiry
+TOKEN_REFRESH_MARGIN = timedelta(minutes=2)
+
+_sessions = {}
+_stats = {}
+_lock = threading.Lock()
+
+def get_session(base_url) -> requests.Session:
+    key = base_url.rstrip("/")
+    with _lock:
+        session = _sessions.get(key)
+        if session is None:
+            session = requests.Session()
+            adapter = HTTPAdapter(pool_connections=1, pool_maxsize=POOL_SIZE)
+            session.mount("https://", adapter)
+            session.mount("http://", adapter)
+            session.headers.update({"Accept-Encoding": "gzip, deflate", "Connection": "keep-alive"})
+            _sessions[key] = session
+            _stats[key] = {"requests": 0, "errors": 0, "bytes_sent": 0, "bytes_received": 0, "bytes_decoded": 0, "elapsed_seconds": 0.0}
+        return session
+
+def request(base_url, method, url, **kwargs) -> requests.Response:
+    """requests.request() over the pooled session of base_url, with counters."""
+    key = base_url.rstrip("/")
+    session = get_session(key)
+    t0 = time.perf_counter()
+    try:
+        resp = session.request(method, url, **kwargs)
+    except requests.exceptions.RequestException:
+        _record(key, errors=1, elapsed_seconds=time.perf_counter() - t0)
+        raise
+
+    body = resp.request.body or b""
+    decoded = len(resp.content)
+    try:
+        wire = resp.raw.tell() or decoded # urllib3: bytes pulled over the wire (compressed)
+    except Exception:
+        wire = decoded
+    _record(
+        key,
+        errors=0 if resp.ok else 1,
+        bytes_sent=len(body.encode("utf-8") if isinstance(body, str) else body),
+        bytes_received=wire,
+        bytes_decoded=decoded,
+        elapsed_seconds=time.perf_counter() - t0
+    )
+    return resp
+
+def _record(key, **deltas):
+    with _lock:
+        stats = _stats[key]
+        stats["requests"] += 1
+        for name, value in deltas.items():
+            stats[name] += value
+
+def get_stats() -> dict:
+    with _lock:
+        return {key: dict(stats) for key, stats in _stats.items()}
+
+# --- TOKEN HELPERS ---
+
+def _jwt_expiry(token):
+    """'exp' claim of a JWT (no signature check, only used to schedule refresh)."""
+    try:
+        payload = token.split(".")[1]
+        payload += "=" * (-len(payload) % 4)
+        exp = json.loads(base64.urlsafe_b64decode(payload)).get("exp")
+        return datetime.fromtimestamp(exp) if exp else None
+    except Exception:
+        return None
+
+def token_expiry(token, expires_in=None) -> datetime:
+    """Expiry from the auth response (expires_in seconds), the JWT itself, or the default TTL."""
+    if expires_in:
+        try:
+            return datetime.now() + timedelta(seconds=int(expires_in))
+        except (TypeError, ValueError):
+            pass
+    return _jwt_expiry(token) or datetime.now() + DEFAULT_TOKEN_TTL
+
+def token_is_fresh(token, expiry) -> bool:
+    return bool(token) and (expiry is None or datetime.now() < expiry - TOKEN_REFRESH_MARGIN)
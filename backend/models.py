@@ -1,4 +1,4 @@
-from sqlalchemy import Column, String, Integer, Float, DateTime, Boolean, Date, Text, DECIMAL, CHAR, ForeignKey, UniqueConstraint
+from sqlalchemy import Column, String, Integer, Float, DateTime, Boolean, Date, Text, DECIMAL, CHAR, ForeignKey, UniqueConstraint, Index, text
 from sqlalchemy.dialects.mssql import NVARCHAR
 from sqlalchemy.sql import func
 from datetime import datetime
@@ -120,6 +120,30 @@ class FactPurchases(Base):
     extra_data = Column(NVARCHAR, nullable=True) # JSON store
     created_at = Column(DateTime, default=datetime.utcnow)
 
+class FactSalesDaily(Base):
+    """
+    Fact_Sales summed per (sku, warehouse, day). Kept in step with Fact_Sales by the import
+    processors in the same transaction (services.daily_aggregates); read by forecasting and
+    the rolling prefetch instead of scanning every ledger line.
+    """
+    __tablename__ = "Fact_Sales_Daily"
+    sku_id = Column(NVARCHAR(50), primary_key=True)
+    warehouse_id = Column(NVARCHAR(255), primary_key=True) # '' when the line had no warehouse
+    day = Column(Date, primary_key=True)
+    quantity = Column(Float, nullable=False, default=0)
+    amount = Column(DECIMAL(18, 2))
+    line_count = Column(Integer, nullable=False, default=0)
+
+class FactPurchasesDaily(Base):
+    """Fact_Purchases summed per (sku, warehouse, day, purchase_type); see FactSalesDaily."""
+    __tablename__ = "Fact_Purchases_Daily"
+    sku_id = Column(NVARCHAR(50), primary_key=True)
+    warehouse_id = Column(NVARCHAR(255), primary_key=True)
+    day = Column(Date, primary_key=True)
+    purchase_type = Column(NVARCHAR(20), primary_key=True) # '' when missing
+    quantity = Column(Float, nullable=False, default=0)
+    line_count = Column(Integer, nullable=False, default=0)
+
 class FactInventorySnapshots(Base):
     __tablename__ = "Fact_Inventory_Snapshots"
     snapshot_date = Column(Date, primary_key=True)
@@ -154,6 +178,7 @@ class FactPurchasePlans(Base):
     plan_date = Column(Date, nullable=False)
     sku_id = Column(NVARCHAR(50), nullable=False)
     warehouse_id = Column(NVARCHAR(50), default='ALL')
+    profile_id = Column(NVARCHAR(50), nullable=True) # Rolling profile the plan was generated from
     vendor_id = Column(NVARCHAR(50))
     forecast_demand = Column(Float, default=0)
     safety_stock_required = Column(Float, default=0)
@@ -201,6 +226,44 @@ class FactForecasts(Base):
     confidence_upper = Column(Float)
     model_used = Column(NVARCHAR(50))
 
+class FactForecastState(Base):
+    """
+    Running SMA/EMA state per SKU so forecasts refresh in O(new days) (services.forecast_state).
+    Holds every sale day up to the global watermark (config FORECAST_STATE_WATERMARK);
+    imports that change a day at or before it set needs_rebuild (recomputed from full history).
+    """
+    __tablename__ = "Fact_Forecast_State"
+    sku_id = Column(NVARCHAR(50), primary_key=True)
+    first_date = Column(Date) # First sale day (start of the series)
+    last_date = Column(Date) # Last sale day folded into the state
+    ema_value = Column(Float) # EMA on last_date
+    window_sum = Column(Float) # Sum of window_values
+    window_values = Column(NVARCHAR) # JSON list: daily qty of the last SMA window (<= 30 days), oldest first
+    needs_rebuild = Column(Boolean, default=False)
+    updated_at = Column(DateTime, default=func.now())
+
+class FactOrderPlan(Base):
+    """
+    Materialized ORDER sheet, one row per product (services.order_plan).
+    Refreshed after forecast runs, CRM inventory syncs and seasonal factor edits;
+    GET /api/planning/order-plan pages, filters and sorts it in SQL.
+    """
+    __tablename__ = "Fact_Order_Plan"
+    sku_id = Column(NVARCHAR(50), primary_key=True)
+    product_name = Column(NVARCHAR(255))
+    group_id = Column(NVARCHAR(50), index=True)
+    current_stock = Column(Float, default=0) # Sum over warehouses of the SKU's latest snapshot
+    stock_on_order = Column(Float, default=0)
+    safety_stock = Column(Float, default=0) # Target stock (3 months of average demand)
+    lead_time_days = Column(Integer)
+    avg_sales = Column(Float, default=0)
+    forecast_month_1 = Column(Float, default=0)
+    forecast_month_2 = Column(Float, default=0)
+    forecast_month_3 = Column(Float, default=0)
+    suggested_order = Column(Float, default=0, index=True)
+    notes = Column(NVARCHAR(255))
+    refreshed_at = Column(DateTime, default=func.now())
+
 class SystemSyncLogs(Base):
     __tablename__ = "System_Sync_Logs"
     log_id = Column(Integer, primary_key=True, index=True)
@@ -212,6 +275,39 @@ class SystemSyncLogs(Base):
     start_time = Column(DateTime, default=func.now())
     end_time = Column(DateTime)
 
+class SystemJobs(Base):
+    """
+    Durable background job queue (services.job_queue): sync, forecast and calculation runs.
+    Any API process may enqueue; runners in every process claim QUEUED rows with a conditional UPDATE.
+    At most one QUEUED/RUNNING job per dedup_key (single-flight, enforced by a filtered unique index).
+    """
+    __tablename__ = "System_Jobs"
+    __table_args__ = (
+        Index(
+            'uq_system_jobs_active', 'dedup_key', unique=True,
+            mssql_where=text("status IN ('QUEUED', 'RUNNING')"),
+            sqlite_where=text("status IN ('QUEUED', 'RUNNING')")
+        ),
+        Index('ix_system_jobs_status_type', 'status', 'job_type'),
+    )
+    job_id = Column(Integer, primary_key=True)
+    job_type = Column(NVARCHAR(50), nullable=False)
+    dedup_key = Column(NVARCHAR(200), nullable=False)
+    params = Column(Text) # JSON
+    status = Column(NVARCHAR(20), nullable=False, default='QUEUED') # QUEUED, RUNNING, SUCCESS, ERROR, CANCELLED
+    cancel_requested = Column(Boolean, default=False)
+    stage = Column(NVARCHAR(50))
+    progress_done = Column(Integer, default=0)
+    progress_total = Column(Integer)
+    result = Column(Text) # JSON
+    error_message = Column(Text)
+    worker = Column(NVARCHAR(100)) # host:pid of the claiming process
+    created_at = Column(DateTime, default=func.now())
+    not_before = Column(DateTime) # Not claimed before this time (debounced jobs)
+    started_at = Column(DateTime)
+    heartbeat_at = Column(DateTime)
+    finished_at = Column(DateTime)
+
 class SystemConfig(Base):
     __tablename__ = "System_Configs"
     config_key = Column(NVARCHAR(100), primary_key=True)
@@ -241,6 +337,7 @@ class FactRollingInventory(Base):
     net_requirement = Column(Float, default=0)
     status = Column(NVARCHAR(20), default='OK') # OK, LOW, CRITICAL
     is_manual_opening = Column(Boolean, default=False) # Flag to respect user override
+    is_manual_planned = Column(Boolean, default=False) # planned_supply is a user edit (kept by recalculation)
     updated_at = Column(DateTime, default=func.now())
 
 class PlanningDistributionProfile(Base):
@@ -262,3 +359,28 @@ class SeasonalFactors(Base):
     supplier_delay_days = Column(Integer, default=0)
     shipping_delay_days = Column(Integer, default=0)
     description = Column(NVARCHAR(255))
+
+class PlanningDirtySkus(Base):
+    """
+    Change tracking for the rolling plan.
+    Import processors mark the (sku, warehouse) they touched with the earliest changed date;
+    the auto-calc recomputes only those SKUs (SKU-scoped procedure run from the usual lookback), then clears the marks.
+    """
+    __tablename__ = "Planning_Dirty_SKUs"
+    sku_id = Column(NVARCHAR(50), primary_key=True)
+    warehouse_id = Column(NVARCHAR(255), primary_key=True, default='ALL')
+    from_date = Column(Date, nullable=False) # Earliest changed date (recompute from its bucket)
+    source = Column(NVARCHAR(50)) # SALES_IMPORT, PURCHASE_IMPORT, OPENING_STOCK_IMPORT
+    marked_at = Column(DateTime, default=func.now())
+    version = Column(Integer, nullable=False, default=1) # Bumped by every re-mark; clear() deletes only the version it read
+
+class DimProductGroupClosure(Base):
+    """
+    Closure table over Dim_Product_Groups.parent_id: one row per (ancestor, descendant) pair,
+    including (g, g, 0). A group filter becomes one indexed lookup instead of a tree walk.
+    Maintained by services.group_closure.GroupClosure.
+    """
+    __tablename__ = "Dim_Product_Group_Closure"
+    ancestor_id = Column(NVARCHAR(50), primary_key=True)
+    descendant_id = Column(NVARCHAR(50), primary_key=True, index=True)
+    depth = Column(Integer, nullable=False, default=0)
@@ -8,10 +8,13 @@ import json
 from typing import List, Dict, Any, Optional
 from pydantic import BaseModel
 
-from datetime import datetime
+from datetime import datetime, timedelta
 from backend.database import get_db
-from backend.models import DimProducts, DimVendors, FactPurchasePlans, FactSales, DimUnits, DimProductGroups, DimWarehouses, DimCustomerGroups, DimCustomers, SystemConfig, SystemSyncLogs, FactInventorySnapshots, FactRollingInventory, PlanningDistributionProfile, FactOpeningStock
-from backend.services.sync_service import SyncService
+from backend.models import DimProducts, DimVendors, FactPurchasePlans, FactSales, DimUnits, DimProductGroups, DimWarehouses, DimCustomerGroups, DimCustomers, SystemConfig, SystemSyncLogs, FactInventorySnapshots, FactRollingInventory, PlanningDistributionProfile, FactOpeningStock, FactSalesDaily
+from backend.services.group_closure import GroupClosure
+from backend.services.daily_aggregates import DailyAggregates
+from backend.services.dimension_cache import dimension_cache, get_profiles as get_cached_profiles, WAREHOUSES, CONFIG
+from backend.services.export_writer import export_response, stream_query
 
 router = APIRouter(
     prefix="/api/data",
@@ -65,64 +68,59 @@ class ProductUpdate(BaseModel):
 
 # --- Helper Functions ---
 
-def trigger_auto_calculation(db: Session):
+def trigger_auto_calculation(db: Session, full: bool = False, refresh_forecasts: bool = False):
     """
-    Triggers the Rolling Planning SQL Calculation safely.
-    Runs for ALL Active Profiles to ensure consistency.
-    Runs from 3 months ago to ensure recent history is updated.
+    Schedules the Rolling Planning Calculation (all active profiles) as a debounced AUTO_CALC job.
+    Back-to-back imports coalesce into one run; see services.auto_calc.
+    refresh_forecasts: update forecasts of changed SKUs first (sales imports).
     """
     try:
-        from backend.services.rolling_calc import RollingPlanningEngine
-        from backend.models import PlanningDistributionProfile
-        from datetime import date, timedelta
-        
-        print("[AUTO-CALC] Triggering Rolling Calculation...")
-        
-        # 1. Determine Scope (Active Profiles)
-        profiles = db.query(PlanningDistributionProfile).filter_by(is_active=True).all()
-        if not profiles:
-            profiles = [{'profile_id': 'STD'}] # Fallback
-            
-        engine = RollingPlanningEngine(db)
-        
-        # 1b. Optimize Table (Prune old history)
-        engine.prune_history(months_to_keep=6)
-        
-        # 2. Determine Lookback Date (e.g., Start of previous month or fixed lookback)
-        # To capture recent imports (like Nov 2025 when today is Dec 2025)
-        # Safe bet: 3 months ago or Start of Year.
-        today = date.today()
-        run_date = today.replace(day=1) - timedelta(days=90) # ~3 months back
-        
-        active_ids = [p.profile_id for p in profiles]
-        print(f"[AUTO-CALC] Scope: Profiles={active_ids}, RunDate={run_date}")
-
-        for p in profiles:
-            pid = p.profile_id
-            print(f"[AUTO-CALC] Running for Profile: {pid}...")
-            # Use 'ALL' for warehouse to correspond to global sales/purchases
-            engine.run_sql_procedure(profile_id=pid, warehouse_id='ALL', run_date=run_date)
-            
-        print("[AUTO-CALC] Complete.")
+        from backend.services.auto_calc import schedule_auto_calculation
+        schedule_auto_calculation(db, full=full, refresh_forecasts=refresh_forecasts)
     except Exception as e:
-        print(f"[AUTO-CALC] Failed: {e}")
+        db.rollback()
+        print(f"[AUTO-CALC] Failed to schedule: {e}")
+
+# --- Columnar Import Helpers ---
+
+def clean_text_column(series: pd.Series) -> pd.Series:
+    """str().strip() for a whole column; NaN/None become ''."""
+    out = series.where(series.notna(), '').astype(str).str.strip() # pandas 3: astype(str) keeps NaN
+    return out.mask(out.str.lower().isin(['nan', 'none', 'nat']), '')
+
+def parse_number_column(series: pd.Series) -> pd.Series:
+    """float() for a whole column; unparseable values become 0."""
+    return pd.to_numeric(series, errors='coerce').fillna(0).astype(float)
+
+def serialize_extra_columns(df: pd.DataFrame, columns: List[str]) -> List[Optional[str]]:
+    """JSON of the non-null unmapped cells of each row (None when the row has none), one pass."""
+    if not columns:
+        return [None] * len(df)
+    values = df[columns].to_numpy(dtype=object)
+    present = df[columns].notna().to_numpy()
+    names = [str(c) for c in columns]
+    out = []
+    for vals, mask in zip(values, present):
+        if mask.any():
+            out.append(json.dumps({names[j]: str(vals[j]) for j in mask.nonzero()[0]}, ensure_ascii=False))
+        else:
+            out.append(None)
+    return out
+
+def frame_to_records(frame: pd.DataFrame) -> List[Dict[str, Any]]:
+    """DataFrame -> insert parameter dicts with NaN/NaT as None (pyodbc rejects NaN for text columns)."""
+    return frame.astype(object).where(frame.notna(), None).to_dict('records')
 
-def get_recursive_group_ids(db: Session, group_id: str) -> List[str]:
+def bulk_insert_records(db: Session, model, records: List[Dict[str, Any]], chunk_size: int = 20000) -> int:
     """
-    Recursively fetch all child group IDs for a given group_id.
-    Returns a list including the parent group_id itself.
+    Core insert() executemany in large chunks (fast_executemany on pyodbc).
+    Skips ORM object construction entirely. Does not commit.
     """
-    all_group_ids = [group_id]
-    
-    def get_children(parent_id):
-        children = db.query(DimProductGroups.group_id).filter(DimProductGroups.parent_id == parent_id).all()
-        ids = [c[0] for c in children]
-        for cid in ids:
-            all_group_ids.append(cid)
-            get_children(cid) # Recurse
-            
-    get_children(group_id)
-    return list(set(all_group_ids)) # Ensure uniqueness
+    from sqlalchemy import insert
+    stmt = insert(model.__table__).execution_options(fast_executemany=True)
+    for i in range(0, len(records), chunk_size):
+        db.execute(stmt, records[i:i + chunk_size])
+    return len(records)
 
 # --- Helper Functions ---
 
@@ -317,6 +315,7 @@ def process_groups_file(df: pd.DataFrame, db: Session):
                 final_id = gid if gid else str(uuid.uuid4())
                 group = DimProductGroups(group_id=final_id)
                 db.add(group)
+                GroupClosure(db).move(final_id, None) # New root group
             
             if name: group.group_name = name
             
@@ -374,7 +373,9 @@ def process_warehouses_file(df: pd.DataFrame, db: Session):
         except Exception:
             db.rollback()
             continue
-    try: db.commit()
+    try:
+        db.commit()
+        dimension_cache.invalidate(WAREHOUSES)
     except: db.rollback()
     return count
 
@@ -458,6 +459,8 @@ def process_partner_groups_file(df: pd.DataFrame, db: Session):
 def process_opening_stock_file(df: pd.DataFrame, db: Session, import_type: str = 'full'):
     import re
     from datetime import date, datetime
+    from backend.services.change_tracker import ChangeTracker
+    tracker = ChangeTracker(db)
     try:
         data_rows = df  # Expecting df to be the dataframe
         
@@ -678,6 +681,10 @@ def process_opening_stock_file(df: pd.DataFrame, db: Session, import_type: str =
                 
                 if involved_dates:
                     print(f"[IMPORT] Partition Delete for Dates: {involved_dates}")
+                    # Checkpoints being removed change the plan too
+                    tracker.mark(db.query(FactOpeningStock.sku_id, FactOpeningStock.warehouse_id, FactOpeningStock.stock_date).filter(
+                        FactOpeningStock.stock_date.in_(involved_dates)
+                    ).all(), 'OPENING_STOCK_IMPORT')
                     # Ensure we delete ALL records (Global + Specific) for these dates to avoid duplicates
                     db.query(FactOpeningStock).filter(
                         FactOpeningStock.stock_date.in_(involved_dates)
@@ -893,8 +900,10 @@ def process_opening_stock_file(df: pd.DataFrame, db: Session, import_type: str =
             count += 1
                 
 
-            
+        tracker.mark(updates.keys(), 'OPENING_STOCK_IMPORT')
         db.commit()
+        if new_warehouses:
+            dimension_cache.invalidate(WAREHOUSES)
         # Trigger Auto-Calc if full import (for simplicity, or check arg)
         if import_type == 'full': # Only for Opening Stock full reset usually
              trigger_auto_calculation(db)
@@ -1118,8 +1127,8 @@ def get_purchases(
         query = query.filter(FactPurchases.purchase_type == type)
         
     if group_id and group_id != 'ALL':
-        all_ids = get_recursive_group_ids(db, group_id)
-        query = query.filter(DimProducts.group_id.in_(all_ids))
+        # Recursive Filter (closure table)
+        query = query.filter(GroupClosure(db).filter(DimProducts.group_id, group_id))
         
     total = query.count()
     
@@ -1203,45 +1212,32 @@ def get_rolling_raw(
 # --- Import Processors ---
 
 
-def process_sales_details_file(df: pd.DataFrame, db: Session):
+def _sales_layout(batch: pd.DataFrame, layout: Optional[Dict[str, Any]] = None):
     """
-    Import "So_chi_tiet_ban_hang" into FactSales.
-    Expected Columns (Vietnamese):
-    - Ngày chứng từ (Date)
-    - Số chứng từ (Transaction ID)
-    - Mã hàng (SKU)
-    - Số lượng (Quantity)
-    - Thành tiền (Amount - Optional)
-    - Mã đối tượng (Customer ID - Optional)
+    Header & column detection for a sales ledger batch.
+    First batch: scan for the header row (title rows above it are dropped).
+    Later batches: reuse the detected header positionally.
+    Returns (layout, data) or (error_message, None).
     """
-    from backend.models import FactSales
-    count = 0
-    errors = []
-    
-    # 1. Normalize Header (Find header row)
-    # Similar to process_opening_stock_file, we might need to search for keywords if header isn't at row 0.
-    # Simple check for 'Mã hàng' or 'sku'
-    # For now, let's assume standard format or try to find it.
-    
-    # Simple header search
-    data = df
+    if layout is not None:
+        return layout, batch.set_axis(layout["columns"], axis=1)
+
+    data = batch
     header_found = False
     
     # Keywords
     sku_keys = ['mã hàng', 'ma_hang', 'sku', 'product code']
     date_keys = ['ngày chứng từ', 'ngay_ct', 'date', 'ngay chung tu']
-    qty_keys = ['số lượng', 'so_luong', 'quantity', 'qty']
     
-    # Try to find header row index
-    for i, row in df.head(10).iterrows():
+    # Try to find header row index (positional, data may not start at 0)
+    for pos, (i, row) in enumerate(batch.head(10).iterrows()):
         row_str = [str(x).lower().strip() for x in row.values]
         has_sku = any(k in val for k in sku_keys for val in row_str)
         has_date = any(k in val for k in date_keys for val in row_str)
         
         if has_sku and has_date:
-             # Found header
-             df.columns = df.iloc[i] # Set header
-             data = df.iloc[i+1:] # Data starts after header
+             # Found header; data starts after it
+             data = batch.iloc[pos+1:].set_axis(list(batch.iloc[pos]), axis=1)
              header_found = True
              break
     
@@ -1249,15 +1245,13 @@ def process_sales_details_file(df: pd.DataFrame, db: Session):
         # Fallback: Assume row 0 is header involved if not found
         pass
     
-    # Normalize Columns
-    data.columns = [str(c).strip().lower() for c in data.columns]
-    
     # Normalize Header
-    df.columns = [str(c).strip() for c in df.columns]
+    columns = [str(c).strip() for c in data.columns]
+    data = data.set_axis(columns, axis=1)
     
     # Robust Column Detection
     def find_col(keywords):
-        for c in df.columns:
+        for c in columns:
             c_lower = c.lower()
             if any(k == c_lower for k in keywords): return c
             if any(k in c_lower for k in keywords): return c
@@ -1271,92 +1265,143 @@ def process_sales_details_file(df: pd.DataFrame, db: Session):
     col_customer = find_col(['khách hàng', 'customer', 'đối tượng'])
     
     if not col_sku or not col_qty:
-         return 0, ["Missing crucial columns: 'Mã hàng' (SKU) or 'Số lượng' (Qty)"]
+         return "Missing crucial columns: 'Mã hàng' (SKU) or 'Số lượng' (Qty)", None
          
     if not col_date:
-         return 0, ["Missing crucial column: 'Date' or 'Ngày'. Import aborted to prevent duplicates."]
+         return "Missing crucial column: 'Date' or 'Ngày'. Import aborted to prevent duplicates.", None
+
+    layout = {
+        "columns": columns,
+        "date": col_date, "tx": col_tx, "sku": col_sku, "qty": col_qty,
+        "amount": col_amount, "customer": col_customer,
+        "unmapped": [c for c in columns if c not in [col_date, col_tx, col_sku, col_qty, col_amount, col_customer]]
+    }
+    return layout, data
+
+def _daily_refresh_ranges(min_date, max_date, inserted_days):
+    """
+    (start, end) day ranges of the daily aggregate tables to rebuild after an import: the swapped
+    range, plus every inserted day outside it (rows without a parseable date get the import time).
+    """
+    ranges = [(min_date, max_date)] if min_date is not None else []
+    for day in sorted(inserted_days):
+        if min_date is None or not (min_date <= day <= max_date):
+            ranges.append((day, day))
+    return ranges
+
+def _sales_dates(data: pd.DataFrame, layout: Dict[str, Any]):
+    """Parsed document dates of the rows with a SKU (NaT when unparseable); only the SKU and date columns are read."""
+    keep = clean_text_column(data[layout["sku"]]) != ''
+    return pd.to_datetime(data.loc[keep, layout["date"]], dayfirst=True, errors='coerce', format='mixed')
+
+def _sales_frame(data: pd.DataFrame, layout: Dict[str, Any], now: datetime):
+    """Columnar parse of one batch into Fact_Sales records (vectorized, no per-row Python)."""
+    skus = clean_text_column(data[layout["sku"]])
+    keep = skus != ''
+    raw_dates = pd.to_datetime(data[layout["date"]], dayfirst=True, errors='coerce', format='mixed')
+    qtys = parse_number_column(data[layout["qty"]])
+    amounts = parse_number_column(data[layout["amount"]]) if layout["amount"] else pd.Series(0.0, index=data.index)
+    row_ids = pd.Series(data.index.astype(str), index=data.index)
+    tx_ids = clean_text_column(data[layout["tx"]]) if layout["tx"] else pd.Series('', index=data.index)
+    tx_ids = tx_ids.where(tx_ids != '', 'IMP-SALE-' + row_ids)
+    extras = serialize_extra_columns(data, layout["unmapped"])
+
+    frame = pd.DataFrame({
+        'transaction_id': tx_ids + '_' + skus + '_' + row_ids,
+        'sku_id': skus,
+        'order_date': raw_dates.fillna(pd.Timestamp(now)),
+        'quantity': qtys,
+        'amount': amounts,
+        'source': 'IMPORT_FILE',
+        'extra_data': extras
+    }, index=data.index)[keep]
+    return frame
+
+def process_sales_details_file(df: pd.DataFrame, db: Session):
+    """
+    Import "So_chi_tiet_ban_hang" into FactSales.
+    Expected Columns (Vietnamese):
+    - Ngày chứng từ (Date)
+    - Số chứng từ (Transaction ID)
+    - Mã hàng (SKU)
+    - Số lượng (Quantity)
+    - Thành tiền (Amount - Optional)
+    - Mã đối tượng (Customer ID - Optional)
+    """
+    return process_sales_details_batches(lambda: iter([df]), db)
+
+def process_sales_details_batches(open_batches, db: Session):
+    """
+    Streaming version of process_sales_details_file.
+    open_batches: callable returning a fresh iterator of DataFrame batches (e.g. UploadReader.iter_batches).
+    It is read twice: pass 1 finds the header and the partition-swap date range,
+    pass 2 parses and bulk inserts batch by batch, so memory stays bounded by the batch size.
+    """
+    from backend.models import FactSales
+    from backend.services.change_tracker import ChangeTracker
+    tracker = ChangeTracker(db)
+    count = 0
+    errors = []
+    now = datetime.now()
+
+    # 1. Pass 1: Header & Date Range
+    layout = None
+    min_date, max_date = None, None
+    for batch in open_batches():
+        layout, data = _sales_layout(batch, layout)
+        if data is None:
+            return 0, [layout]
+        dates = _sales_dates(data, layout).dropna() # Date column only, the full parse happens in pass 2
+        if not dates.empty:
+            b_min, b_max = dates.min().date(), dates.max().date()
+            min_date = b_min if min_date is None else min(min_date, b_min)
+            max_date = b_max if max_date is None else max(max_date, b_max)
+
+    if layout is None:
+        return 0, ["File is empty."]
 
     # Partition Swap Logic: Delete existing data for date range in file
     try:
-        if col_date:
-            valid_dates = pd.to_datetime(df[col_date], errors='coerce').dropna()
-            if not valid_dates.empty:
-                min_date = valid_dates.min().date()
-                max_date = valid_dates.max().date()
-                db.query(FactSales).filter(
-                    FactSales.order_date >= min_date,
-                    FactSales.order_date <= max_date,
-                    FactSales.source == 'IMPORT_FILE'
-                ).delete(synchronize_session=False)
-                db.flush()
+        if min_date is not None:
+            # SKUs losing rows in the swapped range must be recalculated too
+            swapped = db.query(FactSales.sku_id, func.min(FactSales.order_date)).filter(
+                FactSales.order_date >= min_date,
+                FactSales.order_date < max_date + timedelta(days=1),
+                FactSales.source == 'IMPORT_FILE'
+            ).group_by(FactSales.sku_id).all()
+            tracker.mark([(sku, 'ALL', d) for sku, d in swapped], 'SALES_IMPORT')
+            db.query(FactSales).filter(
+                FactSales.order_date >= min_date,
+                FactSales.order_date < max_date + timedelta(days=1),
+                FactSales.source == 'IMPORT_FILE'
+            ).delete(synchronize_session=False)
+            db.flush()
     except Exception as e:
         print(f"Warning: Partition swap failed: {e}")
 
-    for index, row in df.iterrows():
-        try:
-            sku = str(row[col_sku]).strip()
-            if not sku or sku.lower() == 'nan': continue
-            
-            qty = 0
-            try:
-                qty = float(row[col_qty])
-            except: pass
-            
-            amt = 0
-            if col_amount:
-                try: amt = float(row[col_amount])
-                except: pass
-                
-            # Date
-            tx_date = datetime.now()
-            if col_date:
-                try:
-                    d = pd.to_datetime(row[col_date], dayfirst=True)
-                    if not pd.isna(d): tx_date = d
-                except: pass
-            
-            # Tx ID
-            tx_id = f"IMP-SALE-{index}"
-            if col_tx:
-                val = str(row[col_tx]).strip()
-                if val and val.lower() != 'nan': tx_id = val
-                
-            # Extra Data
-            unmapped = [c for c in df.columns if c not in [col_date, col_tx, col_sku, col_qty, col_amount, col_customer]]
-            extra = {}
-            for c in unmapped:
-                val = row[c]
-                if not pd.isna(val): extra[c] = str(val)
-            extra_json = json.dumps(extra, ensure_ascii=False) if extra else None
-            
-            # Final ID
-            final_id = f"{tx_id}_{sku}_{index}"
-            
-            new_sale = FactSales(
-                transaction_id=final_id,
-                sku_id=sku,
-                order_date=tx_date,
-                quantity=qty,
-                amount=amt,
-                source='IMPORT_FILE',
-                extra_data=extra_json
-            )
-            db.add(new_sale)
-            count += 1
-            
-            if count % 100 == 0: db.flush()
-            
-        except Exception as e:
-            errors.append(f"Row {index}: {str(e)}")
-            
+    # 2. Pass 2: Bulk Write (Core executemany, one batch at a time)
+    layout = None
+    inserted_days = set()
     try:
+        for batch in open_batches():
+            layout, data = _sales_layout(batch, layout)
+            frame = _sales_frame(data, layout, now)
+            if frame.empty:
+                continue
+            count += bulk_insert_records(db, FactSales, frame_to_records(frame))
+            inserted_days.update(frame['order_date'].dt.date.unique())
+            first_dates = frame.groupby('sku_id')['order_date'].min()
+            tracker.mark([(sku, 'ALL', d) for sku, d in first_dates.items()], 'SALES_IMPORT')
+        for start, end in _daily_refresh_ranges(min_date, max_date, inserted_days):
+            DailyAggregates(db).refresh_sales(start, end) # Same transaction as the swap
         db.commit()
     except:
         db.rollback()
         raise
-        
-    # Trigger Auto-Calc
-    trigger_auto_calculation(db)
+    print(f"[SALES IMPORT] Bulk Inserted {count} records.")
+
+    # Trigger Auto-Calc (refreshes forecasts of the SKUs that got new sales before the rolling plan reads them)
+    trigger_auto_calculation(db, refresh_forecasts=True)
 
     return count, errors
 
@@ -1417,9 +1462,8 @@ def get_inventory(
         query = query.filter(FactOpeningStock.warehouse_id == warehouse_id)
 
     if group_id and group_id != 'ALL':
-        # Recursive Filter
-        all_ids = get_recursive_group_ids(db, group_id)
-        query = query.filter(DimProducts.group_id.in_(all_ids))
+        # Recursive Filter (closure table)
+        query = query.filter(GroupClosure(db).filter(DimProducts.group_id, group_id))
     
     total = query.count()
     data = query.order_by(FactOpeningStock.stock_date.desc()).offset(skip).limit(limit).all()
@@ -1459,6 +1503,60 @@ def get_inventory(
         }
     }
 
+@router.get("/inventory/export")
+def export_inventory(
+    search: Optional[str] = None,
+    start_date: Optional[str] = None,
+    end_date: Optional[str] = None,
+    warehouse_id: Optional[str] = None,
+    group_id: Optional[str] = None,
+    format: str = 'xlsx',
+    db: Session = Depends(get_db)
+):
+    """
+    Export Opening Stock (same filters as GET /inventory) to Excel or CSV, streamed.
+    """
+    def rows(session):
+        query = session.query(
+            FactOpeningStock.stock_date,
+            FactOpeningStock.sku_id,
+            DimProducts.product_name,
+            FactOpeningStock.warehouse_id,
+            DimWarehouses.warehouse_name,
+            DimProductGroups.group_name,
+            FactOpeningStock.quantity,
+            FactOpeningStock.quantity_update,
+            FactOpeningStock.unit,
+            DimProducts.unit,
+            FactOpeningStock.notes
+        ).outerjoin(
+            DimProducts, FactOpeningStock.sku_id == DimProducts.sku_id
+        ).outerjoin(
+            DimWarehouses, FactOpeningStock.warehouse_id == DimWarehouses.warehouse_id
+        ).outerjoin(
+            DimProductGroups, DimProducts.group_id == DimProductGroups.group_id
+        )
+        if search:
+            st = f"%{search}%"
+            query = query.filter((FactOpeningStock.sku_id.ilike(st)) | (DimProducts.product_name.ilike(st)))
+        if start_date:
+            query = query.filter(FactOpeningStock.stock_date >= start_date)
+        if end_date:
+            query = query.filter(FactOpeningStock.stock_date <= end_date)
+        if warehouse_id and warehouse_id != 'ALL':
+            query = query.filter(FactOpeningStock.warehouse_id == warehouse_id)
+        if group_id and group_id != 'ALL':
+            query = query.filter(GroupClosure(session).filter(DimProducts.group_id, group_id))
+
+        for r in stream_query(query.order_by(FactOpeningStock.stock_date.desc(), FactOpeningStock.sku_id)):
+            effective = r.quantity_update if r.quantity_update is not None and r.quantity_update > 0 else r.quantity
+            yield [r.stock_date, r.sku_id, r.product_name, r.warehouse_id, r.warehouse_name, r.group_name,
+                   effective, r.quantity, r.quantity_update, r[8] or r[9] or "", r.notes]
+
+    headers = ["Ngày (Date)", "Mã SKU", "Tên Hàng", "Mã Kho", "Kho", "Nhóm", "Tồn (On Hand)",
+               "Tồn gốc (Original)", "Điều chỉnh (Update)", "ĐVT", "Ghi chú"]
+    return export_response(headers, rows, "inventory", format, sheet_name='Inventory')
+
 @router.get("/snapshots")
 def get_inventory_snapshots(
     skip: int = 0,
@@ -1505,8 +1603,8 @@ def get_inventory_snapshots(
         query = query.filter(FactInventorySnapshots.warehouse_id == warehouse_id)
     
     if group_id and group_id != 'ALL':
-        all_ids = get_recursive_group_ids(db, group_id)
-        query = query.filter(DimProducts.group_id.in_(all_ids))
+        # Recursive Filter (closure table)
+        query = query.filter(GroupClosure(db).filter(DimProducts.group_id, group_id))
     
     
     # Calculate Sum for On Hand
@@ -1656,46 +1754,43 @@ def delete_inventory_snapshot(sku_id: str, warehouse_id: str, snapshot_date: str
     else:
          raise HTTPException(status_code=404, detail="Record not found")
 
-def process_purchase_details_file(df: pd.DataFrame, db: Session):
+PURCHASE_SKU_KEYS = ['mã hàng', 'ma_hang', 'sku', 'product code', 'mã vt']
+PURCHASE_QTY_KEYS = ['số lượng', 'so_luong', 'quantity', 'qty']
+
+def _purchase_layout(batch: pd.DataFrame, layout: Optional[Dict[str, Any]] = None):
     """
-    Import "So_chi_tiet_mua_hang" into FactPurchases.
+    Header & column detection for a purchase ledger batch (see _sales_layout).
+    Returns (layout, data) or (error_message, None).
     """
-    from backend.models import FactPurchases
-    count = 0
-    errors = []
+    if layout is not None:
+        return layout, batch.set_axis(layout["columns"], axis=1)
 
-    # 1. Normalize Header (Find header row)
+    data = batch
     header_found = False
     
-    # Keywords
-    sku_keys = ['mã hàng', 'ma_hang', 'sku', 'product code', 'mã vt']
-    date_keys = ['ngày chứng từ', 'ngay_ct', 'date', 'ngay chung tu']
-    qty_keys = ['số lượng', 'so_luong', 'quantity', 'qty']
-    
-    # Try to find header row index
-    for i, row in df.head(20).iterrows():
+    # Try to find header row index (positional, data may not start at 0)
+    for pos, (i, row) in enumerate(batch.head(20).iterrows()):
         row_str = [str(x).lower().strip() for x in row.values]
-        has_sku = any(k in val for k in sku_keys for val in row_str)
-        # has_date = any(k in val for k in date_keys for val in row_str) # Date might be optional or named differently
-        has_qty = any(k in val for k in qty_keys for val in row_str)
+        has_sku = any(k in val for k in PURCHASE_SKU_KEYS for val in row_str)
+        # Date might be optional or named differently
+        has_qty = any(k in val for k in PURCHASE_QTY_KEYS for val in row_str)
 
         if has_sku and has_qty:
              # Found header
              print(f"[PURCHASE IMPORT] Found header at row {i}")
-             df.columns = df.iloc[i] # Set header
-             df = df.iloc[i+1:] # Data starts after header
+             data = batch.iloc[pos+1:].set_axis(list(batch.iloc[pos]), axis=1) # Data starts after header
              header_found = True
              break
     
     if not header_found:
         print("[PURCHASE IMPORT] Header not found by keywords, assuming row 0.")
 
-    
-    df.columns = [str(c).strip() for c in df.columns]
+    columns = [str(c).strip() for c in data.columns]
+    data = data.set_axis(columns, axis=1)
     
     # Robust Column Detection
     def find_col(keywords):
-        for c in df.columns:
+        for c in columns:
             c_lower = c.lower()
             # Direct match
             if any(k == c_lower for k in keywords): return c
@@ -1713,122 +1808,134 @@ def process_purchase_details_file(df: pd.DataFrame, db: Session):
     col_qty = find_col(['số lượng', 'so_luong', 'quantity', 'qty', 'sl', 'thực nhập', 'real qty'])
     
     if not col_sku or not col_qty:
-         print(f"[PURCHASE IMPORT ERROR] Missing columns. Found: {df.columns.tolist()}")
-         return 0, [f"Missing crucial columns: 'Mã hàng' (SKU) or 'Số lượng' (Qty). Found: {df.columns.tolist()}"]
+         print(f"[PURCHASE IMPORT ERROR] Missing columns. Found: {columns}")
+         return f"Missing crucial columns: 'Mã hàng' (SKU) or 'Số lượng' (Qty). Found: {columns}", None
          
     if not col_date:
-         # Fallback to Today if date missing? Or warn?
-         print(f"[PURCHASE IMPORT WARNING] Missing Date column. Found: {df.columns.tolist()}")
-         # return 0, ["Missing crucial column: 'Date' or 'Ngày'. Import aborted to prevent duplicates."]
          # Lets allow it but warn, using Today
-         pass
+         print(f"[PURCHASE IMPORT WARNING] Missing Date column. Found: {columns}")
+
+    layout = {"columns": columns, "date": col_date, "tx": col_tx, "sku": col_sku, "wh": col_wh, "qty": col_qty}
+    return layout, data
+
+def _purchase_frame(data: pd.DataFrame, layout: Dict[str, Any], now: datetime, offset: int = 0):
+    """Columnar parse of one batch into Fact_Purchases records. offset: rows already seen (for fallback ids)."""
+    col_sku, col_qty, col_date, col_tx, col_wh = layout["sku"], layout["qty"], layout["date"], layout["tx"], layout["wh"]
+    positions = pd.Series(range(offset, offset + len(data)), index=data.index).astype(str)
+    skus = clean_text_column(data[col_sku])
+    keep = skus != ''
+
+    # Skip Repeated Headers (Robustness)
+    # If the SKU field matches "Mã hàng", "SKU", etc., it's likely a header row.
+    sku_lower = skus.str.lower()
+    is_header = sku_lower.apply(lambda v: any(k in v for k in PURCHASE_SKU_KEYS)) | (sku_lower == str(col_sku).lower())
+    qty_raw = data[col_qty]
+    is_header |= qty_raw.astype(str).str.lower().isin(PURCHASE_QTY_KEYS)
+    skipped = int((keep & is_header).sum())
+    if skipped:
+        print(f"[PURCHASE IMPORT] Skipping {skipped} generic header rows.")
+    keep &= ~is_header
+
+    raw_dates = pd.to_datetime(data[col_date], dayfirst=True, errors='coerce', format='mixed') if col_date else pd.Series(pd.NaT, index=data.index)
+    tx_ids = clean_text_column(data[col_tx]) if col_tx else pd.Series('', index=data.index)
+    tx_ids = tx_ids.where(tx_ids != '', 'IMP-PUR-' + positions)
+
+    # Warehouse Logic
+    wh_vals = clean_text_column(data[col_wh]) if col_wh else pd.Series('', index=data.index)
+    wh_vals = wh_vals.where(wh_vals != '', '66 An dương vương')
+
+    frame = pd.DataFrame({
+        "transaction_id": tx_ids + '_' + skus + '_' + positions,
+        "sku_id": skus,
+        "order_date": raw_dates.fillna(pd.Timestamp(now)),
+        "quantity": parse_number_column(qty_raw),
+        "purchase_type": 'ACTUAL',
+        "order_id": tx_ids,
+        "source": 'IMPORT_FILE',
+        "warehouse_id": wh_vals,
+        "extra_data": None
+    }, index=data.index)[keep]
+    return frame, raw_dates[keep]
+
+def process_purchase_details_file(df: pd.DataFrame, db: Session):
+    """
+    Import "So_chi_tiet_mua_hang" into FactPurchases.
+    """
+    return process_purchase_details_batches(lambda: iter([df]), db)
+
+def process_purchase_details_batches(open_batches, db: Session):
+    """
+    Streaming version of process_purchase_details_file (two passes, see process_sales_details_batches).
+    """
+    from backend.models import FactPurchases
+    from backend.services.change_tracker import ChangeTracker
+    tracker = ChangeTracker(db)
+    count = 0
+    errors = []
+    now = datetime.now()
+
+    # 1. Pass 1: Header & Date Range
+    layout = None
+    offset = 0
+    min_date, max_date = None, None
+    for batch in open_batches():
+        layout, data = _purchase_layout(batch, layout)
+        if data is None:
+            return 0, [layout]
+        _, dates = _purchase_frame(data, layout, now, offset)
+        offset += len(data)
+        dates = dates.dropna()
+        if not dates.empty:
+            b_min, b_max = dates.min().date(), dates.max().date()
+            min_date = b_min if min_date is None else min(min_date, b_min)
+            max_date = b_max if max_date is None else max(max_date, b_max)
+
+    if layout is None:
+        return 0, ["File is empty."]
          
     # Partition Swap
     try:
-        if col_date:
-            valid_dates = pd.to_datetime(df[col_date], errors='coerce').dropna()
-            if not valid_dates.empty:
-                min_date = valid_dates.min().date()
-                max_date = valid_dates.max().date()
-                print(f"[PURCHASE IMPORT] Partition Swap: {min_date} - {max_date}")
-                db.query(FactPurchases).filter(
-                    FactPurchases.order_date >= min_date,
-                    FactPurchases.order_date <= max_date,
-                    FactPurchases.source == 'IMPORT_FILE'
-                ).delete(synchronize_session=False)
-                db.flush()
+        if min_date is not None:
+            print(f"[PURCHASE IMPORT] Partition Swap: {min_date} - {max_date}")
+            # SKUs losing rows in the swapped range must be recalculated too
+            tracker.mark(db.query(FactPurchases.sku_id, FactPurchases.warehouse_id, func.min(FactPurchases.order_date)).filter(
+                FactPurchases.order_date >= min_date,
+                FactPurchases.order_date < max_date + timedelta(days=1),
+                FactPurchases.source == 'IMPORT_FILE'
+            ).group_by(FactPurchases.sku_id, FactPurchases.warehouse_id).all(), 'PURCHASE_IMPORT')
+            db.query(FactPurchases).filter(
+                FactPurchases.order_date >= min_date,
+                FactPurchases.order_date < max_date + timedelta(days=1),
+                FactPurchases.source == 'IMPORT_FILE'
+            ).delete(synchronize_session=False)
+            db.flush()
     except Exception as e:
         print(f"Warning: Partition swap failed: {e}")
-        
-    mappings = []
-    
-    # Pre-process columns to avoid repeated lookups
-    c_sku = df.columns.get_loc(col_sku) if col_sku in df.columns else -1
-    c_qty = df.columns.get_loc(col_qty) if col_qty in df.columns else -1
-    c_date = df.columns.get_loc(col_date) if col_date and col_date in df.columns else -1
-    c_tx = df.columns.get_loc(col_tx) if col_tx and col_tx in df.columns else -1
-    
-    # Convert DF to list of dicts for faster iteration
-    records = df.to_dict('records')
-    now = datetime.now()
 
-    for index, row in enumerate(records):
-        try:
-            # Use column names directly from dictionary
-            sku = str(row.get(col_sku, '')).strip()
-            
-            # 1. Skip Empty
-            if not sku or sku.lower() == 'nan' or sku.lower() == 'none': continue
-            
-            # 2. Skip Repeated Headers (Robustness)
-            # If the SKU field matches "Mã hàng", "SKU", etc., it's likely a header row.
-            if any(k in sku.lower() for k in sku_keys) or (col_sku and sku.lower() == str(col_sku).lower()):
-                print(f"[PURCHASE IMPORT] Skipping generic header row at index {index}: {sku}")
+    # 2. Pass 2: Bulk Write (Core executemany, one batch at a time)
+    layout = None
+    offset = 0
+    inserted_days = set()
+    try:
+        for batch in open_batches():
+            layout, data = _purchase_layout(batch, layout)
+            frame, _ = _purchase_frame(data, layout, now, offset)
+            offset += len(data)
+            if frame.empty:
                 continue
-            
-            qty = 0
-            try: 
-                 val = row.get(col_qty, 0)
-                 if pd.isna(val): val = 0
-                 # Check if Qty is a header-like string before converting?
-                 # If float conversion works, it's likely valid number (or 0). 
-                 # Header "Số lượng" would fail float conversion usually.
-                 qty = float(val)
-            except: 
-                # If qty fails to parse, and SKU looked suspicious, we already skipped.
-                # If SKU was "Product A" but Qty is "Quantity", we skip.
-                if str(val).lower() in [k.lower() for k in qty_keys]:
-                     continue
-                pass
-            
-            tx_date = now
-            if col_date and row.get(col_date):
-                try:
-                    d = pd.to_datetime(row[col_date], dayfirst=True)
-                    if not pd.isna(d): tx_date = d
-                except: pass
-                
-            tx_id = f"IMP-PUR-{index}"
-            if col_tx and row.get(col_tx):
-                val = str(row[col_tx]).strip()
-                if val and val.lower() != 'nan' and val.lower() != 'none': tx_id = val
-            
-            final_id = f"{tx_id}_{sku}_{index}"
-            
-            # Warehouse Logic
-            wh_val = '66 An dương vương'
-            if col_wh and row.get(col_wh):
-                val = str(row[col_wh]).strip()
-                if val and val.lower() != 'nan' and val.lower() != 'none':
-                    wh_val = val
-
-            mappings.append({
-                "transaction_id": final_id,
-                "sku_id": sku,
-                "order_date": tx_date,
-                "quantity": qty,
-                "purchase_type": 'ACTUAL',
-                "order_id": tx_id,
-                "source": 'IMPORT_FILE',
-                "warehouse_id": wh_val,
-                "extra_data": None 
-            })
-            
-        except Exception as e:
-            errors.append(f"Row {index}: {str(e)}")
-
-    if mappings:
-        print(f"[PURCHASE IMPORT] Bulk Inserting {len(mappings)} records...")
-        try:
-            db.bulk_insert_mappings(FactPurchases, mappings)
-            db.commit() # Commit explicitly
-            count = len(mappings)
-        except Exception as e:
-            db.rollback()
-            print(f"[PURCHASE IMPORT ERROR] Bulk Insert Failed: {e}")
-            errors.append(f"Bulk Insert Failed: {str(e)}")
-            # Fallback to slow insert?
-            return 0, errors
+            print(f"[PURCHASE IMPORT] Bulk Inserting {len(frame)} records...")
+            count += bulk_insert_records(db, FactPurchases, frame_to_records(frame))
+            inserted_days.update(frame['order_date'].dt.date.unique())
+            first_dates = frame.groupby(['sku_id', 'warehouse_id'])['order_date'].min()
+            tracker.mark([(sku, wh, d) for (sku, wh), d in first_dates.items()], 'PURCHASE_IMPORT')
+        for start, end in _daily_refresh_ranges(min_date, max_date, inserted_days):
+            DailyAggregates(db).refresh_purchases(start, end) # Same transaction as the swap
+        db.commit() # Commit explicitly
+    except Exception as e:
+        db.rollback()
+        print(f"[PURCHASE IMPORT ERROR] Bulk Insert Failed: {e}")
+        errors.append(f"Bulk Insert Failed: {str(e)}")
+        return 0, errors
 
     # Trigger Auto-Calc
     trigger_auto_calculation(db)
@@ -1845,66 +1952,57 @@ async def upload_file(
     Import data from Excel/CSV file.
     """
     print(f"[IMPORT-DEBUG] Received upload request for type: '{type}'")
+    from backend.services.upload_reader import UploadReader, spool_upload
     try:
-        contents = await file.read()
-        if file.filename.endswith('.csv'):
-            # Try utf-8-sig for Excel CSVs, fallback to utf-8 then cp1252
-            try:
-                df = pd.read_csv(io.BytesIO(contents), encoding='utf-8-sig')
-            except UnicodeDecodeError:
-                try:
-                    df = pd.read_csv(io.BytesIO(contents), encoding='utf-16')
-                except:
-                    df = pd.read_csv(io.BytesIO(contents), encoding='cp1252')
-        elif file.filename.endswith(('.xls', '.xlsx')):
-            print(f"[IMPORT DEBUG] Processing File: {file.filename}")
-            df = pd.read_excel(io.BytesIO(contents))
-            print(f"[IMPORT DEBUG] Raw DataFrame Shape: {df.shape}")
-            print(f"[IMPORT DEBUG] First 5 rows:\n{df.head(5)}")
-            try:
-                 pass # Original df read moved above
-            except Exception as e:
-                 # Fallback for weird excel formats?
-                 raise HTTPException(status_code=400, detail=f"Excel read error: {e}")
-        else:
+        if not file.filename.lower().endswith(('.csv', '.xls', '.xlsx')):
             raise HTTPException(status_code=400, detail=f"Invalid file format: {file.filename}")
-            
+
+        # Spool to disk in chunks and read in bounded batches (no full upload in memory)
+        # CSV: utf-8-sig for Excel CSVs, fallback to utf-16 then cp1252
+        print(f"[IMPORT DEBUG] Processing File: {file.filename}")
+        reader = UploadReader(await spool_upload(file), file.filename)
         records_processed = 0
         warnings = []
         
         # Normalize type checking just in case
         t = type.lower().strip()
         
-        if t == 'products':
-            records_processed = process_products_file(df, db)
-        elif t == 'vendors': # Partners
-            records_processed = process_vendors_file(df, db)
-        elif t == 'units':
-            records_processed = process_units_file(df, db)
-        elif t == 'groups':
-            records_processed = process_groups_file(df, db)
-        elif t == 'warehouses':
-            records_processed = process_warehouses_file(df, db)
-        elif t == 'customers':
-            records_processed = process_customers_file(df, db)
-        elif t == 'partner-groups':
-            records_processed = process_partner_groups_file(df, db)
-        elif t == 'opening_stock': 
-            res = process_opening_stock_file(df, db)
-            if isinstance(res, tuple):
-                records_processed, warnings = res
+        with reader:
+            if t == 'sales_details':
+                 # Large ledgers: streamed batch by batch
+                 count, errors = process_sales_details_batches(reader.iter_batches, db)
+                 records_processed = count
+                 warnings = errors
+            elif t == 'purchase_details':
+                 count, errors = process_purchase_details_batches(reader.iter_batches, db)
+                 records_processed = count
+                 warnings = errors
+            elif t in ('products', 'vendors', 'units', 'groups', 'warehouses', 'customers', 'partner-groups', 'opening_stock'):
+                # Master data / opening stock: processors need every row (header scan, matrix mode)
+                df = reader.read_all()
+                print(f"[IMPORT DEBUG] Raw DataFrame Shape: {df.shape}")
+                if t == 'products':
+                    records_processed = process_products_file(df, db)
+                elif t == 'vendors': # Partners
+                    records_processed = process_vendors_file(df, db)
+                elif t == 'units':
+                    records_processed = process_units_file(df, db)
+                elif t == 'groups':
+                    records_processed = process_groups_file(df, db)
+                elif t == 'warehouses':
+                    records_processed = process_warehouses_file(df, db)
+                elif t == 'customers':
+                    records_processed = process_customers_file(df, db)
+                elif t == 'partner-groups':
+                    records_processed = process_partner_groups_file(df, db)
+                elif t == 'opening_stock': 
+                    res = process_opening_stock_file(df, db)
+                    if isinstance(res, tuple):
+                        records_processed, warnings = res
+                    else:
+                        records_processed = res
             else:
-                records_processed = res
-        elif t == 'sales_details':
-             count, errors = process_sales_details_file(df, db)
-             records_processed = count
-             warnings = errors
-        elif t == 'purchase_details':
-             count, errors = process_purchase_details_file(df, db)
-             records_processed = count
-             warnings = errors
-        else:
-            raise HTTPException(status_code=400, detail="Invalid type")
+                raise HTTPException(status_code=400, detail="Invalid type")
 
         resp = {"status": "success", "message": f"Processed {records_processed} records."}
         if warnings:
@@ -1940,8 +2038,8 @@ def get_products(
         query = query.filter(DimProducts.category == category)
 
     if group_id and group_id != 'ALL':
-        all_group_ids = get_recursive_group_ids(db, group_id)
-        query = query.filter(DimProducts.group_id.in_(all_group_ids))
+        # Recursive Filter (closure table)
+        query = query.filter(GroupClosure(db).filter(DimProducts.group_id, group_id))
 
         
     if unit and unit != 'ALL':
@@ -2047,6 +2145,7 @@ def reset_database(db: Session = Depends(get_db)):
         # Delete detailed facts first to avoid foreign key constraints (if any enforced)
         db.query(FactPurchasePlans).delete()
         db.query(FactSales).delete()
+        db.query(FactSalesDaily).delete()
         
         # Delete dimensions
         db.query(DimProducts).delete()
@@ -2058,83 +2157,47 @@ def reset_database(db: Session = Depends(get_db)):
         db.rollback()
         raise HTTPException(status_code=500, detail=str(e))
 
-from fastapi import APIRouter, UploadFile, File, Depends, HTTPException, BackgroundTasks
-
-# ... (Previous imports remain, ensure BackgroundTasks is imported)
+from backend.services.job_queue import JobQueue
 
 @router.post("/sync/misa")
-def sync_misa_data(background_tasks: BackgroundTasks, db: Session = Depends(get_db)):
+def sync_misa_data(db: Session = Depends(get_db)):
     """
-    Trigger FULL synchronization (All Master Data).
+    Trigger FULL synchronization (All Master Data) as a MISA_SYNC job.
     """
-    def run_sync_task(db_session: Session):
-        sync_service = SyncService(db_session)
-        print(">>> [SYNC FULL] Background Job Started...")
-        try:
-            sync_service.sync_all_master_data()
-            print("<<< [SYNC FULL] Completed successfully.")
-        except Exception as e:
-            print(f"!!! [SYNC FULL] Failed: {e}")
-
-    background_tasks.add_task(run_sync_task, db)
-    return {"status": "started", "message": "Full Sync started in background."}
+    return _submit_sync(db, 'MISA_SYNC', {"target": "all"}, "Full Sync")
 
 @router.post("/sync/crm")
-def sync_crm_data(background_tasks: BackgroundTasks, db: Session = Depends(get_db)):
+def sync_crm_data(db: Session = Depends(get_db)):
     """
-    Trigger CRM Inventory Sync.
+    Trigger CRM Inventory Sync as a CRM_INVENTORY_SYNC job.
     """
-    def run_crm_task(db_session: Session):
-        svc = SyncService(db_session)
-        print(">>> [SYNC CRM] Background Job Started...")
-        try:
-            svc.sync_crm_inventory()
-            print("<<< [SYNC CRM] Completed successfully.")
-        except Exception as e:
-            print(f"!!! [SYNC CRM] Failed: {e}")
+    return _submit_sync(db, 'CRM_INVENTORY_SYNC', {}, "CRM Sync")
 
-    background_tasks.add_task(run_crm_task, db)
-    return {"status": "started", "message": "CRM Sync started in background."}
+@router.post("/sync/cancel")
+def cancel_active_sync(db: Session = Depends(get_db)):
+    """
+    Cancel any queued or running background jobs (syncs, batch forecasts).
+    """
+    # Declared before /sync/{type} so "cancel" is not taken as a sync type
+    count = JobQueue(db).cancel_active()
+    return {"status": "success", "message": f"Requested cancellation for {count} jobs."}
 
 @router.post("/sync/{type}")
-def sync_specific_data(type: str, background_tasks: BackgroundTasks, db: Session = Depends(get_db)):
+def sync_specific_data(type: str, db: Session = Depends(get_db)):
     """
     Trigger Granular Sync: 'units', 'groups', 'warehouses', 'partners', 'products'
     """
     valid_types = ['units', 'groups', 'warehouses', 'partners', 'products']
     if type not in valid_types:
         raise HTTPException(status_code=400, detail=f"Invalid sync type. Must be one of {valid_types}")
+    return _submit_sync(db, 'MISA_SYNC', {"target": type}, f"Sync for '{type}'")
 
-    def run_granular_task(t: str, db_session: Session):
-        svc = SyncService(db_session)
-        print(f">>> [SYNC {t.upper()}] Background Job Started...")
-        try:
-            if t == 'units': svc.sync_units()
-            elif t == 'groups': svc.sync_product_groups()
-            elif t == 'warehouses': svc.sync_warehouses()
-            elif t == 'partners': svc.sync_customers_and_vendors()
-            elif t == 'products': svc.sync_products()
-            print(f"<<< [SYNC {t.upper()}] Completed successfully.")
-        except Exception as e:
-             print(f"!!! [SYNC {t.upper()}] Failed: {e}")
-
-    background_tasks.add_task(run_granular_task, type, db)
-    return {"status": "started", "message": f"Sync for '{type}' started in background."}
-
-@router.post("/sync/cancel")
-def cancel_active_sync(db: Session = Depends(get_db)):
-    """
-    Cancel any RUNNING sync jobs.
-    """
-    # Find all running logs
-    running_logs = db.query(SystemSyncLogs).filter(SystemSyncLogs.status == 'RUNNING').all()
-    count = 0
-    for log in running_logs:
-        log.status = 'CANCEL_REQUESTED'
-        count += 1
-    
-    db.commit()
-    return {"status": "success", "message": f"Requested cancellation for {count} jobs."}
+def _submit_sync(db: Session, job_type_name: str, params: dict, label: str):
+    # One job per sync target: a second click while it is queued/running returns the same job
+    job, created = JobQueue(db).submit(job_type_name, params)
+    if not created:
+        return {"status": "running", "job_id": job.job_id, "message": f"{label} already queued or running."}
+    return {"status": "started", "job_id": job.job_id, "message": f"{label} started in background."}
 
 from backend.models import DimUnits, DimProductGroups, DimWarehouses, PlanningDistributionProfile
 
@@ -2182,6 +2245,7 @@ def create_group(item: GroupCreate, db: Session = Depends(get_db)):
        raise HTTPException(status_code=400, detail="ID exists")
     new_item = DimProductGroups(group_id=item.group_id, group_name=item.group_name)
     db.add(new_item)
+    GroupClosure(db).move(item.group_id, None) # New root group
     db.commit()
     return new_item
 
@@ -2202,6 +2266,7 @@ def delete_group(id: str, db: Session = Depends(get_db)):
     db_item = db.query(DimProductGroups).filter(DimProductGroups.group_id == id).first()
     if not db_item: raise HTTPException(404, "Not found")
     db.delete(db_item)
+    GroupClosure(db).remove(id)
     db.commit()
     return {"message": "Deleted locally"}
 
@@ -2220,6 +2285,7 @@ def create_warehouse(item: WarehouseCreate, db: Session = Depends(get_db)):
     new_item = DimWarehouses(warehouse_id=item.warehouse_id, warehouse_name=item.warehouse_name, branch_id=item.branch_id)
     db.add(new_item)
     db.commit()
+    dimension_cache.invalidate(WAREHOUSES)
     return new_item
 
 @router.put("/warehouses/{id}")
@@ -2229,6 +2295,7 @@ def update_warehouse(id: str, item: WarehouseCreate, db: Session = Depends(get_d
     db_item.warehouse_name = item.warehouse_name
     if item.branch_id: db_item.branch_id = item.branch_id
     db.commit()
+    dimension_cache.invalidate(WAREHOUSES)
     return db_item
 
 @router.delete("/warehouses/{id}")
@@ -2241,6 +2308,7 @@ def delete_warehouse(id: str, db: Session = Depends(get_db)):
     if not db_item: raise HTTPException(404, "Not found")
     db.delete(db_item)
     db.commit()
+    dimension_cache.invalidate(WAREHOUSES)
     return {"message": "Deleted locally"}
 
 @router.get("/warehouses")
@@ -2261,7 +2329,7 @@ def get_warehouses(
 @router.get("/profiles")
 def get_profiles(db: Session = Depends(get_db)):
     """Fetch all available demand profiles (B2B, B2C, STD)"""
-    return db.query(PlanningDistributionProfile).filter(PlanningDistributionProfile.is_active == True).all()
+    return get_cached_profiles(db)
 
 
 
@@ -2365,22 +2433,16 @@ async def import_inventory_manual(
     type='full': Overwrites Original Quantity (Opening Stock)
     type='update': Updates 'quantity_update' field (Correction)
     """
-    contents = await file.read()
+    from backend.services.upload_reader import UploadReader, spool_upload
     filename = file.filename.lower()
     
     try:
-        if filename.endswith(('.xlsx')):
-            df = pd.read_excel(io.BytesIO(contents), engine='openpyxl')
-        elif filename.endswith(('.xls')):
-             df = pd.read_excel(io.BytesIO(contents), engine='xlrd')
-        elif filename.endswith('.csv'):
-             # Try UTF-8 Sig first
-            try:
-                df = pd.read_csv(io.BytesIO(contents), encoding='utf-8-sig')
-            except:
-                df = pd.read_csv(io.BytesIO(contents), encoding='latin1')
-        else:
+        if not filename.endswith(('.xlsx', '.xls', '.csv')):
             raise HTTPException(400, "Unsupported file format. Please use .xlsx or .csv")
+
+        # Spool to disk in chunks; CSV tries UTF-8 Sig first, then latin1
+        with UploadReader(await spool_upload(file), filename, csv_encodings=('utf-8-sig', 'latin1')) as reader:
+            df = reader.read_all()
             
         # Clean column names
         df.columns = [str(c).strip() for c in df.columns]
@@ -2444,9 +2506,24 @@ def get_crm_config(db: Session = Depends(get_db)):
         # Accounting V1
         "MISA_AMIS_ACT_APP_ID": get_val("MISA_AMIS_ACT_APP_ID"),
         "MISA_AMIS_ACT_ACCESS_CODE": get_val("MISA_AMIS_ACT_ACCESS_CODE"),
-        "MISA_AMIS_ACT_BASE_URL": get_val("MISA_AMIS_ACT_BASE_URL")
+        "MISA_AMIS_ACT_BASE_URL": get_val("MISA_AMIS_ACT_BASE_URL"),
+
+        # Dictionary sync tuning (pages fetched ahead, requests/second)
+        "MISA_SYNC_PREFETCH_PAGES": get_val("MISA_SYNC_PREFETCH_PAGES"),
+        "MISA_SYNC_MAX_RPS": get_val("MISA_SYNC_MAX_RPS"),
+        "MISA_CRM_SYNC_WORKERS": get_val("MISA_CRM_SYNC_WORKERS"),
+        "MISA_CRM_PAGE_SIZE": get_val("MISA_CRM_PAGE_SIZE")
     }
 
+@router.get("/crm/transport-stats")
+def get_misa_transport_stats():
+    """
+    Request/byte counters of the pooled MISA HTTP sessions (per base URL) since server start.
+    bytes_received = on the wire (gzip), bytes_decoded = after decompression.
+    """
+    from backend import misa_http
+    return misa_http.get_stats()
+
 @router.post("/crm/config")
 def save_crm_config(config: Dict[str, Any], db: Session = Depends(get_db)):
     """
@@ -2483,13 +2560,16 @@ def save_crm_config(config: Dict[str, Any], db: Session = Depends(get_db)):
         # 2. Handle Legacy Format
         legacy_keys = [
             "MISA_CRM_CLIENT_ID", "MISA_CRM_CLIENT_SECRET", 
-            "MISA_AMIS_ACT_APP_ID", "MISA_AMIS_ACT_ACCESS_CODE", "MISA_AMIS_ACT_BASE_URL"
+            "MISA_AMIS_ACT_APP_ID", "MISA_AMIS_ACT_ACCESS_CODE", "MISA_AMIS_ACT_BASE_URL",
+            "MISA_SYNC_PREFETCH_PAGES", "MISA_SYNC_MAX_RPS",
+            "MISA_CRM_SYNC_WORKERS", "MISA_CRM_PAGE_SIZE"
         ]
         for k in legacy_keys:
             if k in config:
                 upsert(k, config[k])
         
         db.commit()
+        dimension_cache.invalidate(CONFIG)
         return {"status": "success"}
     except Exception as e:
          db.rollback()
@@ -2510,7 +2590,9 @@ def reset_transaction_data(db: Session = Depends(get_db)):
             "Fact_Opening_Stock",
             "Fact_Inventory_Snapshots",
             "Fact_Sales",
+            "Fact_Sales_Daily",
             "Fact_Purchases",
+            "Fact_Purchases_Daily",
             "Fact_Forecasts",
             "System_Sync_Logs" 
         ]
@@ -2531,6 +2613,13 @@ def reset_transaction_data(db: Session = Depends(get_db)):
                 print(f"[RESET WARNING] Failed to clear {t}: {e}")
                 # Try fallback or ignore if table doesn't exist
                 pass
+
+        # Order plan snapshot: products stay, stock and forecasts are gone
+        from backend.services.order_plan import OrderPlanSnapshot
+        try:
+            OrderPlanSnapshot(db).refresh()
+        except Exception as e:
+            print(f"[RESET WARNING] Failed to refresh order plan: {e}")
                 
         db.commit()
         return {"message": "Transaction Data Reset Successfully"}
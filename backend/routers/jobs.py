@@ -0,0 +1,37 @@
+from fastapi import APIRouter, Depends, HTTPException
+from sqlalchemy.orm import Session
+from backend.database import get_db
+from backend.services.job_queue import JobQueue, job_to_dict, registered_job_types
+
+router = APIRouter(
+    prefix="/api/jobs",
+    tags=["Background Jobs"]
+)
+
+@router.get("")
+def list_jobs(status: str = None, job_type: str = None, limit: int = 50, db: Session = Depends(get_db)):
+    """
+    Recent background jobs, newest first. status: QUEUED, RUNNING, SUCCESS, ERROR, CANCELLED or ACTIVE (queued + running).
+    """
+    return [job_to_dict(j) for j in JobQueue(db).list(status=status, job_type_name=job_type, limit=limit)]
+
+@router.get("/types")
+def list_job_types():
+    """Registered job types and their default concurrency (config JOB_CONCURRENCY_<TYPE> overrides)."""
+    return {name: {"concurrency": concurrency} for name, concurrency in registered_job_types().items()}
+
+@router.get("/{job_id}")
+def get_job(job_id: int, db: Session = Depends(get_db)):
+    """Status and progress of one job."""
+    job = JobQueue(db).get(job_id)
+    if not job:
+        raise HTTPException(404, "Job not found")
+    return job_to_dict(job)
+
+@router.post("/{job_id}/cancel")
+def cancel_job(job_id: int, db: Session = Depends(get_db)):
+    """Cancel a queued job, or ask a running one to stop at its next checkpoint."""
+    job = JobQueue(db).cancel(job_id)
+    if not job:
+        raise HTTPException(404, "Job not found")
+    return job_to_dict(job)
@@ -1,6 +1,6 @@
 from fastapi import APIRouter, Depends, HTTPException, Body, UploadFile, File
 from sqlalchemy.orm import Session
-from sqlalchemy import desc
+from sqlalchemy import desc, func, and_
 from typing import Dict, Any, List
 import pandas as pd
 from datetime import date, datetime
@@ -9,7 +9,12 @@ from pydantic import BaseModel
 from backend.database import get_db
 from backend.services.planning_engine import PlanningEngine
 from backend.services.forecasting import ForecastingEngine
-from backend.models import FactRollingInventory
+from backend.services.job_queue import JobQueue, job_to_dict
+from backend.services.forecast_models import MODELS as FORECAST_MODELS
+from backend.services.group_closure import GroupClosure
+from backend.services.dimension_cache import get_profiles
+from backend.services.export_writer import export_response, stream_query
+from backend.models import FactRollingInventory, FactForecasts, DimProducts
 
 router = APIRouter(
     prefix="/api/planning",
@@ -34,13 +39,18 @@ def calculate_safety_stock_endpoint(db: Session = Depends(get_db)):
         raise HTTPException(status_code=500, detail=str(e))
 
 @router.post("/generate-plans")
-def generate_plans_endpoint(db: Session = Depends(get_db)):
+def generate_plans_endpoint(
+    group_id: str = Body(None, embed=True), # Optional scope: only this group subtree's drafts are replaced
+    warehouse_id: str = Body(None, embed=True),
+    profile_id: str = Body(None, embed=True),
+    db: Session = Depends(get_db)
+):
     """
     Generate Purchase Plans based on current Net Requirements and Constraints.
     """
     engine = PlanningEngine(db)
     try:
-        result = engine.generate_purchase_plans()
+        result = engine.generate_purchase_plans(group_id=group_id, warehouse_id=warehouse_id, profile_id=profile_id)
         return result
     except Exception as e:
         raise HTTPException(status_code=500, detail=str(e))
@@ -68,6 +78,59 @@ def generate_forecast(
     except Exception as e:
         raise HTTPException(status_code=500, detail=str(e))
 
+@router.post("/forecast/refresh")
+def refresh_forecasts(
+    model: str = Body(None, embed=True), # Default: config FORECAST_MODEL (SMA)
+    periods: int = Body(30, embed=True),
+    full: bool = Body(False, embed=True), # Rebuild the state from full history
+    db: Session = Depends(get_db)
+):
+    """
+    Incremental forecast refresh: only SKUs with sales since the last refresh are re-forecast.
+    """
+    engine = ForecastingEngine(db)
+    try:
+        return engine.update_forecasts(model, periods, full=full)
+    except ValueError as e:
+        raise HTTPException(400, str(e))
+    except Exception as e:
+        db.rollback()
+        raise HTTPException(status_code=500, detail=str(e))
+
+@router.post("/forecast/all")
+def generate_forecast_all(
+    model: str = Body("SMA", embed=True),
+    periods: int = Body(30, embed=True),
+    workers: int = Body(None, embed=True), # Process-pool size (default: config FORECAST_WORKERS, 0 = all cores)
+    db: Session = Depends(get_db)
+):
+    """
+    Forecast every SKU in one batch (FORECAST_ALL job).
+    Poll GET /forecast/all/{job_id} (or /api/jobs/{job_id}); POST /api/jobs/{job_id}/cancel stops it.
+    """
+    if model not in FORECAST_MODELS:
+        raise HTTPException(400, f"model must be one of {list(FORECAST_MODELS)}")
+    if periods < 1 or periods > 365:
+        raise HTTPException(400, "periods must be between 1 and 365")
+
+    # Single-flight across models: every run rewrites today's Fact_Forecasts
+    job, created = JobQueue(db).submit(
+        'FORECAST_ALL', {"model": model, "periods": periods, "workers": workers}, dedup_key='FORECAST_ALL'
+    )
+    if not created:
+        return {"status": "running", "job_id": job.job_id, "message": "Batch forecast already queued or running."}
+    return {"status": "started", "job_id": job.job_id, "message": "Batch forecast queued."}
+
+@router.get("/forecast/all/{job_id}")
+def get_forecast_all_status(job_id: int, db: Session = Depends(get_db)):
+    """
+    Progress of a batch forecast job: SKUs written / total and the current stage.
+    """
+    job = JobQueue(db).get(job_id)
+    if not job or job.job_type != 'FORECAST_ALL':
+        raise HTTPException(404, "Job not found")
+    return job_to_dict(job)
+
 @router.get("/forecast/data")
 def get_forecast_data_query(
     sku_id: str = None, 
@@ -94,48 +157,49 @@ def export_forecast_excel(
     sku_id: str = None, 
     group_id: str = None,
     scope: str = "product",
+    format: str = "xlsx",
     db: Session = Depends(get_db)
 ):
     """
-    Export Forecast Data to Excel.
+    Export Forecast Data to Excel (or CSV with format=csv).
+    scope: 'product' / 'group' (actual vs forecast series of one SKU / group)
+           or 'all' (latest forecast run of every SKU, optionally within group_id, streamed)
     """
-    import io
-    import pandas as pd
-    from fastapi.responses import StreamingResponse
-    
-    engine = ForecastingEngine(db)
-    data = []
-    filename = "forecast.xlsx"
-    
+    if scope == 'all':
+        def rows(session):
+            latest = session.query(
+                FactForecasts.sku_id, func.max(FactForecasts.run_date).label('run_date')
+            ).group_by(FactForecasts.sku_id).subquery()
+            query = session.query(
+                FactForecasts.sku_id, DimProducts.product_name, FactForecasts.forecast_date,
+                FactForecasts.quantity_predicted, FactForecasts.confidence_lower, FactForecasts.confidence_upper,
+                FactForecasts.model_used, FactForecasts.run_date
+            ).join(latest, and_(
+                FactForecasts.sku_id == latest.c.sku_id, FactForecasts.run_date == latest.c.run_date
+            )).outerjoin(DimProducts, FactForecasts.sku_id == DimProducts.sku_id)
+            if group_id and group_id != 'ALL':
+                query = query.filter(GroupClosure(session).filter(DimProducts.group_id, group_id))
+            return stream_query(query.order_by(FactForecasts.sku_id, FactForecasts.forecast_date))
+
+        headers = ["Mã SKU", "Tên Hàng", "Ngày (Date)", "Dự báo (Forecast)", "Cận dưới (Lower)", "Cận trên (Upper)", "Mô hình (Model)", "Ngày chạy (Run Date)"]
+        return export_response(headers, rows, "forecast_all", format, sheet_name='Forecast Data')
+
     if scope == 'group':
         if not group_id: raise HTTPException(400, "group_id required")
-        data = engine.get_group_forecast_vs_actual(group_id)
-        filename = f"forecast_group_{group_id}.xlsx"
+        filename = f"forecast_group_{group_id}"
+        series = lambda session: ForecastingEngine(session).get_group_forecast_vs_actual(group_id)
     else:
         if not sku_id: raise HTTPException(400, "sku_id required")
-        data = engine.get_forecast_vs_actual(sku_id)
-        filename = f"forecast_product_{sku_id}.xlsx"
-        
-    # Convert to DataFrame
-    df = pd.DataFrame(data)
-    # Rename columns for localized output
-    df = df.rename(columns={
-        "date": "Ngày (Date)",
-        "actual": "Thực tế (Actual)",
-        "forecast": "Dự báo (Forecast)"
-    })
-    
-    stream = io.BytesIO()
-    with pd.ExcelWriter(stream, engine='openpyxl') as writer:
-        df.to_excel(writer, index=False, sheet_name='Forecast Data')
-        
-    stream.seek(0)
-    
-    return StreamingResponse(
-        stream, 
-        media_type="application/vnd.openxmlformats-officedocument.spreadsheetml.sheet", 
-        headers={"Content-Disposition": f"attachment; filename={filename}"}
-    )
+        filename = f"forecast_product_{sku_id}"
+        series = lambda session: ForecastingEngine(session).get_forecast_vs_actual(sku_id)
+
+    def rows(session):
+        for point in series(session):
+            yield [point.get("date"), point.get("actual"), point.get("forecast")]
+
+    # Localized column titles
+    headers = ["Ngày (Date)", "Thực tế (Actual)", "Dự báo (Forecast)"]
+    return export_response(headers, rows, filename, format, sheet_name='Forecast Data')
 
 # CONFLICT: Moved to planning_rolling.py
 # @router.get("/rolling/matrix")
@@ -159,8 +223,7 @@ def export_forecast_excel(
 @router.get("/rolling/profiles")
 def get_planning_profiles(db: Session = Depends(get_db)):
     """Fetch profiles for Rolling Inventory Filters"""
-    from backend.models import PlanningDistributionProfile
-    return db.query(PlanningDistributionProfile).filter(PlanningDistributionProfile.is_active == True).all()
+    return get_profiles(db)
 
 @router.get("/forecast/{sku_id}")
 def get_forecast_data_legacy(sku_id: str, db: Session = Depends(get_db)):
@@ -279,37 +342,19 @@ class RollingUpdateItem(BaseModel):
 @router.post("/rolling/update")
 def update_rolling_forecast(
     updates: List[RollingUpdateItem],
+    profile_id: str = 'STD',
     db: Session = Depends(get_db)
 ):
     """
-    Bulk update planned_supply in Rolling Matrix.
+    Bulk update planned_supply in Rolling Matrix (one bulk upsert, recompute deferred to the
+    auto-calculation). See POST /api/planning/rolling/edits for the full edit-session API.
     """
+    from backend.services.rolling_edits import RollingEditSession
+    session = RollingEditSession(db, profile_id)
     try:
-        count = 0
-        for item in updates:
-            rec = db.query(FactRollingInventory).filter(
-                FactRollingInventory.sku_id == item.sku_id,
-                FactRollingInventory.warehouse_id == item.warehouse_id,
-                FactRollingInventory.bucket_date == item.bucket_date
-            ).first()
-            if rec:
-                rec.planned_supply = item.planned_supply
-                rec.updated_at = datetime.now()
-                count += 1
-            else:
-                # Upsert if missing (rare but possible)
-                rec = FactRollingInventory(
-                    sku_id=item.sku_id,
-                    warehouse_id=item.warehouse_id,
-                    bucket_date=item.bucket_date,
-                    planned_supply=item.planned_supply,
-                    updated_at=datetime.now()
-                )
-                db.add(rec)
-                count += 1
-        
-        db.commit()
-        return {"status": "success", "updated": count}
+        earliest = session.apply(item.model_dump() for item in updates)
+        session.recompute(earliest, defer=True)
+        return {"status": "success", "updated": len(updates)}
     except Exception as e:
         db.rollback()
         raise HTTPException(status_code=500, detail=str(e))
@@ -319,6 +364,7 @@ class RollingOpeningUpdate(BaseModel):
     warehouse_id: str
     bucket_date: date
     opening_stock: float
+    profile_id: str = 'STD'
 
 @router.post("/rolling/update-opening")
 def update_rolling_opening(
@@ -326,41 +372,15 @@ def update_rolling_opening(
     db: Session = Depends(get_db)
 ):
     """
-    Update Opening Stock Manually and Recalculate.
+    Update Opening Stock Manually and Recalculate (this SKU only; the manual opening is kept by later runs).
     """
+    from backend.services.rolling_edits import RollingEditSession
+    session = RollingEditSession(db, update.profile_id)
     try:
-        # 1. Update DB
-        rec = db.query(FactRollingInventory).filter(
-            FactRollingInventory.sku_id == update.sku_id,
-            FactRollingInventory.warehouse_id == update.warehouse_id,
-            FactRollingInventory.bucket_date == update.bucket_date
-        ).first()
-        
-        if rec:
-            rec.opening_stock = update.opening_stock
-            rec.is_manual_opening = True
-            rec.updated_at = datetime.now()
-        else:
-            rec = FactRollingInventory(
-                sku_id=update.sku_id,
-                warehouse_id=update.warehouse_id,
-                bucket_date=update.bucket_date,
-                opening_stock=update.opening_stock,
-                is_manual_opening=True,
-                status='OK'
-            )
-            db.add(rec)
-        
-        db.commit()
-        
-        # 2. Trigger Re-Calculation for this SKU
-        # This ensures the new opening stock propagates to closing and next months
-        from backend.services.rolling_calc import RollingPlanningEngine
-        engine = RollingPlanningEngine(db)
-        engine.run_rolling_calculation(sku_list=[update.sku_id], horizon_months=12) # Recalc localized
-        
-        return {"status": "success", "message": "Opening stock updated and plan recalculated."}
-        
+        earliest = session.apply([update.model_dump()])
+        recompute = session.recompute(earliest)
+        message = "Opening stock updated and plan recalculated." if recompute == 'done' else "Opening stock updated; recalculation queued."
+        return {"status": "success", "message": message}
     except Exception as e:
         db.rollback()
         raise HTTPException(status_code=500, detail=str(e))
@@ -390,7 +410,7 @@ def get_plans(
             query = query.filter(FactPurchasePlans.sku_id.ilike(st))
             
         if group_id and group_id != "ALL":
-            query = query.filter(DimProducts.group_id == group_id)
+            query = query.filter(GroupClosure(db).filter(DimProducts.group_id, group_id))
             
         total = query.count()
         plans = query.order_by(desc(FactPurchasePlans.created_at)).offset(skip).limit(limit).all()
@@ -423,54 +443,31 @@ def export_plans_excel(
     pending_only: bool = False,
     search: str = None,
     group_id: str = None,
+    format: str = "xlsx",
     db: Session = Depends(get_db)
 ):
     """
-    Export Purchase Plans to Excel.
+    Export Purchase Plans to Excel (or CSV with format=csv), streamed.
     """
-    import io
-    import pandas as pd
-    from fastapi.responses import StreamingResponse
-    
-    query = db.query(
-        FactPurchasePlans.plan_date,
-        FactPurchasePlans.sku_id,
-        DimProducts.product_name,
-        FactPurchasePlans.suggested_quantity,
-        FactPurchasePlans.final_quantity,
-        FactPurchasePlans.status,
-        FactPurchasePlans.notes
-    ).join(DimProducts, FactPurchasePlans.sku_id == DimProducts.sku_id)
-    
-    if pending_only:
-        query = query.filter(FactPurchasePlans.status != 'APPROVED')
-    if search:
-        query = query.filter(FactPurchasePlans.sku_id.ilike(f"%{search}%"))
-    if group_id and group_id != "ALL":
-        query = query.filter(DimProducts.group_id == group_id)
-        
-    results = query.order_by(desc(FactPurchasePlans.created_at)).all()
-    
-    data = []
-    for r in results:
-        data.append({
-            "Ngày (Date)": r.plan_date,
-            "Mã SKU": r.sku_id,
-            "Tên Hàng": r.product_name,
-            "Đề xuất (Suggested)": r.suggested_quantity,
-            "Chốt (Final)": r.final_quantity,
-            "Trạng thái": r.status,
-            "Ghi chú": r.notes
-        })
-        
-    df = pd.DataFrame(data)
-    stream = io.BytesIO()
-    with pd.ExcelWriter(stream, engine='openpyxl') as writer:
-        df.to_excel(writer, index=False, sheet_name='Purchase Plans')
-        
-    stream.seek(0)
-    return StreamingResponse(
-        stream, 
-        media_type="application/vnd.openxmlformats-officedocument.spreadsheetml.sheet", 
-        headers={"Content-Disposition": "attachment; filename=purchase_plans.xlsx"}
-    )
+    def rows(session):
+        query = session.query(
+            FactPurchasePlans.plan_date,
+            FactPurchasePlans.sku_id,
+            DimProducts.product_name,
+            FactPurchasePlans.suggested_quantity,
+            FactPurchasePlans.final_quantity,
+            FactPurchasePlans.status,
+            FactPurchasePlans.notes
+        ).join(DimProducts, FactPurchasePlans.sku_id == DimProducts.sku_id)
+
+        if pending_only:
+            query = query.filter(FactPurchasePlans.status != 'APPROVED')
+        if search:
+            query = query.filter(FactPurchasePlans.sku_id.ilike(f"%{search}%"))
+        if group_id and group_id != "ALL":
+            query = query.filter(GroupClosure(session).filter(DimProducts.group_id, group_id))
+
+        return stream_query(query.order_by(desc(FactPurchasePlans.created_at)))
+
+    headers = ["Ngày (Date)", "Mã SKU", "Tên Hàng", "Đề xuất (Suggested)", "Chốt (Final)", "Trạng thái", "Ghi chú"]
+    return export_response(headers, rows, "purchase_plans", format, sheet_name='Purchase Plans')
@@ -3,6 +3,10 @@ from fastapi import APIRouter, Depends, HTTPException, Query, File, UploadFile
 from sqlalchemy.orm import Session
 from backend.database import get_db
 from backend.services.rolling_calc import RollingPlanningEngine
+from backend.services.job_queue import JobQueue
+from backend.services.group_closure import GroupClosure
+from backend.services.dimension_cache import dimension_cache, get_profiles, get_policies, get_warehouses as get_cached_warehouses, POLICIES
+from backend.services.export_writer import export_response, stream_query
 from backend.models import FactRollingInventory, DimProducts, PlanningDistributionProfile
 from typing import List, Optional
 from pydantic import BaseModel
@@ -16,10 +20,11 @@ router = APIRouter(
 class RunCalcRequest(BaseModel):
     horizon_months: int = 12
     sku_ids: Optional[List[str]] = None
-    profile_id: str = 'STD'
+    profile_id: str = 'STD' # 'ALL' = every active profile, calculated in parallel
     group_id: Optional[str] = 'ALL'
     warehouse_id: Optional[str] = 'ALL'
     run_date: Optional[date] = None
+    engine_mode: Optional[str] = None # None = SQL for full runs / Python for SKU lists, 'vectorized' = NumPy engine
 
 @router.get("/products/search")
 def search_products(q: str, limit: int = 20, db: Session = Depends(get_db)):
@@ -35,69 +40,42 @@ def search_products(q: str, limit: int = 20, db: Session = Depends(get_db)):
 
 @router.get("/profiles")
 def get_planning_profiles(db: Session = Depends(get_db)):
-    return db.query(PlanningDistributionProfile).filter_by(is_active=True).all()
+    return get_profiles(db)
 
 @router.get("/warehouses")
 def get_warehouses(db: Session = Depends(get_db)):
-    from backend.models import DimWarehouses
-    return db.query(DimWarehouses).all()
+    return get_cached_warehouses(db)
 
 @router.post("/run")
 def run_rolling_calculation(req: RunCalcRequest, db: Session = Depends(get_db)):
-    engine = RollingPlanningEngine(db)
+    """
+    Queue a rolling calculation (ROLLING_RUN job). An identical run already queued/running is
+    returned instead of starting a second one. Poll GET /api/jobs/{job_id}.
+    """
+    params = {
+        "sku_ids": req.sku_ids, "horizon_months": req.horizon_months, "profile_id": req.profile_id,
+        "group_id": req.group_id, "warehouse_id": req.warehouse_id, "engine_mode": req.engine_mode,
+        "run_date": req.run_date.isoformat() if req.run_date else None
+    }
     try:
-        engine.run_rolling_calculation(sku_list=req.sku_ids, horizon_months=req.horizon_months, profile_id=req.profile_id, group_id=req.group_id, warehouse_id=req.warehouse_id, run_date=req.run_date)
-        return {"status": "success", "message": f"Calculation run with Profile {req.profile_id}"}
+        job, created = JobQueue(db).submit('ROLLING_RUN', params)
     except Exception as e:
         raise HTTPException(status_code=500, detail=str(e))
+    return {
+        "status": "started" if created else "running",
+        "job_id": job.job_id,
+        "message": f"Calculation queued with Profile {req.profile_id}" if created else "Same calculation already queued or running."
+    }
 
-# --- Helper for Recursive Groups ---
-def get_recursive_group_ids(db: Session, group_id: str) -> List[str]:
-    """
-    Recursively fetch all child group IDs for a given group_id.
-    Returns a list including the parent group_id itself.
-    """
-    from backend.models import DimProductGroups
-    all_group_ids = [group_id]
-    
-    # Simple stack-based traversal to avoid deep recursion limit if hierarchy is deep
-    stack = [group_id]
-    visited = set([group_id])
-    
-    while stack:
-        curr = stack.pop()
-        children = db.query(DimProductGroups.group_id).filter(DimProductGroups.parent_id == curr).all()
-        for c in children:
-            cid = c[0]
-            if cid not in visited:
-                visited.add(cid)
-                all_group_ids.append(cid)
-                stack.append(cid)
-                
-    return all_group_ids
-
-@router.get("/matrix")
-def get_rolling_matrix(
-    category: Optional[str] = None,
-    page: int = 1,
-    limit: int = 20,
-    warehouse_id: Optional[str] = None,
-    profile_id: str = 'STD',
-    group_id: Optional[str] = None,
-    search: Optional[str] = None,
-    sku_ids: Optional[str] = None, # New: Comma separated list
-    db: Session = Depends(get_db)
-):
-    # 1. Base Query for SKUs (Distinct)
-    sku_query = db.query(DimProducts.sku_id)
-    
+def filter_matrix_skus(db: Session, sku_query, category=None, group_id=None, sku_ids=None, search=None):
+    """Shared SKU filters of the rolling matrix endpoints (category, recursive group, SKU list, search)."""
     if category and category != 'ALL':
         sku_query = sku_query.filter(DimProducts.category == category)
         
     if group_id and group_id != 'ALL':
-        # Recursive Filter
-        target_groups = get_recursive_group_ids(db, group_id)
-        sku_query = sku_query.filter((DimProducts.group_id.in_(target_groups)) | (DimProducts.category.in_(target_groups)))
+        # Recursive Filter (closure table)
+        closure = GroupClosure(db)
+        sku_query = sku_query.filter(closure.filter(DimProducts.group_id, group_id) | closure.filter(DimProducts.category, group_id))
 
     if sku_ids:
         # Filter by specific list of SKUs
@@ -113,6 +91,22 @@ def get_rolling_matrix(
             (DimProducts.sku_id.ilike(search_term)) | 
             (DimProducts.product_name.ilike(search_term))
         )
+    return sku_query
+
+@router.get("/matrix")
+def get_rolling_matrix(
+    category: Optional[str] = None,
+    page: int = 1,
+    limit: int = 20,
+    warehouse_id: Optional[str] = None,
+    profile_id: str = 'STD',
+    group_id: Optional[str] = None,
+    search: Optional[str] = None,
+    sku_ids: Optional[str] = None, # New: Comma separated list
+    db: Session = Depends(get_db)
+):
+    # 1. Base Query for SKUs (Distinct)
+    sku_query = filter_matrix_skus(db, db.query(DimProducts.sku_id), category, group_id, sku_ids, search)
 
     # Total Count
     total_items = sku_query.distinct().count()
@@ -186,12 +180,207 @@ def get_rolling_matrix(
         "total_pages": (total_items + limit - 1) // limit
     }
 
+MATRIX_METRICS = {
+    "opening_stock": FactRollingInventory.opening_stock,
+    "forecast": FactRollingInventory.forecast_demand,
+    "incoming": FactRollingInventory.incoming_supply,
+    "planned": FactRollingInventory.planned_supply,
+    "closing": FactRollingInventory.closing_stock,
+    "net_req": FactRollingInventory.net_requirement,
+    "min_stock": FactRollingInventory.min_stock_policy,
+    "status": FactRollingInventory.status
+}
+
+@router.get("/matrix/pivot")
+def get_rolling_matrix_pivot(
+    cursor: Optional[str] = None, # sku_id of the last row of the previous page
+    limit: int = Query(50, ge=1, le=1000),
+    include_total: bool = False,
+    category: Optional[str] = None,
+    warehouse_id: str = 'ALL',
+    profile_id: str = 'STD',
+    group_id: Optional[str] = None,
+    search: Optional[str] = None,
+    sku_ids: Optional[str] = None, # Comma separated list
+    db: Session = Depends(get_db)
+):
+    """
+    Keyset-paginated rolling matrix, pivoted on the server.
+    - Pages by sku_id > cursor (index seek, same cost for page 1 and page 500; no OFFSET)
+    - bucket_dates are sent once; each SKU carries one array per metric aligned to them (null = no row)
+    - total is only counted when include_total=true (first page)
+    """
+    # 1. Page of SKUs (limit + 1 to know if there is a next page)
+    sku_query = filter_matrix_skus(
+        db, db.query(DimProducts.sku_id, DimProducts.product_name, DimProducts.category, DimProducts.group_id),
+        category, group_id, sku_ids, search
+    )
+    total_items = sku_query.count() if include_total else None
+
+    if cursor:
+        sku_query = sku_query.filter(DimProducts.sku_id > cursor)
+    products = sku_query.order_by(DimProducts.sku_id).limit(limit + 1).all()
+    has_more = len(products) > limit
+    products = products[:limit]
+
+    if not products:
+        return {"bucket_dates": [], "data": [], "next_cursor": None, "has_more": False, "total": total_items, "limit": limit}
+
+    # 2. Rolling rows of the page (one row per sku x bucket for the chosen warehouse/profile)
+    page_skus = [p.sku_id for p in products]
+    rows = db.query(
+        FactRollingInventory.sku_id,
+        FactRollingInventory.bucket_date,
+        *MATRIX_METRICS.values()
+    ).filter(
+        FactRollingInventory.profile_id == profile_id,
+        FactRollingInventory.warehouse_id == warehouse_id,
+        FactRollingInventory.sku_id.in_(page_skus)
+    ).all()
+
+    # 3. Pivot: bucket axis shared by the page, metric arrays per SKU
+    bucket_dates = sorted({r.bucket_date for r in rows})
+    bucket_pos = {d: i for i, d in enumerate(bucket_dates)}
+    n = len(bucket_dates)
+
+    data = []
+    by_sku = {}
+    for p in products:
+        entry = {"sku_id": p.sku_id, "product_name": p.product_name, "category": p.category, "group_id": p.group_id}
+        entry.update({metric: [None] * n for metric in MATRIX_METRICS})
+        by_sku[p.sku_id] = entry
+        data.append(entry)
+
+    metric_names = list(MATRIX_METRICS)
+    for r in rows:
+        entry = by_sku[r.sku_id]
+        i = bucket_pos[r.bucket_date]
+        for j, metric in enumerate(metric_names):
+            entry[metric][i] = r[j + 2]
+
+    return {
+        "bucket_dates": bucket_dates,
+        "data": data,
+        "next_cursor": page_skus[-1] if has_more else None,
+        "has_more": has_more,
+        "total": total_items,
+        "limit": limit
+    }
+
+# Column titles of the matrix export ("YYYY-MM-DD (Planned)" is what /import/matrix reads back)
+MATRIX_EXPORT_LABELS = {
+    "opening_stock": "Opening",
+    "forecast": "Forecast",
+    "incoming": "Incoming",
+    "planned": "Planned",
+    "closing": "Closing",
+    "net_req": "Net Req",
+    "min_stock": "Min Stock"
+}
+
+@router.get("/matrix/export")
+def export_rolling_matrix(
+    category: Optional[str] = None,
+    warehouse_id: str = 'ALL',
+    profile_id: str = 'STD',
+    group_id: Optional[str] = None,
+    search: Optional[str] = None,
+    sku_ids: Optional[str] = None, # Comma separated list
+    metrics: Optional[str] = None, # Comma separated MATRIX_EXPORT_LABELS keys (default: all)
+    format: str = 'xlsx',
+    db: Session = Depends(get_db)
+):
+    """
+    Full rolling matrix (every SKU matching the filters x every bucket) as Excel/CSV.
+    One row per SKU, one column per bucket x metric. Rows are read with yield_per in
+    (sku_id, bucket_date) order and written one SKU at a time, so memory stays flat
+    whatever the number of SKUs.
+    """
+    selected = [m.strip() for m in metrics.split(',') if m.strip()] if metrics else list(MATRIX_EXPORT_LABELS)
+    unknown = [m for m in selected if m not in MATRIX_EXPORT_LABELS]
+    if unknown or not selected:
+        raise HTTPException(400, f"Unknown metrics: {', '.join(unknown)} (expected {', '.join(MATRIX_EXPORT_LABELS)})")
+    width = len(selected)
+    buckets = []
+
+    def scope(query):
+        return query.filter(
+            FactRollingInventory.profile_id == profile_id,
+            FactRollingInventory.warehouse_id == warehouse_id
+        )
+
+    def headers(session):
+        # 1. Bucket axis (shared by every row)
+        buckets.extend(r[0] for r in scope(session.query(FactRollingInventory.bucket_date)).distinct().order_by(FactRollingInventory.bucket_date))
+        return ["SKU", "Product Name", "Category"] + [
+            f"{d.strftime('%Y-%m-%d')} ({MATRIX_EXPORT_LABELS[m]})" for d in buckets for m in selected
+        ]
+
+    def rows(session):
+        # 2. Stream rolling rows and pivot them one SKU at a time
+        bucket_pos = {d: i for i, d in enumerate(buckets)}
+        query = filter_matrix_skus(session, scope(session.query(
+            FactRollingInventory.sku_id,
+            DimProducts.product_name,
+            DimProducts.category,
+            FactRollingInventory.bucket_date,
+            *(MATRIX_METRICS[m] for m in selected)
+        ).join(DimProducts, FactRollingInventory.sku_id == DimProducts.sku_id)), category, group_id, sku_ids, search)
+
+        row, current = None, None
+        for r in stream_query(query.order_by(FactRollingInventory.sku_id, FactRollingInventory.bucket_date)):
+            if r[0] != current:
+                if row is not None:
+                    yield row
+                current = r[0]
+                row = [r[0], r[1], r[2]] + [None] * (len(buckets) * width)
+            i = bucket_pos.get(r[3])
+            if i is None:
+                continue # Bucket written after the header was built
+            row[3 + i * width:3 + (i + 1) * width] = r[4:]
+        if row is not None:
+            yield row
+
+    return export_response(headers, rows, f"rolling_matrix_{profile_id}_{warehouse_id}", format, sheet_name='Rolling Matrix')
+
+class RollingCellEdit(BaseModel):
+    sku_id: str
+    bucket_date: date
+    warehouse_id: Optional[str] = None # Defaults to the session's warehouse
+    planned_supply: Optional[float] = None
+    opening_stock: Optional[float] = None
+
+class RollingEditSessionRequest(BaseModel):
+    profile_id: str = 'STD'
+    warehouse_id: str = 'ALL'
+    edits: List[RollingCellEdit]
+    defer_recompute: bool = False # True: leave the recompute to the debounced auto-calculation
+
+@router.post("/edits")
+def commit_rolling_edits(req: RollingEditSessionRequest, db: Session = Depends(get_db)):
+    """
+    Commit a batch of matrix cell edits (planned supply / opening stock) in one request:
+    one bulk upsert, then one recompute of the affected SKUs. Edited cells are flagged manual
+    and keep their values through later recalculations (incremental and full).
+    """
+    from backend.services.rolling_edits import RollingEditSession
+    session = RollingEditSession(db, req.profile_id)
+    try:
+        earliest = session.apply(
+            {**e.model_dump(), "warehouse_id": e.warehouse_id or req.warehouse_id} for e in req.edits
+        )
+        recompute = session.recompute(earliest, defer=req.defer_recompute)
+    except Exception as e:
+        db.rollback()
+        raise HTTPException(status_code=500, detail=str(e))
+    return {"status": "success", "cells": len(req.edits), "skus": len(earliest), "recompute": recompute}
+
 from backend.models import PlanningPolicies
 
 @router.get("/policies")
 def get_planning_policies(db: Session = Depends(get_db)):
     """Fetch all planning policies"""
-    return db.query(PlanningPolicies).all()
+    return get_policies(db)
 
 class UpdatePolicyRequest(BaseModel):
     safety_stock_days: int
@@ -207,6 +396,7 @@ def update_planning_policy(policy_id: int, req: UpdatePolicyRequest, db: Session
     policy.safety_stock_days = req.safety_stock_days
     policy.service_level_target = req.service_level_target
     db.commit()
+    dimension_cache.invalidate(POLICIES)
     
 @router.post("/import/matrix")
 async def import_rolling_matrix(
@@ -215,65 +405,30 @@ async def import_rolling_matrix(
     warehouse_id: str = 'ALL',
     db: Session = Depends(get_db)
 ):
-    import pandas as pd
-    import io
-    from datetime import datetime
-    
+    """
+    Update planned supply from a matrix sheet (SKU column + "YYYY-MM-DD (Planned)" columns,
+    the layout of /matrix/export). Staged and applied set-based (services.rolling_matrix_import);
+    keys without a rolling row are reported in bulk.
+    """
+    from backend.services.upload_reader import UploadReader, spool_upload
+    from backend.services.rolling_matrix_import import RollingMatrixImport
+
     try:
-        contents = await file.read()
-        df = pd.read_excel(io.BytesIO(contents))
-        
-        # 1. Identifier Column
-        sku_col = next((c for c in df.columns if str(c).lower() in ['sku', 'sku_id', 'product code']), None)
-        if not sku_col:
-            raise HTTPException(400, "Could not find 'SKU' column.")
-            
-        count = 0
-        errors = []
-        
-        # 2. Iterate Rows
-        for _, row in df.iterrows():
-            sku = str(row[sku_col]).strip()
-            if not sku or sku.lower() == 'nan': continue
-            
-            # 3. Iterate Columns for Dates
-            for col in df.columns:
-                col_str = str(col).strip()
-                
-                # Check format "YYYY-MM-DD (Planned)"
-                if "(Planned)" in col_str:
-                    date_part = col_str.replace("(Planned)", "").strip()
-                    try:
-                        bucket_date = datetime.strptime(date_part, "%Y-%m-%d").date()
-                        val = row[col]
-                        
-                        # Update DB
-                        # Note: We need to find the specific record.
-                        # Ideally, we should batch these updates or use a merge statement.
-                        # For MVP, row-by-row is okay for reasonable sizes (<50k cells).
-                        
-                        if pd.notna(val):
-                            planned_qty = float(val)
-                            
-                            record = db.query(FactRollingInventory).filter(
-                                FactRollingInventory.sku_id == sku,
-                                FactRollingInventory.bucket_date == bucket_date,
-                                FactRollingInventory.profile_id == profile_id,
-                                FactRollingInventory.warehouse_id == warehouse_id
-                            ).first()
-                            
-                            if record:
-                                record.planned_supply = planned_qty
-                                record.updated_at = datetime.now()
-                                count += 1
-                                
-                    except ValueError:
-                        continue # Not a date column
-                    except Exception as e:
-                        errors.append(f"SKU {sku} col {col}: {str(e)}")
-                        
-        db.commit()
-        return {"status": "success", "message": f"Updated {count} planned supply records.", "errors": errors[:10]}
-        
+        with UploadReader(await spool_upload(file), file.filename) as reader:
+            result = RollingMatrixImport(db).run(reader.iter_batches(), profile_id, warehouse_id)
+    except ValueError as e:
+        raise HTTPException(400, str(e))
     except Exception as e:
         raise HTTPException(500, f"Import Failed: {str(e)}")
+
+    message = f"Updated {result['updated']} planned supply records."
+    if result["unmatched_count"]:
+        message += f" {result['unmatched_count']} SKU/bucket cells have no rolling row (run the calculation first)."
+    return {
+        "status": "success",
+        "message": message,
+        "updated": result["updated"],
+        "unmatched_count": result["unmatched_count"],
+        "unmatched": result["unmatched"],
+        "errors": result["errors"][:10]
+    }
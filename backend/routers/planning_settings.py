@@ -2,6 +2,8 @@ from fastapi import APIRouter, Depends, HTTPException, Body
 from sqlalchemy.orm import Session
 from backend.database import get_db
 from backend.models import SeasonalFactors
+from backend.services.dimension_cache import dimension_cache, get_seasonal_factors as get_cached_seasonal_factors, SEASONAL
+from backend.services.order_plan import OrderPlanSnapshot
 from typing import List
 from pydantic import BaseModel
 
@@ -19,7 +21,7 @@ class SeasonalFactorUpdate(BaseModel):
 
 @router.get("/seasonal")
 def get_seasonal_factors(db: Session = Depends(get_db)):
-    return db.query(SeasonalFactors).order_by(SeasonalFactors.month).all()
+    return get_cached_seasonal_factors(db)
 
 @router.put("/seasonal/update")
 def update_seasonal_factors(updates: List[SeasonalFactorUpdate], db: Session = Depends(get_db)):
@@ -34,6 +36,15 @@ def update_seasonal_factors(updates: List[SeasonalFactorUpdate], db: Session = D
                 item.description = u.description
                 count += 1
         db.commit()
+        dimension_cache.invalidate(SEASONAL)
+
+        # Order plan forecasts are seasonally adjusted
+        try:
+            OrderPlanSnapshot(db).refresh()
+            db.commit()
+        except Exception as plan_e:
+            db.rollback()
+            print(f"[ORDER-PLAN] Refresh after seasonal update failed: {plan_e}")
         return {"status": "success", "updated": count}
     except Exception as e:
         db.rollback()
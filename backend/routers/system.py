@@ -14,6 +14,12 @@ router = APIRouter(
     tags=["System Health"],
 )
 
+@router.get("/cache-stats")
+def get_cache_stats():
+    """Hit/miss counters of the in-process dimension cache (profiles, policies, warehouses, seasonal, config)."""
+    from backend.services.dimension_cache import dimension_cache
+    return dimension_cache.get_stats()
+
 @router.get("/health")
 def health_check(db: Session = Depends(get_db)):
     """
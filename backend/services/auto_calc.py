@@ -0,0 +1,124 @@
+import json
+from datetime import datetime, timedelta
+from sqlalchemy.orm import Session
+from backend.models import SystemJobs
+from backend.services.dimension_cache import get_config
+from backend.services.job_queue import JobQueue, JobCancelled
+
+AUTO_CALC_JOB = 'AUTO_CALC'
+DEFAULT_DEBOUNCE_SECONDS = 30 # Quiet time after the last trigger before the recalculation starts
+DEFAULT_MAX_DELAY_SECONDS = 300 # A steady stream of triggers cannot postpone it longer than this
+DEFAULT_LOCK_TIMEOUT_SECONDS = 1800 # Wait for a running rolling calculation (ROLLING_CALC lock)
+
+def _seconds_config(db, key, default):
+    value = get_config(db, key)
+    try:
+        return max(int(value), 0) if value not in (None, '') else default
+    except ValueError:
+        print(f"  ! Invalid {key}='{value}', using {default}")
+        return default
+
+def schedule_auto_calculation(db: Session, full: bool = False, refresh_forecasts: bool = False):
+    """
+    Import side of the auto-calculation: queue (or push back) the single pending AUTO_CALC job.
+    Changed SKUs are already recorded by ChangeTracker; the job picks up everything pending
+    when it starts, so N triggers inside the debounce window cost one recalculation.
+    Flags are OR-ed into the queued job. Returns the queued job.
+    """
+    now = datetime.now()
+    debounce = _seconds_config(db, 'AUTO_CALC_DEBOUNCE_SECONDS', DEFAULT_DEBOUNCE_SECONDS)
+    max_delay = _seconds_config(db, 'AUTO_CALC_MAX_DELAY_SECONDS', DEFAULT_MAX_DELAY_SECONDS)
+    params = {"full": full, "refresh_forecasts": refresh_forecasts}
+
+    job, created = JobQueue(db).submit(AUTO_CALC_JOB, params, dedup_key=AUTO_CALC_JOB, not_before=now + timedelta(seconds=debounce))
+    if created:
+        print(f"[AUTO-CALC] Scheduled (job {job.job_id}, starts in {debounce}s unless more changes arrive).")
+        return job
+
+    # Already queued: merge flags, restart the quiet period (bounded by max_delay from the first trigger).
+    # Conditional on QUEUED: if a runner claimed it meanwhile, it takes its snapshot of pending SKUs
+    # after the claim, and its key is released so the next trigger queues a follow-up.
+    merged = json.loads(job.params) if job.params else {}
+    merged = {k: bool(merged.get(k)) or v for k, v in params.items()}
+    deadline = (job.created_at or now) + timedelta(seconds=max_delay)
+    updated = db.query(SystemJobs).filter(SystemJobs.job_id == job.job_id, SystemJobs.status == 'QUEUED').update({
+        SystemJobs.params: json.dumps(merged, sort_keys=True),
+        SystemJobs.not_before: min(now + timedelta(seconds=debounce), deadline)
+    }, synchronize_session=False)
+    db.commit()
+    if not updated:
+        return schedule_auto_calculation(db, full, refresh_forecasts)
+    print(f"[AUTO-CALC] Coalesced into queued job {job.job_id}.")
+    return job
+
+def run_auto_calculation(db: Session, full: bool = False, refresh_forecasts: bool = False, job=None):
+    """
+    Runner side: the actual recalculation for every (active profile, planned warehouse) partition,
+    partitions in parallel (services.rolling_partitions).
+    Both modes run the same SQL procedure from ~3 months ago (RollingPlanningEngine.lookback_run_date).
+    Default (incremental): only for the SKUs marked dirty by the import processors (ChangeTracker).
+    full=True: prune history and rerun it for every SKU.
+    Callers hold the ROLLING_CALC lock (see job_handlers.run_auto_calc).
+    """
+    from backend.services.rolling_calc import RollingPlanningEngine
+    from backend.services.change_tracker import ChangeTracker
+    from backend.services.rolling_partitions import RollingPartitionRunner
+
+    print("[AUTO-CALC] Triggering Rolling Calculation...")
+
+    # 0. Forecasts first (the rolling plan reads them)
+    if refresh_forecasts:
+        if job: job.progress(stage='FORECASTS')
+        try:
+            from backend.services.forecasting import ForecastingEngine
+            ForecastingEngine(db).update_forecasts()
+        except Exception as e:
+            db.rollback()
+            print(f"[AUTO-CALC] Forecast refresh failed: {e}")
+
+    # 1. Determine Scope: (profile, warehouse) partitions, run in parallel on separate connections
+    runner = RollingPartitionRunner(db)
+    partitions = runner.partitions()
+
+    # 1b. Lookback Date: start ~3 months back to capture recent imports
+    # (like Nov 2025 when today is Dec 2025), for full and incremental runs alike
+    run_date = RollingPlanningEngine.lookback_run_date()
+
+    if not full:
+        # 2. Incremental: Dirty SKUs only
+        tracker = ChangeTracker(db)
+        dirty, snapshot = tracker.pending()
+        if not dirty:
+            print("[AUTO-CALC] No changed SKUs. Nothing to recalculate.")
+            return {"mode": "incremental", "skus": 0, "partitions": []}
+        print(f"[AUTO-CALC] Incremental Scope: Partitions={partitions}, SKUs={len(dirty)}, RunDate={run_date}")
+        summary = runner.run(
+            lambda engine, pid, wh: engine.run_incremental_calculation(dirty, profile_id=pid, warehouse_id=wh, run_date=run_date),
+            partitions, job=job
+        )
+        _raise_on_errors(summary)
+        tracker.clear(dirty.keys(), snapshot) # Only once every partition is up to date
+        print("[AUTO-CALC] Complete.")
+        return {"mode": "incremental", "skus": len(dirty), "run_date": run_date, **summary}
+
+    # 2. Full: Optimize Table (Prune old history)
+    RollingPlanningEngine(db).prune_history(months_to_keep=6)
+
+    print(f"[AUTO-CALC] Scope: Partitions={partitions}, RunDate={run_date}")
+    summary = runner.run(
+        lambda engine, pid, wh: engine.run_sql_procedure(profile_id=pid, warehouse_id=wh, run_date=run_date),
+        partitions, job=job
+    )
+    _raise_on_errors(summary)
+    print("[AUTO-CALC] Complete.")
+    return {"mode": "full", "run_date": run_date, **summary}
+
+def _raise_on_errors(summary):
+    if summary["errors"]:
+        raise RuntimeError(f"{len(summary['errors'])} partition(s) failed: " + "; ".join(summary["errors"]))
+    cancelled = [e for e in summary["partitions"] if e["status"] == 'CANCELLED']
+    if cancelled:
+        raise JobCancelled()
+
+def lock_timeout(db: Session):
+    return _seconds_config(db, 'ROLLING_LOCK_TIMEOUT_SECONDS', DEFAULT_LOCK_TIMEOUT_SECONDS)
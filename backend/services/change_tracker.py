@@ -0,0 +1,139 @@
+from sqlalchemy.orm import Session
+from sqlalchemy import and_, or_, update, case, bindparam
+from datetime import datetime, date
+import pandas as pd
+from backend.models import PlanningDirtySkus
+
+class ChangeTracker:
+    """
+    Records which SKUs an import modified so the rolling plan can be recomputed
+    incrementally (only those SKUs, only from the earliest changed bucket).
+    """
+    def __init__(self, db: Session):
+        self.db = db
+
+    @staticmethod
+    def _to_date(value):
+        if isinstance(value, datetime):
+            return value.date()
+        if isinstance(value, date):
+            return value
+        ts = pd.to_datetime(value, errors='coerce')
+        return None if pd.isna(ts) else ts.date()
+
+    def mark(self, changes, source=None):
+        """
+        changes: iterable of (sku_id, warehouse_id, changed_date).
+        Keeps the earliest date per (sku, warehouse), merged with what is already pending.
+        Does not commit (the caller commits with its own import transaction).
+        """
+        earliest = {}
+        for sku, wh_id, d in changes:
+            if not sku:
+                continue
+            d = self._to_date(d)
+            if d is None:
+                continue
+            key = (str(sku), wh_id or 'ALL')
+            if key not in earliest or d < earliest[key]:
+                earliest[key] = d
+
+        if not earliest:
+            return 0
+
+        keys = list(earliest.keys())
+        now = datetime.now()
+        updates, inserts = [], []
+
+        chunk_size = 500 # SQL Server param limit (2100)
+        for i in range(0, len(keys), chunk_size):
+            chunk = keys[i:i + chunk_size]
+            existing = self.db.query(PlanningDirtySkus.sku_id, PlanningDirtySkus.warehouse_id).filter(
+                PlanningDirtySkus.sku_id.in_(list({k[0] for k in chunk}))
+            ).all()
+            existing_keys = {(r.sku_id, r.warehouse_id) for r in existing}
+
+            for key in chunk:
+                new_date = earliest[key]
+                if key in existing_keys:
+                    updates.append({
+                        'b_sku': key[0], 'b_wh': key[1], 'b_date': new_date,
+                        'b_source': source, 'b_now': now
+                    })
+                else:
+                    inserts.append({
+                        'sku_id': key[0], 'warehouse_id': key[1],
+                        'from_date': new_date,
+                        'source': source, 'marked_at': now, 'version': 1
+                    })
+
+        if updates:
+            # One executemany UPDATE that keeps the earlier date in SQL and bumps the version,
+            # so a concurrent clear() of the version it read leaves the re-marked row pending
+            t = PlanningDirtySkus.__table__
+            self.db.execute(
+                update(t).where(t.c.sku_id == bindparam('b_sku'), t.c.warehouse_id == bindparam('b_wh')).values(
+                    from_date=case((t.c.from_date > bindparam('b_date'), bindparam('b_date')), else_=t.c.from_date),
+                    source=bindparam('b_source'),
+                    marked_at=bindparam('b_now'),
+                    version=t.c.version + 1
+                ),
+                updates
+            )
+            # A clear() that committed between the read above and the UPDATE removed the row: insert it again
+            for i in range(0, len(updates), chunk_size):
+                chunk = updates[i:i + chunk_size]
+                present = {(r.sku_id, r.warehouse_id) for r in self.db.query(PlanningDirtySkus.sku_id, PlanningDirtySkus.warehouse_id).filter(
+                    PlanningDirtySkus.sku_id.in_(list({u['b_sku'] for u in chunk}))
+                ).all()}
+                inserts.extend({
+                    'sku_id': u['b_sku'], 'warehouse_id': u['b_wh'], 'from_date': u['b_date'],
+                    'source': source, 'marked_at': now, 'version': 1
+                } for u in chunk if (u['b_sku'], u['b_wh']) not in present)
+        if inserts:
+            self.db.bulk_insert_mappings(PlanningDirtySkus, inserts)
+
+        # Incremental forecast state: a change before its watermark means rebuild that SKU
+        if source == 'SALES_IMPORT':
+            from backend.services.forecast_state import ForecastState
+            by_sku = {}
+            for (sku, _), d in earliest.items():
+                by_sku[sku] = min(d, by_sku.get(sku, d))
+            ForecastState(self.db).mark_stale(by_sku)
+
+        print(f"[CHANGE-TRACKER] Marked {len(keys)} SKU/warehouse pairs dirty ({source}).")
+        return len(keys)
+
+    def pending(self):
+        """
+        Returns {sku_id: earliest from_date} across warehouses, plus the snapshot:
+        the (sku_id, warehouse_id, version) of every mark read, for clear().
+        """
+        rows = self.db.query(
+            PlanningDirtySkus.sku_id, PlanningDirtySkus.warehouse_id,
+            PlanningDirtySkus.from_date, PlanningDirtySkus.version
+        ).all()
+        dirty = {}
+        for r in rows:
+            if r.sku_id not in dirty or r.from_date < dirty[r.sku_id]:
+                dirty[r.sku_id] = r.from_date
+        return dirty, [(r.sku_id, r.warehouse_id, r.version) for r in rows]
+
+    def clear(self, sku_ids, snapshot):
+        """
+        Drop exactly the marks pending() returned for these SKUs. A mark written after the read
+        (new row, or mark() bumping the version of an existing one) no longer matches and stays
+        pending (marked_at is the writer's clock, not its commit time, so it can't be the cutoff).
+        """
+        sku_ids = set(sku_ids)
+        consumed = [key for key in snapshot if key[0] in sku_ids]
+        chunk_size = 500 # 3 params per mark, SQL Server param limit (2100)
+        for i in range(0, len(consumed), chunk_size):
+            self.db.query(PlanningDirtySkus).filter(or_(*[
+                and_(
+                    PlanningDirtySkus.sku_id == sku,
+                    PlanningDirtySkus.warehouse_id == wh,
+                    PlanningDirtySkus.version == version
+                ) for sku, wh, version in consumed[i:i + chunk_size]
+            ])).delete(synchronize_session=False)
+        self.db.commit()
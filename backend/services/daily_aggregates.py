@@ -0,0 +1,126 @@
+from datetime import datetime, timedelta
+from sqlalchemy.orm import Session
+from sqlalchemy import func, select, insert, cast, Date, literal_column
+from backend.models import FactSales, FactPurchases, FactSalesDaily, FactPurchasesDaily, SystemConfig
+
+BUILT_KEY = 'DAILY_AGGREGATES_BUILT'
+
+class DailyAggregates:
+    """
+    Maintains Fact_Sales_Daily / Fact_Purchases_Daily from the ledger tables.
+    - refresh_sales()/refresh_purchases(): recompute a day range with one DELETE + INSERT ... SELECT
+      GROUP BY on the server; import processors call them inside their own transaction right
+      after the partition swap + bulk insert of the same range
+    - ensure_built(): first full build (readers call it; no-op once the tables are marked built)
+    Only ensure_built() commits.
+    """
+    _built = set() # Per process: database URLs whose tables are known to be built (reload_engine may switch DB)
+
+    def __init__(self, db: Session):
+        self.db = db
+
+    def _day(self, column):
+        """Truncate a DATETIME column to its day in SQL (MSSQL CAST, SQLite date())."""
+        if self.db.get_bind().dialect.name == 'sqlite':
+            return func.date(column)
+        return cast(column, Date)
+
+    # --- BUILD STATE ---
+
+    def _bind_key(self):
+        return str(self.db.get_bind().url)
+
+    def is_built(self):
+        if self._bind_key() in DailyAggregates._built:
+            return True
+        built = self.db.query(SystemConfig.config_value).filter(SystemConfig.config_key == BUILT_KEY).scalar() is not None
+        if built:
+            DailyAggregates._built.add(self._bind_key())
+        return built
+
+    def ensure_built(self):
+        if self.is_built():
+            return
+        print("[DAILY-AGG] Daily aggregate tables not built. Building...")
+        self.rebuild()
+        self.db.commit()
+
+    def rebuild(self):
+        self.db.query(FactSalesDaily).delete(synchronize_session=False)
+        self.db.query(FactPurchasesDaily).delete(synchronize_session=False)
+        sales = self._insert_sales(None, None)
+        purchases = self._insert_purchases(None, None)
+
+        obj = self.db.query(SystemConfig).filter(SystemConfig.config_key == BUILT_KEY).first()
+        if not obj:
+            obj = SystemConfig(config_key=BUILT_KEY, description="Fact_Sales_Daily / Fact_Purchases_Daily populated")
+            self.db.add(obj)
+        obj.config_value = datetime.now().isoformat(timespec='seconds')
+        obj.updated_at = datetime.now()
+        DailyAggregates._built.add(self._bind_key())
+        print(f"[DAILY-AGG] Rebuilt: {sales} sales rows, {purchases} purchase rows.")
+
+    # --- INCREMENTAL (same transaction as the import) ---
+
+    def refresh_sales(self, start_date, end_date):
+        """Recompute Fact_Sales_Daily for start_date..end_date (dates, inclusive)."""
+        if not self.is_built():
+            return 0 # The first ensure_built() covers everything
+        self.db.query(FactSalesDaily).filter(
+            FactSalesDaily.day >= start_date, FactSalesDaily.day <= end_date
+        ).delete(synchronize_session=False)
+        return self._insert_sales(start_date, end_date)
+
+    def refresh_purchases(self, start_date, end_date):
+        """Recompute Fact_Purchases_Daily for start_date..end_date (dates, inclusive)."""
+        if not self.is_built():
+            return 0
+        self.db.query(FactPurchasesDaily).filter(
+            FactPurchasesDaily.day >= start_date, FactPurchasesDaily.day <= end_date
+        ).delete(synchronize_session=False)
+        return self._insert_purchases(start_date, end_date)
+
+    def clear(self):
+        """Empty both tables (ledger reset); they stay marked as built."""
+        self.db.query(FactSalesDaily).delete(synchronize_session=False)
+        self.db.query(FactPurchasesDaily).delete(synchronize_session=False)
+
+    # --- INTERNALS ---
+
+    def _insert_sales(self, start_date, end_date):
+        day = self._day(FactSales.order_date)
+        # Literal '' (not a bind param): MSSQL needs the GROUP BY expression to match the SELECT text
+        wh = func.coalesce(FactSales.warehouse_id, literal_column("''"))
+        query = select(
+            FactSales.sku_id, wh, day,
+            func.sum(FactSales.quantity), func.sum(FactSales.amount), func.count()
+        ).where(FactSales.sku_id.isnot(None), FactSales.order_date.isnot(None))
+        query = self._date_range(query, FactSales.order_date, start_date, end_date)
+        query = query.group_by(FactSales.sku_id, wh, day)
+        result = self.db.execute(insert(FactSalesDaily).from_select(
+            ['sku_id', 'warehouse_id', 'day', 'quantity', 'amount', 'line_count'], query
+        ))
+        return result.rowcount
+
+    def _insert_purchases(self, start_date, end_date):
+        day = self._day(FactPurchases.order_date)
+        wh = func.coalesce(FactPurchases.warehouse_id, literal_column("''"))
+        p_type = func.coalesce(FactPurchases.purchase_type, literal_column("''"))
+        query = select(
+            FactPurchases.sku_id, wh, day, p_type,
+            func.coalesce(func.sum(FactPurchases.quantity), 0), func.count()
+        ).where(FactPurchases.sku_id.isnot(None), FactPurchases.order_date.isnot(None))
+        query = self._date_range(query, FactPurchases.order_date, start_date, end_date)
+        query = query.group_by(FactPurchases.sku_id, wh, day, p_type)
+        result = self.db.execute(insert(FactPurchasesDaily).from_select(
+            ['sku_id', 'warehouse_id', 'day', 'purchase_type', 'quantity', 'line_count'], query
+        ))
+        return result.rowcount
+
+    @staticmethod
+    def _date_range(query, column, start_date, end_date):
+        if start_date is not None:
+            query = query.where(column >= start_date)
+        if end_date is not None:
+            query = query.where(column < end_date + timedelta(days=1))
+        return query
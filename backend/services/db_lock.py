@@ -0,0 +1,49 @@
+import threading
+from contextlib import contextmanager
+from sqlalchemy import text
+
+ROLLING_CALC_LOCK = 'ROLLING_CALC' # Anything that rewrites Fact_Rolling_Inventory ranges in bulk
+
+class LockTimeout(Exception):
+    pass
+
+_local_locks = {}
+_local_locks_guard = threading.Lock()
+
+@contextmanager
+def db_lock(engine, name, timeout_seconds=600):
+    """
+    Exclusive named lock held for the duration of the block, across every process that
+    uses the same database (SQL Server sp_getapplock, owned by a dedicated connection so it
+    is independent of the caller's session and transactions).
+    Other dialects (SQLite dev setups) fall back to a lock local to this process.
+    Raises LockTimeout if the lock is not granted within timeout_seconds.
+    """
+    if engine.dialect.name != 'mssql':
+        with _local_locks_guard:
+            lock = _local_locks.setdefault(name, threading.Lock())
+        if not lock.acquire(timeout=timeout_seconds):
+            raise LockTimeout(f"Lock '{name}' busy for {timeout_seconds}s")
+        try:
+            yield
+        finally:
+            lock.release()
+        return
+
+    conn = engine.connect()
+    try:
+        granted = conn.execute(text(
+            "DECLARE @r INT; "
+            "EXEC @r = sp_getapplock @Resource = :name, @LockMode = 'Exclusive', @LockOwner = 'Session', @LockTimeout = :ms; "
+            "SELECT @r"
+        ), {"name": name, "ms": int(timeout_seconds * 1000)}).scalar()
+        conn.commit()
+        if granted is None or granted < 0:
+            raise LockTimeout(f"Lock '{name}' busy for {timeout_seconds}s (sp_getapplock={granted})")
+        try:
+            yield
+        finally:
+            conn.execute(text("EXEC sp_releaseapplock @Resource = :name, @LockOwner = 'Session'"), {"name": name})
+            conn.commit()
+    finally:
+        conn.close()
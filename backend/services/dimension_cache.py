@@ -0,0 +1,106 @@
+import time
+import threading
+from typing import Callable, Dict, List, Optional
+from sqlalchemy.orm import Session
+from backend.models import (
+    PlanningDistributionProfile, PlanningPolicies, DimWarehouses, SeasonalFactors, SystemConfig
+)
+
+DEFAULT_TTL_SECONDS = 300 # Upper bound on staleness across worker processes
+
+PROFILES = 'profiles'
+POLICIES = 'policies'
+WAREHOUSES = 'warehouses'
+SEASONAL = 'seasonal'
+CONFIG = 'config'
+
+class DimensionCache:
+    """
+    Process-wide cache for small, hot dimension tables (profiles, policies, warehouses,
+    seasonal factors, system config).
+    - Entries expire after ttl_seconds (other processes/scripts may write the tables)
+    - invalidate() bumps a per-dimension version: writers in this process call it after commit,
+      and a load that raced with an invalidation is not stored
+    - Rows are loaded in a private session and returned detached (read-only snapshots):
+      never modify them, query the table to write
+    """
+    def __init__(self, ttl_seconds=DEFAULT_TTL_SECONDS):
+        self.ttl_seconds = ttl_seconds
+        self._lock = threading.Lock()
+        self._entries = {} # name -> (version, loaded_at, value)
+        self._versions = {}
+        self._stats = {}
+
+    def get(self, name: str, db: Session, loader: Callable[[Session], object]):
+        with self._lock:
+            version = self._versions.get(name, 0)
+            stats = self._stats.setdefault(name, {'hits': 0, 'misses': 0, 'invalidations': 0})
+            entry = self._entries.get(name)
+            if entry and entry[0] == version and time.monotonic() - entry[1] < self.ttl_seconds:
+                stats['hits'] += 1
+                return entry[2]
+            stats['misses'] += 1
+
+        # Load outside the lock, in a session of our own (the snapshot must not belong to the caller's session)
+        loader_session = Session(bind=db.get_bind())
+        try:
+            value = loader(loader_session)
+        finally:
+            loader_session.close()
+
+        with self._lock:
+            if self._versions.get(name, 0) == version:
+                self._entries[name] = (version, time.monotonic(), value)
+        return value
+
+    def invalidate(self, *names):
+        with self._lock:
+            for name in names:
+                self._versions[name] = self._versions.get(name, 0) + 1
+                self._entries.pop(name, None)
+                self._stats.setdefault(name, {'hits': 0, 'misses': 0, 'invalidations': 0})['invalidations'] += 1
+
+    def get_stats(self) -> dict:
+        with self._lock:
+            result = {}
+            for name, stats in self._stats.items():
+                total = stats['hits'] + stats['misses']
+                entry = self._entries.get(name)
+                result[name] = {
+                    **stats,
+                    'hit_ratio': round(stats['hits'] / total, 3) if total else None,
+                    'version': self._versions.get(name, 0),
+                    'age_seconds': round(time.monotonic() - entry[1], 1) if entry else None
+                }
+            return {'ttl_seconds': self.ttl_seconds, 'dimensions': result}
+
+dimension_cache = DimensionCache()
+
+# --- TYPED ACCESSORS ---
+
+def get_profiles(db: Session, active_only=True) -> List[PlanningDistributionProfile]:
+    profiles = dimension_cache.get(PROFILES, db, lambda s: s.query(PlanningDistributionProfile).all())
+    return [p for p in profiles if p.is_active] if active_only else list(profiles)
+
+def get_profile(db: Session, profile_id) -> Optional[PlanningDistributionProfile]:
+    return next((p for p in get_profiles(db, active_only=False) if p.profile_id == profile_id), None)
+
+def get_policies(db: Session) -> List[PlanningPolicies]:
+    return list(dimension_cache.get(POLICIES, db, lambda s: s.query(PlanningPolicies).all()))
+
+def get_default_policy(db: Session) -> Optional[PlanningPolicies]:
+    """is_default policy, else the first one (same fallback the engines used)."""
+    policies = get_policies(db)
+    return next((p for p in policies if p.is_default), policies[0] if policies else None)
+
+def get_warehouses(db: Session) -> List[DimWarehouses]:
+    return list(dimension_cache.get(WAREHOUSES, db, lambda s: s.query(DimWarehouses).all()))
+
+def get_seasonal_factors(db: Session) -> List[SeasonalFactors]:
+    return list(dimension_cache.get(SEASONAL, db, lambda s: s.query(SeasonalFactors).order_by(SeasonalFactors.month).all()))
+
+def get_config_map(db: Session) -> Dict[str, str]:
+    return dimension_cache.get(CONFIG, db, lambda s: {c.config_key: c.config_value for c in s.query(SystemConfig).all()})
+
+def get_config(db: Session, key, default=None):
+    return get_config_map(db).get(key, default)
@@ -0,0 +1,90 @@
+import io
+import csv
+import tempfile
+from fastapi import HTTPException
+from fastapi.responses import StreamingResponse
+
+EXPORT_FORMATS = ('xlsx', 'csv')
+DEFAULT_YIELD_ROWS = 2000 # Rows fetched per round trip (Query.yield_per)
+CSV_FLUSH_ROWS = 1000 # Rows per chunk sent to the client
+FILE_CHUNK_BYTES = 1024 * 1024 # 1 MB per read when sending the finished .xlsx
+
+MEDIA_TYPES = {
+    'xlsx': "application/vnd.openxmlformats-officedocument.spreadsheetml.sheet",
+    'csv': "text/csv"
+}
+
+def stream_query(query, yield_rows=DEFAULT_YIELD_ROWS):
+    """Iterate a Query in server-side batches (never the whole result in memory)."""
+    return query.yield_per(yield_rows)
+
+def iter_csv(headers, rows):
+    """CSV bytes (UTF-8 with BOM for Excel), sent every CSV_FLUSH_ROWS rows while rows are read."""
+    buffer = io.StringIO()
+    writer = csv.writer(buffer)
+    buffer.write('\ufeff')
+    writer.writerow(headers)
+    pending = 0
+    for row in rows:
+        writer.writerow(row)
+        pending += 1
+        if pending >= CSV_FLUSH_ROWS:
+            yield buffer.getvalue().encode('utf-8')
+            buffer.seek(0)
+            buffer.truncate()
+            pending = 0
+    yield buffer.getvalue().encode('utf-8')
+
+def iter_xlsx(headers, rows, sheet_name='Data'):
+    """
+    .xlsx bytes from an openpyxl write-only workbook: rows go straight to the sheet's temp XML
+    (constant memory), the zip is assembled in a temp file and sent in chunks.
+    The xlsx container can only be closed after the last row, so bytes start once rows are read.
+    """
+    from openpyxl import Workbook
+    wb = Workbook(write_only=True)
+    ws = wb.create_sheet(title=sheet_name[:31]) # Excel limit
+    ws.append(headers)
+    for row in rows:
+        ws.append(list(row))
+
+    with tempfile.TemporaryFile() as tmp:
+        wb.save(tmp)
+        tmp.seek(0)
+        while True:
+            chunk = tmp.read(FILE_CHUNK_BYTES)
+            if not chunk:
+                break
+            yield chunk
+
+def export_response(headers, row_source, filename, fmt='xlsx', sheet_name='Data'):
+    """
+    StreamingResponse for an export.
+    headers: list of column titles, or headers(db) -> list when they depend on the data.
+    row_source(db) -> iterable of row sequences (aligned with headers). It runs inside the
+    response, on a session of its own (the request session is gone by the time the body is sent),
+    so it should page with stream_query() rather than .all().
+    filename: without extension (added from fmt).
+    """
+    fmt = (fmt or 'xlsx').lower()
+    if fmt not in EXPORT_FORMATS:
+        raise HTTPException(status_code=400, detail=f"Unknown export format: {fmt} (expected one of {', '.join(EXPORT_FORMATS)})")
+
+    def body():
+        from backend.database import SessionLocal
+        db = SessionLocal()
+        try:
+            titles = headers(db) if callable(headers) else headers
+            rows = row_source(db)
+            if fmt == 'csv':
+                yield from iter_csv(titles, rows)
+            else:
+                yield from iter_xlsx(titles, rows, sheet_name)
+        finally:
+            db.close()
+
+    return StreamingResponse(
+        body(),
+        media_type=MEDIA_TYPES[fmt],
+        headers={"Content-Disposition": f"attachment; filename={filename}.{fmt}"}
+    )
@@ -0,0 +1,69 @@
+"""
+Forecasting kernels over a dense (day x sku) sales matrix.
+Pure NumPy, no DB/ORM imports: this module is what process-pool workers import
+(see ForecastingEngine.forecast_all), so it must stay cheap to load.
+
+Every kernel takes (matrix, first, last):
+- matrix: float array (n_days, n_skus), daily quantity, zero-filled
+- first / last: int arrays (n_skus,), row of each SKU's first / last sale day
+and returns the projected daily level per SKU (n_skus,).
+"""
+import numpy as np
+
+SMA_WINDOW = 30 # Days averaged by the SMA projection (tail(30) in calculate_forecast)
+EMA_SPAN = 30
+EMA_ALPHA = 2.0 / (EMA_SPAN + 1)
+
+def dense_matrix(day_idx, sku_codes, quantities, n_days, n_skus):
+    """(day x sku) matrix from long (day, sku, qty) arrays, plus each SKU's first/last sale row."""
+    matrix = np.zeros((n_days, n_skus))
+    np.add.at(matrix, (day_idx, sku_codes), quantities)
+    first = np.full(n_skus, n_days, dtype=np.int64)
+    last = np.full(n_skus, -1, dtype=np.int64)
+    np.minimum.at(first, sku_codes, day_idx)
+    np.maximum.at(last, sku_codes, day_idx)
+    return matrix, first, last
+
+def sma_level(matrix, first, last):
+    """Mean of the last SMA_WINDOW days of each SKU series (shorter series: all of it)."""
+    n_skus = matrix.shape[1]
+    cumulative = np.vstack([np.zeros((1, n_skus)), np.cumsum(matrix, axis=0)])
+    start = np.maximum(first, last - (SMA_WINDOW - 1))
+    cols = np.arange(n_skus)
+    return (cumulative[last + 1, cols] - cumulative[start, cols]) / (last - start + 1)
+
+def ema_level(matrix, first, last):
+    """ewm(span=EMA_SPAN, adjust=False) value on each SKU's last day: y = x on day one, then y = (1 - a) * y + a * x."""
+    alpha = EMA_ALPHA
+    n_days, n_skus = matrix.shape
+    ema = np.zeros(n_skus)
+    level = np.zeros(n_skus)
+    for d in range(n_days):
+        ema = np.where(d == first, matrix[d], (1 - alpha) * ema + alpha * matrix[d])
+        ended = last == d
+        level[ended] = ema[ended]
+    return level
+
+def sma_windows(matrix, first, last):
+    """Last SMA_WINDOW daily values of each SKU series as a (n_skus, SMA_WINDOW) array, NaN before the first day."""
+    offsets = np.arange(SMA_WINDOW - 1, -1, -1)
+    rows = last[:, None] - offsets[None, :]
+    values = matrix[np.clip(rows, 0, None), np.arange(matrix.shape[1])[:, None]]
+    return np.where(rows >= first[:, None], values, np.nan)
+
+MODELS = {
+    'SMA': sma_level,
+    'EMA': ema_level,
+}
+
+def forecast_levels(model_type, matrix, first, last):
+    """Levels rounded like Fact_Forecasts.quantity_predicted (2 dp, no NaN)."""
+    return np.round(np.nan_to_num(MODELS[model_type](matrix, first, last)), 2)
+
+def forecast_shard(shard):
+    """
+    Process-pool entry point. shard = (model_type, matrix, first, last) for a slice of SKU columns,
+    already trimmed to the rows between the slice's first and last sale day.
+    """
+    model_type, matrix, first, last = shard
+    return forecast_levels(model_type, matrix, first, last)
@@ -0,0 +1,267 @@
+import json
+from datetime import datetime, date, timedelta
+import numpy as np
+import pandas as pd
+from sqlalchemy.orm import Session
+from sqlalchemy import func, insert
+from backend.models import FactSalesDaily, FactForecastState, SystemConfig
+from backend.services.forecast_models import SMA_WINDOW, EMA_ALPHA, dense_matrix, ema_level, sma_windows
+from backend.services.dimension_cache import dimension_cache, CONFIG
+from backend.services.daily_aggregates import DailyAggregates
+
+WATERMARK_KEY = 'FORECAST_STATE_WATERMARK'
+
+class ForecastState:
+    """
+    Incremental SMA/EMA state per SKU (Fact_Forecast_State).
+    - refresh(): folds the sale days after the watermark (config FORECAST_STATE_WATERMARK)
+      into each SKU's running EMA and last-30-days window; cost is O(new days), not O(history)
+    - Only complete days (<= yesterday) are persisted; today's partial sales are folded
+      in memory by current_levels() so the next refresh can still add the rest of the day
+    - A change to a day at or before the watermark (ChangeTracker.mark -> mark_stale)
+      flags the SKU for a rebuild from its full history on the next refresh
+    Levels match ForecastingEngine.calculate_forecast / forecast_all.
+    None of the methods commit (callers commit with their own transaction).
+    """
+    def __init__(self, db: Session):
+        self.db = db
+
+    @staticmethod
+    def _to_date(value):
+        if value is None or (isinstance(value, date) and not isinstance(value, datetime)):
+            return value
+        return pd.to_datetime(value).date()
+
+    # --- WATERMARK ---
+
+    def watermark(self):
+        """Last day folded into the state (None = never built). Read directly, not via the config cache."""
+        value = self.db.query(SystemConfig.config_value).filter(SystemConfig.config_key == WATERMARK_KEY).scalar()
+        return self._to_date(value) if value else None
+
+    def _set_watermark(self, day):
+        obj = self.db.query(SystemConfig).filter(SystemConfig.config_key == WATERMARK_KEY).first()
+        if not obj:
+            obj = SystemConfig(config_key=WATERMARK_KEY, description="Last sales day folded into Fact_Forecast_State")
+            self.db.add(obj)
+        obj.config_value = day.isoformat()
+        obj.updated_at = datetime.now()
+        dimension_cache.invalidate(CONFIG)
+
+    # --- INVALIDATION ---
+
+    def mark_stale(self, earliest):
+        """
+        earliest: {sku_id: earliest changed date}. SKUs changed at or before the watermark
+        are rebuilt on the next refresh (later days are simply folded in).
+        """
+        watermark = self.watermark()
+        if watermark is None:
+            return 0
+        stale = [sku for sku, d in earliest.items() if d is not None and d <= watermark]
+        if not stale:
+            return 0
+
+        chunk_size = 500 # SQL Server param limit (2100)
+        for i in range(0, len(stale), chunk_size):
+            chunk = stale[i:i + chunk_size]
+            existing = {sku for (sku,) in self.db.query(FactForecastState.sku_id).filter(FactForecastState.sku_id.in_(chunk)).all()}
+            self.db.query(FactForecastState).filter(FactForecastState.sku_id.in_(chunk)).update(
+                {FactForecastState.needs_rebuild: True}, synchronize_session=False
+            )
+            # SKUs without state yet (first sales backdated): placeholder row so the rebuild finds them
+            missing = [{'sku_id': sku, 'needs_rebuild': True} for sku in chunk if sku not in existing]
+            if missing:
+                self.db.bulk_insert_mappings(FactForecastState, missing)
+        return len(stale)
+
+    # --- REFRESH ---
+
+    def refresh(self, full=False, upto=None):
+        """
+        Bring the state up to `upto` (default: yesterday). Returns the set of SKUs whose state changed.
+        full=True (or no watermark yet) rebuilds every SKU from its full history.
+        """
+        DailyAggregates(self.db).ensure_built()
+        upto = upto or datetime.now().date() - timedelta(days=1)
+        watermark = self.watermark()
+        if watermark is not None and upto < watermark:
+            upto = watermark
+        if full or watermark is None:
+            print("[FORECAST-STATE] Full rebuild...")
+            self.db.query(FactForecastState).delete(synchronize_session=False)
+            changed = self._rebuild(None, upto)
+            self._set_watermark(upto)
+            return changed
+
+        # 1. SKUs flagged by backdated changes: full history, only for them
+        stale = [sku for (sku,) in self.db.query(FactForecastState.sku_id).filter(FactForecastState.needs_rebuild == True).all()]
+        changed = self._rebuild(stale, upto) if stale else set()
+
+        # 2. Everyone else: fold the new complete days
+        if upto > watermark:
+            new_days = self._daily_sales(watermark + timedelta(days=1), upto)
+            stale_set = set(stale)
+            new_days = {sku: days for sku, days in new_days.items() if sku not in stale_set}
+            states = self._load(list(new_days.keys()))
+            for sku, days in new_days.items():
+                states[sku] = self._fold(states.get(sku), days)
+            self._save(states)
+            changed |= set(new_days.keys())
+            self._set_watermark(upto)
+
+        print(f"[FORECAST-STATE] Refreshed through {upto}: {len(changed)} SKUs changed ({len(stale)} rebuilt).")
+        return changed
+
+    def tail_skus(self):
+        """SKUs with sales after the watermark (today's partial day), not persisted in the state yet."""
+        watermark = self.watermark()
+        if watermark is None:
+            return set()
+        rows = self.db.query(FactSalesDaily.sku_id).filter(FactSalesDaily.day > watermark).distinct().all()
+        return {sku for (sku,) in rows}
+
+    def current_levels(self, sku_ids):
+        """
+        {sku_id: (last_date, sma_level, ema_level)} for sku_ids, with the sales after the
+        watermark folded in on top of the stored state (in memory only).
+        """
+        sku_ids = list(sku_ids)
+        states = self._load(sku_ids)
+        watermark = self.watermark()
+        if watermark is not None:
+            wanted = set(sku_ids)
+            tail = self._daily_sales(watermark + timedelta(days=1), None)
+            for sku, days in tail.items():
+                if sku in wanted:
+                    states[sku] = self._fold(states.get(sku), days)
+
+        result = {}
+        for sku in sku_ids:
+            state = states.get(sku)
+            if not state or state['last_date'] is None:
+                continue
+            window = state['window']
+            sma = sum(window) / len(window) if window else 0.0
+            result[sku] = (state['last_date'], round(sma, 2), round(state['ema'] or 0.0, 2))
+        return result
+
+    # --- INTERNALS ---
+
+    def _daily_sales(self, start, end, sku_ids=None):
+        """{sku_id: [(day, qty), ...] sorted} for start <= day <= end (None = open)."""
+        query = self.db.query(FactSalesDaily.sku_id, FactSalesDaily.day, func.sum(FactSalesDaily.quantity))
+        if start is not None:
+            query = query.filter(FactSalesDaily.day >= start)
+        if end is not None:
+            query = query.filter(FactSalesDaily.day <= end)
+
+        result = {}
+        chunk_size = 500
+        chunks = [sku_ids[i:i + chunk_size] for i in range(0, len(sku_ids), chunk_size)] if sku_ids is not None else [None]
+        for chunk in chunks:
+            q = query.filter(FactSalesDaily.sku_id.in_(chunk)) if chunk is not None else query
+            for sku, d, qty in q.group_by(FactSalesDaily.sku_id, FactSalesDaily.day).all():
+                result.setdefault(sku, []).append((self._to_date(d), float(qty or 0)))
+        for days in result.values():
+            days.sort()
+        return result
+
+    @staticmethod
+    def _fold(state, days):
+        """Extend one SKU's state with later (day, qty) points; gap days count as zero sales."""
+        state = dict(state) if state else {'first_date': None, 'last_date': None, 'ema': None, 'window': []}
+        window = list(state['window'])
+        ema, last = state['ema'], state['last_date']
+        for d, qty in days:
+            if last is None:
+                state['first_date'], ema, window = d, qty, [qty]
+            elif d > last:
+                gap = (d - last).days - 1
+                ema = ema * (1 - EMA_ALPHA) ** gap # Zero-sale days only decay the EMA
+                ema = (1 - EMA_ALPHA) * ema + EMA_ALPHA * qty
+                window = (window + [0.0] * min(gap, SMA_WINDOW) + [qty])[-SMA_WINDOW:]
+            else:
+                continue # Already folded (backdated changes go through mark_stale)
+            last = d
+        state.update({'last_date': last, 'ema': ema, 'window': window})
+        return state
+
+    def _rebuild(self, sku_ids, upto):
+        """Recompute state from full history (all SKUs if sku_ids is None), vectorized like forecast_all."""
+        history = self._daily_sales(None, upto, sku_ids)
+        if sku_ids is not None:
+            # Flagged SKUs without sales left: drop the state
+            gone = [sku for sku in sku_ids if sku not in history]
+            for i in range(0, len(gone), 500):
+                self.db.query(FactForecastState).filter(FactForecastState.sku_id.in_(gone[i:i + 500])).delete(synchronize_session=False)
+        if not history:
+            return set()
+
+        skus = list(history.keys())
+        origin = min(days[0][0] for days in history.values())
+        day_idx, sku_codes, qtys = [], [], []
+        for code, sku in enumerate(skus):
+            for d, qty in history[sku]:
+                day_idx.append((d - origin).days)
+                sku_codes.append(code)
+                qtys.append(qty)
+        day_idx = np.array(day_idx)
+        matrix, first, last = dense_matrix(day_idx, np.array(sku_codes), np.array(qtys), int(day_idx.max()) + 1, len(skus))
+        ema = ema_level(matrix, first, last)
+        windows = sma_windows(matrix, first, last)
+        del matrix
+
+        states = {}
+        for code, sku in enumerate(skus):
+            window = windows[code]
+            states[sku] = {
+                'first_date': origin + timedelta(days=int(first[code])),
+                'last_date': origin + timedelta(days=int(last[code])),
+                'ema': float(ema[code]),
+                'window': [float(v) for v in window[~np.isnan(window)]]
+            }
+        self._save(states)
+        return set(skus)
+
+    def _load(self, sku_ids):
+        states = {}
+        chunk_size = 500
+        for i in range(0, len(sku_ids), chunk_size):
+            rows = self.db.query(FactForecastState).filter(
+                FactForecastState.sku_id.in_(sku_ids[i:i + chunk_size]),
+                FactForecastState.needs_rebuild != True
+            ).all()
+            for r in rows:
+                states[r.sku_id] = {
+                    'first_date': self._to_date(r.first_date),
+                    'last_date': self._to_date(r.last_date),
+                    'ema': r.ema_value,
+                    'window': json.loads(r.window_values) if r.window_values else []
+                }
+        return states
+
+    def _save(self, states):
+        """Replace the state rows of the given SKUs (delete + Core executemany insert)."""
+        if not states:
+            return
+        now = datetime.now()
+        skus = list(states.keys())
+        stmt = insert(FactForecastState.__table__).execution_options(fast_executemany=True)
+        chunk_size = 500
+        for i in range(0, len(skus), chunk_size):
+            chunk = skus[i:i + chunk_size]
+            self.db.query(FactForecastState).filter(FactForecastState.sku_id.in_(chunk)).delete(synchronize_session=False)
+            self.db.execute(stmt, [
+                {
+                    'sku_id': sku,
+                    'first_date': states[sku]['first_date'],
+                    'last_date': states[sku]['last_date'],
+                    'ema_value': states[sku]['ema'],
+                    'window_sum': float(sum(states[sku]['window'])),
+                    'window_values': json.dumps([round(v, 6) for v in states[sku]['window']]),
+                    'needs_rebuild': False,
+                    'updated_at': now
+                }
+                for sku in chunk
+            ])
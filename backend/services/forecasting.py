@@ -1,14 +1,28 @@
 
 from sqlalchemy.orm import Session
-from sqlalchemy import func
+from sqlalchemy import func, insert
+import os
+import multiprocessing
+from concurrent.futures import ProcessPoolExecutor
 import pandas as pd
 import numpy as np
 from datetime import datetime, timedelta
-from backend.models import FactSales, FactForecasts, DimProducts
+from backend.models import FactSalesDaily, FactForecasts, DimProducts
+from backend.services.forecast_models import MODELS, dense_matrix, forecast_levels, forecast_shard
+from backend.services.dimension_cache import get_config
+from backend.services.forecast_state import ForecastState
+from backend.services.daily_aggregates import DailyAggregates
+from backend.services.order_plan import OrderPlanSnapshot
+
+BATCH_SKU_CHUNK = 500 # SKUs per delete/insert/commit (SQL Server param limit 2100 on the delete)
+DEFAULT_FORECAST_WORKERS = 1 # 1 = compute in-process; 0 = one worker per CPU core
+DEFAULT_FORECAST_CHUNK_SKUS = 2000 # SKU columns per process-pool task
 
 class ForecastingEngine:
     def __init__(self, db: Session):
         self.db = db
+        DailyAggregates(db).ensure_built() # Sales history is read from Fact_Sales_Daily
+
 
     def calculate_forecast(self, sku_id: str, model_type: str = 'SMA', periods: int = 30):
         """
@@ -17,9 +31,9 @@ class ForecastingEngine:
         :param periods: Number of days to forecast into the future
         """
         # 1. Fetch Sales History
-        sales = self.db.query(FactSales.order_date, FactSales.quantity).filter(
-            FactSales.sku_id == sku_id
-        ).order_by(FactSales.order_date.asc()).all()
+        sales = self.db.query(FactSalesDaily.day.label('order_date'), FactSalesDaily.quantity).filter(
+            FactSalesDaily.sku_id == sku_id
+        ).order_by(FactSalesDaily.day.asc()).all()
 
         if not sales:
             return {"status": "error", "message": "No sales data found for this product"}
@@ -85,6 +99,7 @@ class ForecastingEngine:
         
         self.db.add_all(new_records)
         self.db.commit()
+        self._refresh_order_plan([sku_id])
         
         return {
             "status": "success", 
@@ -94,14 +109,198 @@ class ForecastingEngine:
             "avg_predicted_qty": round(sum(forecast_values)/len(forecast_values), 2)
         }
 
+    def forecast_all(self, model_type: str = 'SMA', periods: int = 30, job=None, workers=None, chunk_skus=None):
+        """
+        Forecast every SKU with sales in one pass (same numbers as calculate_forecast per SKU).
+        - One GROUP BY (sku, day) query -> dense (day x sku) matrix
+        - SMA / EMA computed for all SKUs at once with NumPy (services/forecast_models.py),
+          optionally sharded by SKU columns across a process pool
+          (workers / chunk_skus, defaults from config FORECAST_WORKERS / FORECAST_CHUNK_SKUS)
+        - Fact_Forecasts rewritten for today's run_date in chunks of BATCH_SKU_CHUNK SKUs
+        Run as a FORECAST_ALL job (services.job_queue), progress goes to the job row
+        (done = SKUs written) and a cancel request stops the run between chunks.
+        """
+        if model_type not in MODELS:
+            raise ValueError(f"Unknown model: {model_type}")
+        if workers is None:
+            workers = self._get_number_config('FORECAST_WORKERS', DEFAULT_FORECAST_WORKERS)
+        if not chunk_skus:
+            chunk_skus = self._get_number_config('FORECAST_CHUNK_SKUS', DEFAULT_FORECAST_CHUNK_SKUS) or DEFAULT_FORECAST_CHUNK_SKUS
+        self._set_progress(job, stage='LOADING', done=0, total=0)
+
+        # 1. Daily sales matrix
+        rows = self.db.query(
+            FactSalesDaily.sku_id, FactSalesDaily.day, func.sum(FactSalesDaily.quantity)
+        ).group_by(FactSalesDaily.sku_id, FactSalesDaily.day).all()
+
+        if not rows:
+            self._set_progress(job, stage='DONE')
+            return {"status": "success", "model": model_type, "skus": 0, "rows_inserted": 0}
+
+        df = pd.DataFrame(rows, columns=['sku_id', 'day', 'quantity'])
+        df['day'] = pd.to_datetime(df['day'])
+        df['quantity'] = pd.to_numeric(df['quantity'], errors='coerce').fillna(0).astype(float)
+
+        sku_codes, sku_ids = pd.factorize(df['sku_id'], sort=True)
+        origin = df['day'].min()
+        day_idx = (df['day'] - origin).dt.days.to_numpy()
+        n_days, n_skus = int(day_idx.max()) + 1, len(sku_ids)
+        # Each SKU's series runs from its own first to last sale day (resample('D') per SKU)
+        matrix, first, last = dense_matrix(day_idx, sku_codes, df['quantity'].to_numpy(), n_days, n_skus)
+        del df, rows
+
+        self._set_progress(job, stage='COMPUTING', total=n_skus)
+
+        # 2. Forecast level per SKU
+        level = self._compute_levels(model_type, matrix, first, last, workers, chunk_skus)
+        del matrix
+
+        # 3. Write Fact_Forecasts (overwrite today's run, like calculate_forecast)
+        last_dates = (origin + pd.to_timedelta(last, unit='D')).date
+        done, inserted = self._write_forecasts([str(s) for s in sku_ids], last_dates, level, model_type, periods, job)
+        if done < n_skus:
+            return {"status": "cancelled", "model": model_type, "skus": done, "rows_inserted": inserted}
+
+        self._refresh_order_plan()
+        self._set_progress(job, stage='DONE')
+        return {
+            "status": "success",
+            "model": model_type,
+            "skus": n_skus,
+            "forecasted_days": periods,
+            "rows_inserted": inserted
+        }
+
+    def update_forecasts(self, model_type: str = None, periods: int = 30, full: bool = False):
+        """
+        Incremental refresh: fold new sales into Fact_Forecast_State and rewrite today's run
+        only for SKUs whose series moved (new complete days, rebuilds, or sales today).
+        SKUs without new sales keep their current forecast rows (their level cannot change).
+        model_type defaults to config FORECAST_MODEL ('SMA').
+        """
+        model_type = model_type or get_config(self.db, 'FORECAST_MODEL') or 'SMA'
+        if model_type not in ('SMA', 'EMA'):
+            raise ValueError(f"Incremental refresh supports SMA/EMA only, got {model_type}")
+
+        state = ForecastState(self.db)
+        changed = state.refresh(full=full)
+        self.db.commit()
+
+        sku_ids = sorted(changed | state.tail_skus())
+        levels = state.current_levels(sku_ids)
+        sku_ids = [sku for sku in sku_ids if sku in levels]
+        level_idx = 1 if model_type == 'SMA' else 2
+        done, inserted = self._write_forecasts(
+            sku_ids,
+            [levels[sku][0] for sku in sku_ids],
+            [levels[sku][level_idx] for sku in sku_ids],
+            model_type, periods
+        )
+        print(f"[FORECAST-STATE] {model_type}: {done} SKUs re-forecast.")
+        self._refresh_order_plan(sku_ids)
+        return {"status": "success", "model": model_type, "skus": done, "forecasted_days": periods, "rows_inserted": inserted}
+
+    def _refresh_order_plan(self, sku_ids=None):
+        """Bring Fact_Order_Plan in line with the new forecasts (best effort: forecasts are already committed)."""
+        try:
+            OrderPlanSnapshot(self.db).refresh(sku_ids)
+            self.db.commit()
+        except Exception as e:
+            self.db.rollback()
+            print(f"[ORDER-PLAN] Refresh after forecast failed: {e}")
+
+    def _write_forecasts(self, sku_ids, last_dates, level, model_type, periods, job=None):
+        """
+        Replace today's run for sku_ids: `periods` flat rows at level[i] after last_dates[i].
+        Commits every BATCH_SKU_CHUNK SKUs. Returns (skus written, rows inserted);
+        fewer SKUs than given means the job was cancelled.
+        """
+        self._set_progress(job, stage='WRITING', total=len(sku_ids))
+        today = datetime.now().date()
+        offsets = [timedelta(days=i + 1) for i in range(periods)]
+        stmt = insert(FactForecasts.__table__).execution_options(fast_executemany=True)
+
+        done, inserted = 0, 0
+        for i in range(0, len(sku_ids), BATCH_SKU_CHUNK):
+            if job is not None and job.cancelled():
+                self._set_progress(job, stage='CANCELLED')
+                return done, inserted
+
+            chunk_ids = sku_ids[i:i + BATCH_SKU_CHUNK]
+            self.db.query(FactForecasts).filter(
+                FactForecasts.run_date == today,
+                FactForecasts.sku_id.in_(chunk_ids)
+            ).delete(synchronize_session=False)
+
+            records = [
+                {
+                    'run_date': today,
+                    'sku_id': sku,
+                    'forecast_date': last_dates[i + j] + offset,
+                    'quantity_predicted': float(level[i + j]),
+                    'model_used': model_type
+                }
+                for j, sku in enumerate(chunk_ids)
+                for offset in offsets
+            ]
+            if records:
+                self.db.execute(stmt, records)
+            inserted += len(records)
+
+            done = i + len(chunk_ids)
+            self.db.commit()
+            self._set_progress(job, done=done)
+            print(f"[FORECAST-ALL] {done}/{len(sku_ids)} SKUs written.")
+        return done, inserted
+
+    def _compute_levels(self, model_type, matrix, first, last, workers, chunk_skus):
+        """
+        Forecast level per SKU column. With workers != 1 and more than one chunk of SKUs,
+        column shards go to a process pool; each worker gets only its own rows/columns as
+        plain arrays and the parent concatenates the results in column order.
+        """
+        n_skus = matrix.shape[1]
+        workers = workers or os.cpu_count() or 1
+        if workers <= 1 or n_skus <= chunk_skus:
+            return forecast_levels(model_type, matrix, first, last)
+
+        shards = []
+        for c0 in range(0, n_skus, chunk_skus):
+            c1 = min(c0 + chunk_skus, n_skus)
+            lo, hi = int(first[c0:c1].min()), int(last[c0:c1].max()) + 1
+            shards.append((
+                model_type,
+                np.ascontiguousarray(matrix[lo:hi, c0:c1]),
+                first[c0:c1] - lo,
+                last[c0:c1] - lo
+            ))
+
+        workers = min(workers, len(shards))
+        print(f"[FORECAST-ALL] {n_skus} SKUs in {len(shards)} shards on {workers} processes.")
+        # spawn: the API process is multi-threaded, fork could copy held locks into the workers
+        with ProcessPoolExecutor(max_workers=workers, mp_context=multiprocessing.get_context('spawn')) as pool:
+            return np.concatenate(list(pool.map(forecast_shard, shards)))
+
+    def _get_number_config(self, key, default):
+        value = get_config(self.db, key)
+        try:
+            return max(int(value), 0) if value not in (None, '') else default
+        except ValueError:
+            print(f"  ! Invalid {key}='{value}', using {default}")
+            return default
+
+    def _set_progress(self, job, stage=None, done=None, total=None):
+        if job is not None:
+            job.progress(done=done, total=total, stage=stage)
+
     def get_forecast_vs_actual(self, sku_id: str):
         """
         Returns merged actual sales and forecast data for visualization.
         """
         # Actuals
-        sales = self.db.query(FactSales.order_date, FactSales.quantity).filter(
-            FactSales.sku_id == sku_id
-        ).order_by(FactSales.order_date.asc()).all()
+        sales = self.db.query(FactSalesDaily.day.label('order_date'), FactSalesDaily.quantity).filter(
+            FactSalesDaily.sku_id == sku_id
+        ).order_by(FactSalesDaily.day.asc()).all()
         
         data = {}
         for s in sales:
@@ -136,12 +335,12 @@ class ForecastingEngine:
         """
         # 1. Fetch Aggregated Sales History
         sales = self.db.query(
-            FactSales.order_date, 
-            func.sum(FactSales.quantity).label('quantity')
-        ).join(DimProducts, FactSales.sku_id == DimProducts.sku_id)\
+            FactSalesDaily.day.label('order_date'), 
+            func.sum(FactSalesDaily.quantity).label('quantity')
+        ).join(DimProducts, FactSalesDaily.sku_id == DimProducts.sku_id)\
         .filter(DimProducts.group_id == group_id)\
-        .group_by(FactSales.order_date)\
-        .order_by(FactSales.order_date.asc()).all()
+        .group_by(FactSalesDaily.day)\
+        .order_by(FactSalesDaily.day.asc()).all()
 
         if not sales:
             return {"status": "error", "message": "No sales data found for this group"}
@@ -210,12 +409,12 @@ class ForecastingEngine:
         
         # Actuals (Aggregated)
         sales = self.db.query(
-            FactSales.order_date, 
-            func.sum(FactSales.quantity).label('quantity')
-        ).join(DimProducts, FactSales.sku_id == DimProducts.sku_id)\
+            FactSalesDaily.day.label('order_date'), 
+            func.sum(FactSalesDaily.quantity).label('quantity')
+        ).join(DimProducts, FactSalesDaily.sku_id == DimProducts.sku_id)\
         .filter(DimProducts.group_id == group_id)\
-        .group_by(FactSales.order_date)\
-        .order_by(FactSales.order_date.asc()).all()
+        .group_by(FactSalesDaily.day)\
+        .order_by(FactSalesDaily.day.asc()).all()
         
         data = {}
         for s in sales:
@@ -0,0 +1,110 @@
+from sqlalchemy.orm import Session
+from sqlalchemy import select
+from backend.models import DimProductGroups, DimProductGroupClosure
+
+class GroupClosure:
+    """
+    Maintains Dim_Product_Group_Closure (ancestor, descendant, depth) for the product group tree.
+    - filter()/descendants(): `DimProducts.group_id` in the subtree as one indexed semi-join
+    - move(): incremental update when a group is created or its parent changes
+    - rebuild(): full recompute from Dim_Product_Groups.parent_id
+    None of the methods commit (callers commit with their own transaction).
+    """
+    _checked = False # Per process: closure populated at least once
+
+    def __init__(self, db: Session):
+        self.db = db
+
+    def descendants(self, group_id):
+        """group_id and every group below it, as a selectable."""
+        self._ensure_built()
+        return select(DimProductGroupClosure.descendant_id).where(DimProductGroupClosure.ancestor_id == group_id)
+
+    def filter(self, column, group_id):
+        """`column` is group_id or one of its descendants (works even if the group has no closure row yet)."""
+        return (column == group_id) | column.in_(self.descendants(group_id))
+
+    def _ensure_built(self):
+        if GroupClosure._checked:
+            return
+        has_closure = self.db.query(DimProductGroupClosure.ancestor_id).first() is not None
+        if not has_closure and self.db.query(DimProductGroups.group_id).first() is not None:
+            print("[GROUP-CLOSURE] Closure table empty. Building...")
+            self.rebuild()
+            self.db.commit()
+        GroupClosure._checked = True
+
+    def rebuild(self):
+        parents = {gid: pid for gid, pid in self.db.query(DimProductGroups.group_id, DimProductGroups.parent_id).all()}
+        rows = []
+        for gid in parents:
+            # Walk up to the root (visited set guards against cycles in MISA data)
+            node, depth, visited = gid, 0, set()
+            while node and node not in visited:
+                visited.add(node)
+                rows.append({'ancestor_id': node, 'descendant_id': gid, 'depth': depth})
+                node = parents.get(node)
+                depth += 1
+
+        self.db.query(DimProductGroupClosure).delete(synchronize_session=False)
+        if rows:
+            self.db.bulk_insert_mappings(DimProductGroupClosure, rows)
+        print(f"[GROUP-CLOSURE] Rebuilt: {len(parents)} groups, {len(rows)} pairs.")
+        return len(rows)
+
+    def move(self, group_id, parent_id):
+        """
+        (Re)attach group_id and its whole subtree under parent_id (None = root).
+        Also used for new groups (subtree = the group itself).
+        """
+        self._ensure_self(group_id)
+        self.db.flush()
+
+        subtree = dict(self.db.query(DimProductGroupClosure.descendant_id, DimProductGroupClosure.depth).filter(
+            DimProductGroupClosure.ancestor_id == group_id
+        ).all())
+        if parent_id and parent_id in subtree:
+            print(f"[GROUP-CLOSURE] Skip move {group_id} -> {parent_id}: would create a cycle.")
+            return False
+
+        # 1. Detach: subtree rows pointing at the old ancestors
+        old_ancestors = [a for (a,) in self.db.query(DimProductGroupClosure.ancestor_id).filter(
+            DimProductGroupClosure.descendant_id == group_id,
+            DimProductGroupClosure.ancestor_id != group_id
+        ).all()]
+        members = list(subtree.keys())
+        chunk_size = 500 # SQL Server param limit (2100)
+        if old_ancestors:
+            for i in range(0, len(members), chunk_size):
+                self.db.query(DimProductGroupClosure).filter(
+                    DimProductGroupClosure.ancestor_id.in_(old_ancestors),
+                    DimProductGroupClosure.descendant_id.in_(members[i:i + chunk_size])
+                ).delete(synchronize_session=False)
+
+        # 2. Attach: every ancestor of the new parent (and the parent itself) x every subtree member
+        if parent_id:
+            ancestors = dict(self.db.query(DimProductGroupClosure.ancestor_id, DimProductGroupClosure.depth).filter(
+                DimProductGroupClosure.descendant_id == parent_id
+            ).all())
+            ancestors.setdefault(parent_id, 0) # Parent not synced yet: it links up when it arrives
+            rows = [
+                {'ancestor_id': a, 'descendant_id': d, 'depth': a_depth + d_depth + 1}
+                for a, a_depth in ancestors.items()
+                for d, d_depth in subtree.items()
+            ]
+            self.db.bulk_insert_mappings(DimProductGroupClosure, rows)
+        return True
+
+    def remove(self, group_id):
+        """Drop a deleted group from the closure (its children keep their other ancestors)."""
+        self.db.query(DimProductGroupClosure).filter(
+            (DimProductGroupClosure.ancestor_id == group_id) | (DimProductGroupClosure.descendant_id == group_id)
+        ).delete(synchronize_session=False)
+
+    def _ensure_self(self, group_id):
+        exists = self.db.query(DimProductGroupClosure.depth).filter(
+            DimProductGroupClosure.ancestor_id == group_id,
+            DimProductGroupClosure.descendant_id == group_id
+        ).first()
+        if not exists:
+            self.db.add(DimProductGroupClosure(ancestor_id=group_id, descendant_id=group_id, depth=0))
@@ -0,0 +1,82 @@
+"""
+Background job types run by services.job_queue (one handler per long-running operation).
+Each handler gets its own session (db), the JSON params it was submitted with, and the JobContext.
+"""
+from datetime import date
+from backend.services.job_queue import job_type
+from backend.services.db_lock import db_lock, ROLLING_CALC_LOCK
+
+MISA_SYNC_TARGETS = ('all', 'units', 'groups', 'warehouses', 'partners', 'products')
+
+@job_type('MISA_SYNC', concurrency=1) # One MISA dictionary sync at a time (shared token + rate limit)
+def run_misa_sync(db, params, job):
+    from backend.services.sync_service import SyncService
+    target = params.get('target', 'all')
+    svc = SyncService(db, job=job)
+    job.progress(stage=f"SYNC_{target.upper()}")
+    if target == 'all': svc.sync_all_master_data()
+    elif target == 'units': svc.sync_units()
+    elif target == 'groups': svc.sync_product_groups()
+    elif target == 'warehouses': svc.sync_warehouses()
+    elif target == 'partners': svc.sync_customers_and_vendors()
+    elif target == 'products': svc.sync_products()
+    else:
+        raise ValueError(f"Invalid sync target: {target}")
+    return {"target": target}
+
+@job_type('CRM_INVENTORY_SYNC', concurrency=1)
+def run_crm_inventory_sync(db, params, job):
+    from backend.services.sync_service import SyncService
+    ok = SyncService(db, job=job).sync_crm_inventory()
+    if not ok and not job.cancel_seen:
+        raise RuntimeError("CRM inventory sync failed (see System_Sync_Logs)")
+    return {"synced": True}
+
+@job_type('FORECAST_ALL', concurrency=1)
+def run_forecast_all(db, params, job):
+    from backend.services.forecasting import ForecastingEngine
+    return ForecastingEngine(db).forecast_all(
+        params.get('model', 'SMA'), params.get('periods', 30), job=job, workers=params.get('workers')
+    )
+
+@job_type('ROLLING_RUN', concurrency=1) # Runs rewrite overlapping Fact_Rolling_Inventory ranges
+def run_rolling(db, params, job):
+    from backend.services.rolling_calc import RollingPlanningEngine
+    from backend.services.auto_calc import lock_timeout
+    run_date = params.get('run_date')
+    job.progress(stage='WAITING_LOCK')
+    profile_id = params.get('profile_id', 'STD')
+
+    def calculate(engine, pid, wh):
+        return engine.run_rolling_calculation(
+            sku_list=params.get('sku_ids'),
+            horizon_months=params.get('horizon_months', 12),
+            profile_id=pid,
+            group_id=params.get('group_id'),
+            warehouse_id=wh,
+            run_date=date.fromisoformat(run_date) if run_date else None,
+            engine_mode=params.get('engine_mode')
+        )
+
+    with db_lock(db.get_bind(), ROLLING_CALC_LOCK, lock_timeout(db)):
+        job.progress(stage='CALCULATING')
+        if profile_id != 'ALL':
+            calculate(RollingPlanningEngine(db), profile_id, params.get('warehouse_id', 'ALL'))
+            return {"profile_id": profile_id}
+        # Every active profile, one partition each, in parallel
+        from backend.services.rolling_partitions import RollingPartitionRunner
+        runner = RollingPartitionRunner(db)
+        summary = runner.run(calculate, runner.partitions(warehouse_ids=[params.get('warehouse_id') or 'ALL']), job=job)
+    if summary["errors"]:
+        raise RuntimeError(f"{len(summary['errors'])} partition(s) failed: " + "; ".join(summary["errors"]))
+    return {"profile_id": profile_id, **summary}
+
+# Debounced recalculation after imports (services.auto_calc). dedup_running=False: once a run has
+# started, the next trigger queues exactly one follow-up instead of being swallowed by it.
+@job_type('AUTO_CALC', concurrency=1, dedup_running=False)
+def run_auto_calc(db, params, job):
+    from backend.services.auto_calc import run_auto_calculation, lock_timeout
+    job.progress(stage='WAITING_LOCK')
+    with db_lock(db.get_bind(), ROLLING_CALC_LOCK, lock_timeout(db)):
+        return run_auto_calculation(db, full=params.get('full', False),
+                                    refresh_forecasts=params.get('refresh_forecasts', False), job=job)
@@ -0,0 +1,421 @@
+import os
+import json
+import time
+import socket
+import hashlib
+import threading
+import multiprocessing
+from datetime import datetime, timedelta
+from concurrent.futures import ThreadPoolExecutor, ProcessPoolExecutor
+from sqlalchemy.orm import Session, aliased
+from sqlalchemy import func, select, update, or_, cast, String
+from sqlalchemy.exc import IntegrityError
+from backend.models import SystemJobs
+from backend.services.dimension_cache import get_config
+
+ACTIVE_STATUSES = ('QUEUED', 'RUNNING')
+FINAL_STATUSES = ('SUCCESS', 'ERROR', 'CANCELLED')
+
+DEFAULT_JOB_WORKERS = 4 # Jobs run at the same time by one API process
+DEFAULT_JOB_POOL = 'thread' # 'thread' or 'process' (spawned workers, own DB connections)
+DEFAULT_STALE_SECONDS = 300 # RUNNING without heartbeat for this long = worker died
+POLL_SECONDS = 2.0 # Dispatcher wakes at least this often (other processes may enqueue)
+HEARTBEAT_SECONDS = 30.0
+
+# --- JOB TYPES ---
+
+JOB_TYPES = {} # job_type -> {'handler': fn(db, params, job) -> dict, 'concurrency': int, 'dedup_running': bool}
+
+def job_type(name, concurrency=1, dedup_running=True):
+    """
+    Register a job handler. The handler runs with its own session and gets (db, params, job);
+    it reports through job.progress() and should stop when job.cancelled() is True.
+    concurrency: RUNNING jobs of this type across all processes (config JOB_CONCURRENCY_<TYPE> overrides).
+    dedup_running=False: a running job no longer absorbs new submits (its dedup_key is released
+    when claimed), so work arriving during a run queues exactly one follow-up job.
+    """
+    def register(handler):
+        JOB_TYPES[name] = {'handler': handler, 'concurrency': concurrency, 'dedup_running': dedup_running}
+        return handler
+    return register
+
+def _load_handlers():
+    import backend.services.job_handlers # noqa: F401 (registers the job types)
+
+def registered_job_types():
+    """{job_type: default concurrency}"""
+    _load_handlers()
+    return {name: spec['concurrency'] for name, spec in JOB_TYPES.items()}
+
+def _worker_name():
+    return f"{socket.gethostname()}:{os.getpid()}"
+
+def _session():
+    # Looked up at call time: reload_engine() may have replaced SessionLocal
+    from backend.database import SessionLocal
+    return SessionLocal()
+
+class JobCancelled(Exception):
+    """Raised by handlers (or job.check_cancelled()) to stop a job that was asked to cancel."""
+
+class JobContext:
+    """
+    Handed to a running job. Progress and the cancel flag live on the System_Jobs row and go
+    through a private session, so they never commit the handler's own transaction.
+    """
+    def __init__(self, job_id):
+        self.job_id = job_id
+        self.cancel_seen = False
+
+    def progress(self, done=None, total=None, stage=None):
+        values = {SystemJobs.heartbeat_at: datetime.now()}
+        if done is not None:
+            values[SystemJobs.progress_done] = int(done)
+        if total is not None:
+            values[SystemJobs.progress_total] = int(total)
+        if stage is not None:
+            values[SystemJobs.stage] = stage
+        db = _session()
+        try:
+            db.query(SystemJobs).filter(SystemJobs.job_id == self.job_id).update(values, synchronize_session=False)
+            db.commit()
+        finally:
+            db.close()
+
+    def cancelled(self):
+        if self.cancel_seen:
+            return True
+        db = _session()
+        try:
+            flag = db.query(SystemJobs.cancel_requested).filter(SystemJobs.job_id == self.job_id).scalar()
+        finally:
+            db.close()
+        self.cancel_seen = bool(flag)
+        return self.cancel_seen
+
+    def check_cancelled(self):
+        if self.cancelled():
+            raise JobCancelled()
+
+# --- QUEUE API ---
+
+class JobQueue:
+    """
+    Enqueue / inspect / cancel jobs (System_Jobs).
+    - submit(): single-flight: while a job with the same dedup_key is QUEUED or RUNNING,
+      returns that job instead of adding another one
+    - cancel(): QUEUED jobs are cancelled at once, RUNNING ones get cancel_requested
+    All methods commit.
+    """
+    def __init__(self, db: Session):
+        self.db = db
+
+    def submit(self, job_type_name, params=None, dedup_key=None, not_before=None):
+        """
+        Returns (job, created). dedup_key defaults to the job type + a hash of the params.
+        not_before: earliest time the job may start (None = as soon as a worker is free).
+        """
+        _load_handlers()
+        if job_type_name not in JOB_TYPES:
+            raise ValueError(f"Unknown job type: {job_type_name}")
+        params = params or {}
+        params_json = json.dumps(params, sort_keys=True, default=str)
+        if dedup_key is None:
+            dedup_key = f"{job_type_name}:{hashlib.sha1(params_json.encode('utf-8')).hexdigest()}"
+
+        existing = self._active(dedup_key)
+        if existing:
+            return existing, False
+        job = SystemJobs(job_type=job_type_name, dedup_key=dedup_key, params=params_json, status='QUEUED',
+                         cancel_requested=False, progress_done=0, created_at=datetime.now(), not_before=not_before)
+        self.db.add(job)
+        try:
+            self.db.commit()
+        except IntegrityError:
+            # Lost the race against another request/process: the unique index kept theirs
+            self.db.rollback()
+            existing = self._active(dedup_key)
+            if existing:
+                return existing, False
+            raise
+        job_runner.start()
+        job_runner.wake()
+        return job, True
+
+    def get(self, job_id):
+        return self.db.query(SystemJobs).filter(SystemJobs.job_id == job_id).first()
+
+    def list(self, status=None, job_type_name=None, limit=50):
+        query = self.db.query(SystemJobs)
+        if status == 'ACTIVE':
+            query = query.filter(SystemJobs.status.in_(ACTIVE_STATUSES))
+        elif status:
+            query = query.filter(SystemJobs.status == status)
+        if job_type_name:
+            query = query.filter(SystemJobs.job_type == job_type_name)
+        return query.order_by(SystemJobs.job_id.desc()).limit(limit).all()
+
+    def cancel(self, job_id):
+        """Returns the job (None if unknown)."""
+        now = datetime.now()
+        self.db.query(SystemJobs).filter(SystemJobs.job_id == job_id, SystemJobs.status == 'QUEUED').update(
+            {SystemJobs.status: 'CANCELLED', SystemJobs.cancel_requested: True, SystemJobs.finished_at: now},
+            synchronize_session=False
+        )
+        self.db.query(SystemJobs).filter(SystemJobs.job_id == job_id, SystemJobs.status == 'RUNNING').update(
+            {SystemJobs.cancel_requested: True}, synchronize_session=False
+        )
+        self.db.commit()
+        return self.get(job_id)
+
+    def cancel_active(self, job_types=None):
+        """Cancel every QUEUED/RUNNING job (optionally only of job_types). Returns how many were flagged."""
+        query = self.db.query(SystemJobs.job_id).filter(SystemJobs.status.in_(ACTIVE_STATUSES))
+        if job_types:
+            query = query.filter(SystemJobs.job_type.in_(job_types))
+        ids = [job_id for (job_id,) in query.all()]
+        for job_id in ids:
+            self.cancel(job_id)
+        return len(ids)
+
+    def _active(self, dedup_key):
+        return self.db.query(SystemJobs).filter(
+            SystemJobs.dedup_key == dedup_key, SystemJobs.status.in_(ACTIVE_STATUSES)
+        ).first()
+
+def job_to_dict(job):
+    total = job.progress_total
+    done = job.progress_done or 0
+    return {
+        "job_id": job.job_id,
+        "job_type": job.job_type,
+        "status": job.status,
+        "stage": job.stage,
+        "done": done,
+        "total": total,
+        "percent": round(done * 100.0 / total, 1) if total else None,
+        "cancel_requested": bool(job.cancel_requested),
+        "params": json.loads(job.params) if job.params else {},
+        "result": json.loads(job.result) if job.result else None,
+        "error": job.error_message,
+        "worker": job.worker,
+        "created_at": job.created_at,
+        "not_before": job.not_before,
+        "started_at": job.started_at,
+        "finished_at": job.finished_at
+    }
+
+# --- EXECUTION ---
+
+def execute_job(job_id):
+    """
+    Run one claimed job to completion in this thread/process and record the outcome.
+    Module-level so the process pool can pickle it.
+    """
+    _load_handlers()
+    db = _session()
+    job = JobContext(job_id)
+    try:
+        row = db.query(SystemJobs).filter(SystemJobs.job_id == job_id).first()
+        spec = JOB_TYPES.get(row.job_type)
+        params = json.loads(row.params) if row.params else {}
+        print(f">>> [JOBS] Job {job_id} {row.job_type} started...")
+        try:
+            if spec is None:
+                raise ValueError(f"Unknown job type: {row.job_type}")
+            result = spec['handler'](db, params, job)
+            db.commit()
+            status = 'CANCELLED' if job.cancel_seen else 'SUCCESS'
+            error = None
+        except JobCancelled:
+            db.rollback()
+            status, result, error = 'CANCELLED', None, None
+        except Exception as e:
+            db.rollback()
+            status, result, error = 'ERROR', None, str(e)
+            print(f"!!! [JOBS] Job {job_id} failed: {e}")
+
+        db.query(SystemJobs).filter(SystemJobs.job_id == job_id).update({
+            SystemJobs.status: status,
+            SystemJobs.result: json.dumps(result, default=str) if result is not None else None,
+            SystemJobs.error_message: error,
+            SystemJobs.stage: 'DONE' if status == 'SUCCESS' else status,
+            SystemJobs.finished_at: datetime.now()
+        }, synchronize_session=False)
+        db.commit()
+        print(f"<<< [JOBS] Job {job_id} {status}.")
+        return status
+    finally:
+        db.close()
+
+class JobRunner:
+    """
+    Per-process dispatcher: claims QUEUED jobs (oldest first) and runs them on a bounded pool.
+    - A claim is one conditional UPDATE (still QUEUED, and fewer RUNNING jobs of its type than
+      the type's concurrency limit), so several uvicorn workers can share the queue
+    - Heartbeats mark this process's jobs alive; RUNNING jobs whose heartbeat is older than
+      JOB_STALE_SECONDS are failed (their process died), never re-run automatically
+    Pool size / kind come from config JOB_WORKERS / JOB_POOL ('thread' or 'process') at start.
+    """
+    def __init__(self):
+        self._lock = threading.Lock()
+        self._wake = threading.Event()
+        self._stop = threading.Event()
+        self._thread = None
+        self._pool = None
+        self._workers = DEFAULT_JOB_WORKERS
+        self._running = {} # job_id -> future
+        self._last_heartbeat = 0.0
+
+    def start(self):
+        with self._lock:
+            if self._thread and self._thread.is_alive():
+                return
+            _load_handlers()
+            self._configure()
+            self._stop.clear()
+            self._thread = threading.Thread(target=self._loop, name="job-dispatcher", daemon=True)
+            self._thread.start()
+        print(f"[JOBS] Runner started ({self._workers} workers).")
+
+    def stop(self, wait=False):
+        self._stop.set()
+        self._wake.set()
+        if self._pool:
+            self._pool.shutdown(wait=wait, cancel_futures=True)
+
+    def wake(self):
+        self._wake.set()
+
+    def _configure(self):
+        db = _session()
+        try:
+            try:
+                self._workers = max(int(get_config(db, 'JOB_WORKERS') or DEFAULT_JOB_WORKERS), 1)
+            except ValueError:
+                self._workers = DEFAULT_JOB_WORKERS
+            kind = (get_config(db, 'JOB_POOL') or DEFAULT_JOB_POOL).lower()
+        finally:
+            db.close()
+        if kind == 'process':
+            self._pool = ProcessPoolExecutor(max_workers=self._workers, mp_context=multiprocessing.get_context('spawn'))
+        else:
+            self._pool = ThreadPoolExecutor(max_workers=self._workers, thread_name_prefix="job")
+
+    def _loop(self):
+        while not self._stop.is_set():
+            try:
+                self._heartbeat()
+                self._fail_stale()
+                self._dispatch()
+            except Exception as e:
+                print(f"!!! [JOBS] Dispatcher error: {e}")
+            self._wake.wait(POLL_SECONDS)
+            self._wake.clear()
+
+    def _dispatch(self):
+        with self._lock:
+            free = self._workers - len(self._running)
+        if free <= 0:
+            return
+        db = _session()
+        try:
+            now = datetime.now()
+            candidates = db.query(SystemJobs.job_id, SystemJobs.job_type).filter(
+                SystemJobs.status == 'QUEUED',
+                or_(SystemJobs.not_before.is_(None), SystemJobs.not_before <= now)
+            ).order_by(SystemJobs.job_id).limit(50).all()
+            for job_id, type_name in candidates:
+                if free <= 0:
+                    break
+                if self._claim(db, job_id, type_name):
+                    future = self._pool.submit(execute_job, job_id)
+                    with self._lock:
+                        self._running[job_id] = future
+                    future.add_done_callback(lambda f, job_id=job_id: self._finished(job_id, f))
+                    free -= 1
+        finally:
+            db.close()
+
+    def _claim(self, db, job_id, type_name):
+        limit = self._concurrency(db, type_name)
+        other = aliased(SystemJobs)
+        running = select(func.count()).select_from(other).where(
+            other.job_type == type_name, other.status == 'RUNNING'
+        ).scalar_subquery()
+        now = datetime.now()
+        values = dict(status='RUNNING', worker=_worker_name(), started_at=now, heartbeat_at=now, stage='STARTING')
+        if not JOB_TYPES.get(type_name, {}).get('dedup_running', True):
+            values['dedup_key'] = SystemJobs.dedup_key + '#' + cast(SystemJobs.job_id, String) # Free the key
+        result = db.execute(
+            update(SystemJobs)
+            .where(SystemJobs.job_id == job_id, SystemJobs.status == 'QUEUED', running < limit)
+            .values(**values)
+            .execution_options(synchronize_session=False)
+        )
+        db.commit()
+        return result.rowcount == 1
+
+    def _concurrency(self, db, type_name):
+        default = JOB_TYPES.get(type_name, {}).get('concurrency', 1)
+        value = get_config(db, f"JOB_CONCURRENCY_{type_name}")
+        try:
+            return max(int(value), 1) if value not in (None, '') else default
+        except ValueError:
+            return default
+
+    def _finished(self, job_id, future):
+        with self._lock:
+            self._running.pop(job_id, None)
+        error = future.exception() if not future.cancelled() else None
+        if error:
+            # The pool itself failed (e.g. a dead worker process): record it on the row
+            db = _session()
+            try:
+                db.query(SystemJobs).filter(SystemJobs.job_id == job_id, SystemJobs.status == 'RUNNING').update({
+                    SystemJobs.status: 'ERROR', SystemJobs.error_message: str(error), SystemJobs.finished_at: datetime.now()
+                }, synchronize_session=False)
+                db.commit()
+            finally:
+                db.close()
+        self._wake.set()
+
+    def _heartbeat(self):
+        if time.monotonic() - self._last_heartbeat < HEARTBEAT_SECONDS:
+            return
+        self._last_heartbeat = time.monotonic()
+        with self._lock:
+            ids = list(self._running.keys())
+        if not ids:
+            return
+        db = _session()
+        try:
+            db.query(SystemJobs).filter(SystemJobs.job_id.in_(ids), SystemJobs.status == 'RUNNING').update(
+                {SystemJobs.heartbeat_at: datetime.now()}, synchronize_session=False
+            )
+            db.commit()
+        finally:
+            db.close()
+
+    def _fail_stale(self):
+        db = _session()
+        try:
+            try:
+                stale_seconds = int(get_config(db, 'JOB_STALE_SECONDS') or DEFAULT_STALE_SECONDS)
+            except ValueError:
+                stale_seconds = DEFAULT_STALE_SECONDS
+            cutoff = datetime.now() - timedelta(seconds=stale_seconds)
+            count = db.query(SystemJobs).filter(
+                SystemJobs.status == 'RUNNING', SystemJobs.heartbeat_at < cutoff
+            ).update({
+                SystemJobs.status: 'ERROR',
+                SystemJobs.error_message: 'Worker lost (no heartbeat)',
+                SystemJobs.finished_at: datetime.now()
+            }, synchronize_session=False)
+            db.commit()
+            if count:
+                print(f"[JOBS] Marked {count} stale RUNNING jobs as ERROR.")
+        finally:
+            db.close()
+
+job_runner = JobRunner()
@@ -0,0 +1,178 @@
+from datetime import datetime, date, timedelta
+import numpy as np
+import pandas as pd
+from sqlalchemy.orm import Session
+from sqlalchemy import func, select, insert, and_
+from backend.models import DimProducts, FactInventorySnapshots, FactForecasts, FactOrderPlan, SystemConfig
+from backend.services.dimension_cache import get_seasonal_factors
+
+REFRESHED_KEY = 'ORDER_PLAN_REFRESHED_AT'
+DEFAULT_LEAD_TIME_DAYS = 7
+TARGET_MONTHS = 3 # "Safety Stock = 3 months" of average demand
+CHUNK_SIZE = 500 # SQL Server param limit (2100)
+
+class OrderPlanSnapshot:
+    """
+    Maintains Fact_Order_Plan (the ORDER sheet) so the order screen reads a pre-built table.
+    - refresh(): rebuilds all rows, or only sku_ids, with a few set-based queries + pandas
+      (stock = sum over warehouses of each SKU's latest snapshot; forecast = each SKU's latest run)
+    - ensure_current(): readers call it; rebuilds when never built or built in an earlier month
+      (month 1 / month 2 columns are relative to the refresh date)
+    Only ensure_current() commits.
+    """
+    def __init__(self, db: Session):
+        self.db = db
+
+    # --- BUILD STATE ---
+
+    def refreshed_at(self):
+        value = self.db.query(SystemConfig.config_value).filter(SystemConfig.config_key == REFRESHED_KEY).scalar()
+        return datetime.fromisoformat(value) if value else None
+
+    def ensure_current(self):
+        refreshed = self.refreshed_at()
+        today = date.today()
+        if refreshed and (refreshed.year, refreshed.month) == (today.year, today.month):
+            return
+        print("[ORDER-PLAN] Snapshot missing or from a previous month. Refreshing...")
+        self.refresh()
+        self.db.commit()
+
+    def _mark_refreshed(self, now):
+        obj = self.db.query(SystemConfig).filter(SystemConfig.config_key == REFRESHED_KEY).first()
+        if not obj:
+            obj = SystemConfig(config_key=REFRESHED_KEY, description="Last full refresh of Fact_Order_Plan")
+            self.db.add(obj)
+        obj.config_value = now.isoformat(timespec='seconds')
+        obj.updated_at = now
+
+    # --- REFRESH ---
+
+    def refresh(self, sku_ids=None):
+        """Rebuild the order plan rows (all products, or only sku_ids). Returns rows written."""
+        today = date.today()
+        now = datetime.now()
+        chunks = [None] if sku_ids is None else [list(sku_ids)[i:i + CHUNK_SIZE] for i in range(0, len(sku_ids), CHUNK_SIZE)]
+
+        # 1. Inputs (one query each per chunk)
+        products = pd.concat([self._products(c) for c in chunks], ignore_index=True) if chunks else pd.DataFrame()
+        if sku_ids is None:
+            self.db.query(FactOrderPlan).delete(synchronize_session=False)
+        else:
+            for chunk in chunks:
+                self.db.query(FactOrderPlan).filter(FactOrderPlan.sku_id.in_(chunk)).delete(synchronize_session=False)
+        if products.empty:
+            if sku_ids is None:
+                self._mark_refreshed(now)
+            return 0
+
+        stock = pd.concat([self._latest_stock(c) for c in chunks], ignore_index=True)
+        forecasts = pd.concat([self._latest_forecasts(c, today) for c in chunks], ignore_index=True)
+
+        # 2. Month columns (same months as the sheet: this month, next month)
+        current_month = today.month
+        next_month = (today.replace(day=28) + timedelta(days=4)).month
+        seasonal_map = {s.month: s.demand_multiplier for s in get_seasonal_factors(self.db)}
+
+        forecasts['month'] = pd.to_datetime(forecasts['forecast_date']).dt.month
+        # One value per (sku, month): the latest forecast day of the month in the SKU's latest run
+        monthly = forecasts.sort_values('forecast_date').drop_duplicates(['sku_id', 'month'], keep='last')
+        monthly = monthly.pivot(index='sku_id', columns='month', values='quantity')
+
+        df = products.merge(stock, on='sku_id', how='left')
+        df['current_stock'] = df['current_stock'].fillna(0).astype(float)
+        for col, month in (('m1', current_month), ('m2', next_month)):
+            base = df['sku_id'].map(monthly[month]) if month in monthly.columns else pd.Series(0.0, index=df.index)
+            factor = seasonal_map.get(month)
+            df[col] = base.fillna(0).astype(float) * float(factor if factor is not None else 1.0)
+
+        # 3. Vectorized ORDER formula
+        total = df['m1'] + df['m2']
+        avg_monthly = np.where(total > 0, total / 2, 0)
+        target = avg_monthly * TARGET_MONTHS
+        on_order = 0.0 # Not tracked in the snapshot yet
+        suggested = np.maximum(target - (df['current_stock'].to_numpy() + on_order), 0)
+        moq = df['moq'].fillna(0).astype(float).to_numpy()
+        suggested = np.where((moq > 0) & (suggested > 0) & (suggested < moq), moq, suggested)
+        lead = df['lead_time_days'].fillna(0).astype(int)
+        lead = lead.where(lead != 0, DEFAULT_LEAD_TIME_DAYS)
+
+        records = [
+            {
+                'sku_id': sku,
+                'product_name': name,
+                'group_id': group,
+                'current_stock': float(cur),
+                'stock_on_order': on_order,
+                'safety_stock': round(float(tgt), 2),
+                'lead_time_days': int(lt),
+                'avg_sales': 0.0, # To be calc from history
+                'forecast_month_1': round(float(m1), 2),
+                'forecast_month_2': round(float(m2), 2),
+                'forecast_month_3': 0.0,
+                'suggested_order': round(float(sug), 2),
+                'notes': "Generated by Order Plan",
+                'refreshed_at': now
+            }
+            for sku, name, group, cur, tgt, lt, m1, m2, sug in zip(
+                df['sku_id'], df['product_name'].where(df['product_name'].notna(), None),
+                df['group_id'].where(df['group_id'].notna(), None), df['current_stock'],
+                target, lead, df['m1'], df['m2'], suggested
+            )
+        ]
+
+        # 4. Write (Core executemany)
+        stmt = insert(FactOrderPlan.__table__).execution_options(fast_executemany=True)
+        for i in range(0, len(records), 5000):
+            self.db.execute(stmt, records[i:i + 5000])
+        if sku_ids is None:
+            self._mark_refreshed(now)
+        print(f"[ORDER-PLAN] Refreshed {len(records)} SKUs.")
+        return len(records)
+
+    # --- INPUTS ---
+
+    def _products(self, chunk):
+        query = self.db.query(
+            DimProducts.sku_id, DimProducts.product_name, DimProducts.group_id,
+            DimProducts.moq, DimProducts.supplier_lead_time_days
+        )
+        if chunk is not None:
+            query = query.filter(DimProducts.sku_id.in_(chunk))
+        return pd.DataFrame(query.all(), columns=['sku_id', 'product_name', 'group_id', 'moq', 'lead_time_days'])
+
+    def _latest_stock(self, chunk):
+        """On-hand per SKU summed over warehouses, at the SKU's latest snapshot date."""
+        latest = select(
+            FactInventorySnapshots.sku_id, func.max(FactInventorySnapshots.snapshot_date).label('snapshot_date')
+        ).group_by(FactInventorySnapshots.sku_id)
+        if chunk is not None:
+            latest = latest.where(FactInventorySnapshots.sku_id.in_(chunk))
+        latest = latest.subquery()
+        rows = self.db.query(
+            FactInventorySnapshots.sku_id, func.sum(FactInventorySnapshots.quantity_on_hand)
+        ).join(latest, and_(
+            FactInventorySnapshots.sku_id == latest.c.sku_id,
+            FactInventorySnapshots.snapshot_date == latest.c.snapshot_date
+        )).group_by(FactInventorySnapshots.sku_id).all()
+        return pd.DataFrame(rows, columns=['sku_id', 'current_stock'])
+
+    def _latest_forecasts(self, chunk, today):
+        """Forecast rows from the start of this month to ~3 months ahead, latest run_date per SKU only."""
+        start_date = today.replace(day=1)
+        end_date = start_date + timedelta(days=100) # Approx 3 months
+        window = and_(FactForecasts.forecast_date >= start_date, FactForecasts.forecast_date <= end_date)
+
+        latest = select(
+            FactForecasts.sku_id, func.max(FactForecasts.run_date).label('run_date')
+        ).where(window).group_by(FactForecasts.sku_id)
+        if chunk is not None:
+            latest = latest.where(FactForecasts.sku_id.in_(chunk))
+        latest = latest.subquery()
+        rows = self.db.query(
+            FactForecasts.sku_id, FactForecasts.forecast_date, FactForecasts.quantity_predicted
+        ).join(latest, and_(
+            FactForecasts.sku_id == latest.c.sku_id,
+            FactForecasts.run_date == latest.c.run_date
+        )).filter(window).all()
+        return pd.DataFrame(rows, columns=['sku_id', 'forecast_date', 'quantity'])
@@ -1,17 +1,27 @@
 
 from sqlalchemy.orm import Session
-from sqlalchemy import func
+from sqlalchemy import func, case, select, insert
 from typing import List, Dict, Any
+from statistics import NormalDist
 import pandas as pd
+import numpy as np
 import math
-from datetime import datetime
-from backend.models import DimProducts, DimVendors, FactPurchasePlans, FactSales, PlanningPolicies, PlanningDistributionProfile, FactForecasts
+import time
+from datetime import datetime, date, timedelta
+from backend.models import DimProducts, DimVendors, FactPurchasePlans, FactSales, FactSalesDaily, PlanningPolicies, PlanningDistributionProfile, FactForecasts, FactRollingInventory
+from backend.services.dimension_cache import get_policies, get_default_policy
+from backend.services.daily_aggregates import DailyAggregates
+from backend.services.group_closure import GroupClosure
+
+DEFAULT_SERVICE_LEVEL = 0.95
+DEFAULT_REVIEW_DAYS = 30 # PlanningPolicies.review_period_days default
+MIN_SALE_DAYS = 5 # Fewer days with sales in the window: SS left unchanged
 
 class PlanningEngine:
     def __init__(self, db: Session):
         self.db = db
         # Cache policies for performance
-        self.policies = {p.policy_name: p for p in self.db.query(PlanningPolicies).all()}
+        self.policies = {p.policy_name: p for p in get_policies(self.db)}
 
     def _get_policy_param(self, policy_name: str, param: str, default: float) -> float:
         """Helper to get policy parameter or return default."""
@@ -20,8 +30,120 @@ class PlanningEngine:
             return getattr(policy, param)
         return default
 
-    def calculate_safety_stock(self):
+    def calculate_safety_stock(self, engine_mode=None):
+        """
+        Calculate Dynamic Safety Stock for all products in one pass:
+        SS = Z * StdDev_Daily_Demand * Sqrt(Lead_Time)
+
+        - Policy per product: policy_id, else apply_to_category, else the default policy
+        - Z from the policy's service_level_target (inverse normal CDF)
+        - StdDev of daily demand (zero-sale days included) over the policy's review_period_days,
+          from ONE grouped query on Fact_Sales_Daily (sum / sum of squares per review window)
+        - Written back with one bulk UPDATE
+        engine_mode='legacy' runs the old per-product loop.
+        """
+        if engine_mode == 'legacy':
+            return self.calculate_safety_stock_legacy()
+
+        t0 = time.perf_counter()
+        DailyAggregates(self.db).ensure_built()
+        today = date.today()
+
+        # 1. Products & their policy
+        products = self.db.query(
+            DimProducts.sku_id, DimProducts.category, DimProducts.policy_id, DimProducts.supplier_lead_time_days
+        ).all()
+        if not products:
+            return {"status": "success", "updated_products": 0}
+
+        policies = get_policies(self.db)
+        by_id = {p.policy_id: p for p in policies}
+        by_category = {}
+        for p in policies:
+            if p.apply_to_category:
+                by_category.setdefault(p.apply_to_category, p)
+        default = get_default_policy(self.db)
+
+        def resolve(policy_id, category):
+            return by_id.get(policy_id) or by_category.get(category) or default
+
+        resolved = [resolve(p.policy_id, p.category) for p in products]
+        windows = np.array([
+            (pol.review_period_days if pol and pol.review_period_days else DEFAULT_REVIEW_DAYS) for pol in resolved
+        ], dtype=np.int64)
+        z = np.array([self._z_factor(pol.service_level_target if pol else None) for pol in resolved])
+        lead_time = np.array([p.supplier_lead_time_days or 7 for p in products], dtype=float)
+
+        # 2. Demand statistics per SKU and review window (one query)
+        distinct_windows = sorted(set(windows.tolist()))
+        daily = self.db.query(
+            FactSalesDaily.sku_id.label('sku_id'),
+            FactSalesDaily.day.label('day'),
+            func.sum(FactSalesDaily.quantity).label('qty')
+        ).filter(
+            FactSalesDaily.day > today - timedelta(days=max(distinct_windows)),
+            FactSalesDaily.day <= today
+        ).group_by(FactSalesDaily.sku_id, FactSalesDaily.day).subquery()
+
+        columns = []
+        for w in distinct_windows:
+            in_window = daily.c.day > today - timedelta(days=w)
+            columns += [
+                func.sum(case((in_window, daily.c.qty), else_=0)),
+                func.sum(case((in_window, daily.c.qty * daily.c.qty), else_=0)),
+                func.sum(case((in_window, 1), else_=0))
+            ]
+        stats = {row[0]: row[1:] for row in self.db.query(daily.c.sku_id, *columns).group_by(daily.c.sku_id).all()}
+
+        # 3. Vectorized SS
+        n = len(products)
+        total = np.zeros(n)
+        total_sq = np.zeros(n)
+        sale_days = np.zeros(n)
+        w_pos = {w: i for i, w in enumerate(distinct_windows)}
+        for i, p in enumerate(products):
+            row = stats.get(p.sku_id)
+            if row:
+                k = 3 * w_pos[int(windows[i])]
+                total[i], total_sq[i], sale_days[i] = (float(v or 0) for v in row[k:k + 3])
+
+        days = windows.astype(float)
+        # Sample variance over all `days` (days without sales count as 0 demand)
+        variance = np.maximum(total_sq - total * total / days, 0) / np.maximum(days - 1, 1)
+        safety_stock = np.round(z * np.sqrt(variance) * np.sqrt(lead_time), 2)
+
+        # Not enough demand history: keep the current value (same rule as the legacy loop)
+        enough = sale_days >= MIN_SALE_DAYS
+
+        # 4. Bulk write-back
+        updates = [
+            {'sku_id': products[i].sku_id, 'min_stock_level': float(safety_stock[i])}
+            for i in np.flatnonzero(enough)
+        ]
+        if updates:
+            self.db.bulk_update_mappings(DimProducts, updates)
+        self.db.commit()
+
+        elapsed = round(time.perf_counter() - t0, 2)
+        print(f"[SAFETY-STOCK] Updated {len(updates)}/{n} products in {elapsed}s.")
+        return {
+            "status": "success",
+            "updated_products": len(updates),
+            "skipped_products": n - len(updates),
+            "elapsed_seconds": elapsed
+        }
+
+    @staticmethod
+    def _z_factor(service_level):
+        """Service level -> Z (0.95 -> 1.645). Clamped to [0.5, 0.9999]."""
+        level = service_level if service_level else DEFAULT_SERVICE_LEVEL
+        level = min(max(float(level), 0.5), 0.9999)
+        return NormalDist().inv_cdf(level)
+
+    def calculate_safety_stock_legacy(self):
         """
+        Per-product loop (one FactSales query each, std of sales lines over all history).
+        Kept for comparison; calculate_safety_stock() is the batch version.
         Calculate Dynamic Safety Stock using the formula:
         SS = Z * StdDev_Demand * Sqrt(Avg_Lead_Time)
         
@@ -68,8 +190,116 @@ class PlanningEngine:
         self.db.commit()
         return {"status": "success", "updated_products": updated_count}
 
-    def generate_purchase_plans(self):
+    def generate_purchase_plans(self, group_id=None, warehouse_id=None, profile_id=None, engine_mode=None):
+        """
+        Generate Purchase Plans based on Rolling Inventory 'Current' Net Requirement.
+        This ensures users see the same suggestion as in the Rolling Matrix.
+
+        Set-based: one query for requirements + product constraints, MOQ / pack-size rounding
+        with NumPy, DRAFT plans replaced only inside the scope (group subtree, warehouse, profile),
+        Core executemany inserts, one commit. No scope = regenerate every DRAFT (previous behaviour).
+        engine_mode='legacy' runs the old row-by-row loop.
+        """
+        if engine_mode == 'legacy':
+            return self.generate_purchase_plans_legacy()
+
+        today = date.today()
+        current_bucket_date = self._current_bucket_date(today)
+        print(f"Generating Plans for Bucket: {current_bucket_date} (group={group_id}, warehouse={warehouse_id}, profile={profile_id})")
+
+        # 1. Requirements in scope, with product constraints (inner join: unknown SKUs are skipped)
+        query = self.db.query(
+            FactRollingInventory.sku_id, FactRollingInventory.warehouse_id, FactRollingInventory.profile_id,
+            FactRollingInventory.net_requirement, FactRollingInventory.forecast_demand, FactRollingInventory.min_stock_policy,
+            DimProducts.moq, DimProducts.pack_size
+        ).join(DimProducts, DimProducts.sku_id == FactRollingInventory.sku_id).filter(
+            FactRollingInventory.bucket_date == current_bucket_date,
+            FactRollingInventory.net_requirement > 0
+        )
+        if warehouse_id:
+            query = query.filter(FactRollingInventory.warehouse_id == warehouse_id)
+        if profile_id:
+            query = query.filter(FactRollingInventory.profile_id == profile_id)
+        if group_id:
+            query = query.filter(GroupClosure(self.db).filter(DimProducts.group_id, group_id))
+        req = pd.DataFrame(query.all(), columns=[
+            'sku_id', 'warehouse_id', 'profile_id', 'net_requirement', 'forecast_demand', 'min_stock_policy', 'moq', 'pack_size'
+        ])
+
+        # 2. Constrained quantity: MOQ floor, then round up to the pack size
+        net = req['net_requirement'].to_numpy(dtype=float)
+        moq = req['moq'].fillna(0).to_numpy(dtype=float)
+        pack = req['pack_size'].fillna(1).to_numpy(dtype=float)
+        pack = np.where(pack > 0, pack, 1)
+        final_qty = np.where((moq > 0) & (net < moq), moq, net)
+        remainder = np.mod(final_qty, pack)
+        final_qty = np.where((pack > 1) & (remainder > 0), final_qty + (pack - remainder), final_qty)
+
+        # 3. Replace DRAFT plans in scope
+        delete_query = self.db.query(FactPurchasePlans).filter(FactPurchasePlans.status == 'DRAFT')
+        if warehouse_id:
+            delete_query = delete_query.filter(FactPurchasePlans.warehouse_id == warehouse_id)
+        if profile_id:
+            delete_query = delete_query.filter(FactPurchasePlans.profile_id == profile_id)
+        if group_id:
+            group_skus = select(DimProducts.sku_id).where(GroupClosure(self.db).filter(DimProducts.group_id, group_id))
+            delete_query = delete_query.filter(FactPurchasePlans.sku_id.in_(group_skus))
+        deleted = delete_query.delete(synchronize_session=False)
+
+        # 4. Bulk insert
+        notes = f"Generated from Rolling Calc (Bucket {current_bucket_date})"
+        records = [
+            {
+                'plan_date': today,
+                'sku_id': sku,
+                'warehouse_id': wh or 'ALL',
+                'profile_id': prof,
+                'vendor_id': None, # To be assigned
+                'forecast_demand': fd,
+                'safety_stock_required': ss,
+                'suggested_quantity': n, # Raw need
+                'final_quantity': float(q), # Constrained need
+                'total_amount': 0,
+                'currency': 'VND',
+                'status': 'DRAFT',
+                'notes': notes
+            }
+            for sku, wh, prof, fd, ss, n, q in zip(
+                req['sku_id'], req['warehouse_id'], req['profile_id'], req['forecast_demand'],
+                req['min_stock_policy'], req['net_requirement'], final_qty
+            )
+        ]
+        stmt = insert(FactPurchasePlans.__table__).execution_options(fast_executemany=True)
+        chunk_size = 5000
+        try:
+            for i in range(0, len(records), chunk_size):
+                self.db.execute(stmt, records[i:i + chunk_size])
+            self.db.commit()
+        except Exception:
+            self.db.rollback()
+            raise
+
+        print(f"[PLANS] Replaced {deleted} DRAFT plans with {len(records)} new ones.")
+        return {
+            "status": "success",
+            "plans_generated": len(records),
+            "drafts_replaced": deleted,
+            "bucket_date": str(current_bucket_date)
+        }
+
+    @staticmethod
+    def _current_bucket_date(today):
+        # Logic: 1-7 -> 1; 8-14 -> 8; 15-21 -> 15; 22+ -> 22
+        day = today.day
+        bucket_day = 1
+        if day >= 22: bucket_day = 22
+        elif day >= 15: bucket_day = 15
+        elif day >= 8: bucket_day = 8
+        return date(today.year, today.month, bucket_day)
+
+    def generate_purchase_plans_legacy(self):
         """
+        Row-by-row version of generate_purchase_plans (all scopes, ORM adds). Kept for comparison.
         Generate Purchase Plans based on Rolling Inventory 'Current' Net Requirement.
         This ensures users see the same suggestion as in the Rolling Matrix.
         """
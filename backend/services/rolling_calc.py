@@ -1,9 +1,15 @@
 
 from sqlalchemy.orm import Session
 from sqlalchemy import func
-from backend.models import DimProducts, FactSales, FactForecasts, FactRollingInventory, FactPurchasePlans, FactInventorySnapshots, PlanningDistributionProfile, FactPurchases
+from backend.models import DimProducts, FactSalesDaily, FactForecasts, FactRollingInventory, FactPurchasePlans, FactInventorySnapshots, PlanningDistributionProfile, FactPurchasesDaily
 from datetime import datetime, timedelta, date
+from backend.services.dimension_cache import get_profile, get_default_policy
+from backend.services.daily_aggregates import DailyAggregates
 import math
+import numpy as np
+import pandas as pd
+
+LOOKBACK_DAYS = 90 # Stored-procedure runs restart ~3 months back to capture late imports
 
 class RollingPlanningEngine:
     def __init__(self, db: Session):
@@ -41,6 +47,7 @@ class RollingPlanningEngine:
         Handles chunking to avoid SQL Server param limit (2100).
         """
         print(f"Prefetching data for {len(sku_list)} SKUs from {start_date} to {end_date}...")
+        DailyAggregates(self.db).ensure_built()
         
         chunk_size = 500
         sku_chunks = [sku_list[i:i + chunk_size] for i in range(0, len(sku_list), chunk_size)]
@@ -67,26 +74,24 @@ class RollingPlanningEngine:
             
             # 2. Sales
             print("    Fetching Sales...")
-            sales = self.db.query(FactSales).filter(
-                FactSales.sku_id.in_(chunk),
-                FactSales.order_date >= start_date,
-                FactSales.order_date <= end_date
+            sales = self.db.query(FactSalesDaily.sku_id, FactSalesDaily.day, FactSalesDaily.quantity).filter(
+                FactSalesDaily.sku_id.in_(chunk),
+                FactSalesDaily.day >= start_date,
+                FactSalesDaily.day <= end_date
             ).all()
             for s in sales:
-                d = s.order_date.date() if isinstance(s.order_date, datetime) else s.order_date
-                key = (s.sku_id, d)
+                key = (s.sku_id, s.day)
                 sales_map[key] = sales_map.get(key, 0) + (s.quantity or 0)
 
             # 3. Purchases
             print("    Fetching Purchases...")
-            purchases = self.db.query(FactPurchases).filter(
-                FactPurchases.sku_id.in_(chunk),
-                FactPurchases.order_date >= start_date,
-                FactPurchases.order_date <= end_date
+            purchases = self.db.query(FactPurchasesDaily.sku_id, FactPurchasesDaily.day, FactPurchasesDaily.purchase_type, FactPurchasesDaily.quantity).filter(
+                FactPurchasesDaily.sku_id.in_(chunk),
+                FactPurchasesDaily.day >= start_date,
+                FactPurchasesDaily.day <= end_date
             ).all()
             for p in purchases:
-                d = p.order_date.date() if isinstance(p.order_date, datetime) else p.order_date
-                key = (p.sku_id, d, p.purchase_type)
+                key = (p.sku_id, p.day, p.purchase_type)
                 purchases_map[key] = purchases_map.get(key, 0) + (p.quantity or 0)
 
             # 4. Checkpoints
@@ -181,19 +186,37 @@ class RollingPlanningEngine:
             self.db.rollback()
             print(f"Pruning Failed: {e}")
 
-    def run_sql_procedure(self, horizon_months=12, profile_id='STD', group_id=None, warehouse_id='ALL', run_date=None):
+    SQL_PROCEDURES = {
+        'v1': 'sp_RollingSupplyPlanning',   # Week cursor (original)
+        'v2': 'sp_RollingSupplyPlanning_v2' # Set-based (window functions)
+    }
+
+    @staticmethod
+    def lookback_run_date(today=None):
+        """Run date of the automatic (full and incremental) procedure runs: ~3 months before this month."""
+        today = today or date.today()
+        return today.replace(day=1) - timedelta(days=LOOKBACK_DAYS)
+
+    def run_sql_procedure(self, horizon_months=12, profile_id='STD', group_id=None, warehouse_id='ALL', run_date=None, procedure_version='v1', sku_list=None):
         """
         Executes the SQL Stored Procedure for high-performance calculation.
+        procedure_version: 'v1' (cursor) or 'v2' (set-based). Both write the same rows.
+        sku_list: only recalculate these SKUs (@SkuList); the rows of the others are left alone.
         """
         from sqlalchemy import text
+        proc_name = self.SQL_PROCEDURES.get(procedure_version)
+        if not proc_name:
+            raise ValueError(f"Unknown procedure version: {procedure_version}")
         try:
-            print(f"Executing Stored Procedure sp_RollingSupplyPlanning (Profile: {profile_id}, Group: {group_id}, Warehouse: {warehouse_id}, Date: {run_date})...")
+            scope = f", SKUs: {len(sku_list)}" if sku_list is not None else ""
+            print(f"Executing Stored Procedure {proc_name} (Profile: {profile_id}, Group: {group_id}, Warehouse: {warehouse_id}, Date: {run_date}{scope})...")
             # Handle 'ALL' for optional params if passed from UI
             g_param = group_id if group_id != 'ALL' else None
             w_param = warehouse_id if warehouse_id else 'ALL'
+            s_param = ','.join(sku_list) if sku_list is not None else None
 
-            self.db.execute(text("EXEC sp_RollingSupplyPlanning @HorizonMonths=:h, @ProfileID=:p, @GroupID=:g, @WarehouseID=:w, @RunDate=:d"), 
-                          {'h': horizon_months, 'p': profile_id, 'g': g_param, 'w': w_param, 'd': run_date})
+            self.db.execute(text(f"EXEC {proc_name} @HorizonMonths=:h, @ProfileID=:p, @GroupID=:g, @WarehouseID=:w, @RunDate=:d, @SkuList=:s"), 
+                          {'h': horizon_months, 'p': profile_id, 'g': g_param, 'w': w_param, 'd': run_date, 's': s_param})
             self.db.commit()
             print("SQL Calculation Complete.")
         except Exception as e:
@@ -201,27 +224,357 @@ class RollingPlanningEngine:
             print(f"SQL Execution Failed: {e}")
             raise e
 
-    def run_rolling_calculation(self, sku_list=None, horizon_months=12, profile_id='STD', group_id=None, warehouse_id='ALL', run_date=None):
+    # --- VECTORIZED ENGINE (NumPy) ---
+
+    def get_horizon_buckets(self, start_date, horizon_months):
+        """
+        Flatten the 4-period month split over the horizon.
+        Returns (bucket_starts, bucket_ends) as lists of dates.
+        """
+        starts, ends = [], []
+        iter_y, iter_m = start_date.year, start_date.month
+        for _ in range(horizon_months):
+            for p_start, p_end in self.get_period_date_ranges(iter_y, iter_m):
+                starts.append(p_start)
+                ends.append(p_end)
+            if iter_m == 12:
+                iter_m = 1
+                iter_y += 1
+            else:
+                iter_m += 1
+        return starts, ends
+
+    @staticmethod
+    def _bucket_index(dates, bucket_starts, bucket_ends):
+        """Map an array of dates to bucket positions (-1 when outside the horizon)."""
+        d = pd.to_datetime(pd.Series(dates)).values.astype('datetime64[D]')
+        b_start = np.array(bucket_starts, dtype='datetime64[D]')
+        b_end = np.array(bucket_ends, dtype='datetime64[D]')
+        idx = np.searchsorted(b_start, d, side='right') - 1
+        out_of_range = (idx < 0) | (d > b_end[-1])
+        idx[out_of_range] = -1
+        return idx
+
+    def load_dense_inputs(self, sku_ids, bucket_starts, bucket_ends, profile_id='STD', warehouse_id='ALL'):
+        """
+        Load every input of the rolling projection into dense (sku x bucket) arrays.
+        All aggregation happens in SQL (GROUP BY sku/day) so only one row per SKU-day
+        crosses the wire; the date -> bucket mapping is done with np.searchsorted.
+        Sales/purchases come from the daily aggregate tables (one row per SKU-day already).
+        """
+        from sqlalchemy import extract
+        from backend.models import FactOpeningStock
+        DailyAggregates(self.db).ensure_built()
+
+        n_sku, n_bucket = len(sku_ids), len(bucket_starts)
+        sku_pos = {sku: i for i, sku in enumerate(sku_ids)}
+        start_date, end_date = bucket_starts[0], bucket_ends[-1]
+        month0 = start_date.year * 12 + start_date.month - 1
+        n_month = n_bucket // 4
+
+        month_forecast = np.zeros((n_sku, n_month))
+        sold = np.zeros((n_sku, n_bucket))
+        imported = np.zeros((n_sku, n_bucket))
+        incoming_planned = np.zeros((n_sku, n_bucket))
+        checkpoint = np.full((n_sku, n_bucket), np.nan)
+        manual_open = np.full((n_sku, n_bucket), np.nan)
+        manual_planned = np.full((n_sku, n_bucket), np.nan)
+        existing_id = np.zeros((n_sku, n_bucket), dtype=np.int64)
+        latest_stock = np.zeros(n_sku)
+
+        def scatter(target, rows, date_col, value_col):
+            if not rows:
+                return
+            df = pd.DataFrame(rows, columns=['sku_id', date_col, value_col])
+            s_idx = df['sku_id'].map(sku_pos).to_numpy()
+            b_idx = self._bucket_index(df[date_col], bucket_starts, bucket_ends)
+            ok = b_idx >= 0
+            np.add.at(target, (s_idx[ok].astype(np.int64), b_idx[ok]), df[value_col].fillna(0).to_numpy(dtype=float)[ok])
+
+        chunk_size = 500 # SQL Server param limit (2100)
+        for i in range(0, n_sku, chunk_size):
+            chunk = sku_ids[i:i + chunk_size]
+
+            # 1. Forecasts (Monthly Totals)
+            f_year = extract('year', FactForecasts.forecast_date)
+            f_month = extract('month', FactForecasts.forecast_date)
+            rows = self.db.query(FactForecasts.sku_id, f_year, f_month, func.sum(FactForecasts.quantity_predicted)).filter(
+                FactForecasts.sku_id.in_(chunk),
+                FactForecasts.forecast_date >= start_date,
+                FactForecasts.forecast_date <= end_date
+            ).group_by(FactForecasts.sku_id, f_year, f_month).all()
+            for sku, y, m, qty in rows:
+                m_idx = int(y) * 12 + int(m) - 1 - month0
+                if 0 <= m_idx < n_month:
+                    month_forecast[sku_pos[sku], m_idx] += qty or 0
+
+            # 2. Sales (per day)
+            rows = self.db.query(FactSalesDaily.sku_id, FactSalesDaily.day, func.sum(FactSalesDaily.quantity)).filter(
+                FactSalesDaily.sku_id.in_(chunk),
+                FactSalesDaily.day >= start_date,
+                FactSalesDaily.day <= end_date
+            ).group_by(FactSalesDaily.sku_id, FactSalesDaily.day).all()
+            scatter(sold, rows, 'day', 'qty')
+
+            # 3. Purchases (per day & type)
+            rows = self.db.query(FactPurchasesDaily.sku_id, FactPurchasesDaily.day, FactPurchasesDaily.purchase_type, func.sum(FactPurchasesDaily.quantity)).filter(
+                FactPurchasesDaily.sku_id.in_(chunk),
+                FactPurchasesDaily.day >= start_date,
+                FactPurchasesDaily.day <= end_date
+            ).group_by(FactPurchasesDaily.sku_id, FactPurchasesDaily.day, FactPurchasesDaily.purchase_type).all()
+            scatter(imported, [(r[0], r[1], r[3]) for r in rows if r[2] == 'ACTUAL'], 'day', 'qty')
+            scatter(incoming_planned, [(r[0], r[1], r[3]) for r in rows if r[2] == 'PLANNED'], 'day', 'qty')
+
+            # 4. Checkpoints (first checkpoint date inside a bucket wins)
+            rows = self.db.query(FactOpeningStock.sku_id, FactOpeningStock.stock_date, func.sum(FactOpeningStock.quantity)).filter(
+                FactOpeningStock.sku_id.in_(chunk),
+                FactOpeningStock.stock_date >= start_date,
+                FactOpeningStock.stock_date <= end_date
+            ).group_by(FactOpeningStock.sku_id, FactOpeningStock.stock_date).all()
+            if rows:
+                df = pd.DataFrame(rows, columns=['sku_id', 'day', 'qty']).sort_values('day')
+                df['s_idx'] = df['sku_id'].map(sku_pos)
+                df['b_idx'] = self._bucket_index(df['day'], bucket_starts, bucket_ends)
+                df = df[df['b_idx'] >= 0].drop_duplicates(['s_idx', 'b_idx'], keep='first')
+                checkpoint[df['s_idx'].to_numpy(), df['b_idx'].to_numpy()] = df['qty'].to_numpy(dtype=float)
+
+            # 5. Existing Rolling Rows (for update-in-place & manual opening/planned overrides)
+            rows = self.db.query(
+                FactRollingInventory.sku_id, FactRollingInventory.bucket_date, FactRollingInventory.planning_id,
+                FactRollingInventory.is_manual_opening, FactRollingInventory.opening_stock,
+                FactRollingInventory.is_manual_planned, FactRollingInventory.planned_supply
+            ).filter(
+                FactRollingInventory.sku_id.in_(chunk),
+                FactRollingInventory.bucket_date >= start_date,
+                FactRollingInventory.bucket_date <= end_date,
+                FactRollingInventory.profile_id == profile_id,
+                FactRollingInventory.warehouse_id == warehouse_id
+            ).all()
+            if rows:
+                df = pd.DataFrame(rows, columns=['sku_id', 'day', 'planning_id', 'is_manual', 'opening', 'is_manual_planned', 'planned'])
+                s_idx = df['sku_id'].map(sku_pos).to_numpy()
+                b_idx = self._bucket_index(df['day'], bucket_starts, bucket_ends)
+                ok = b_idx >= 0
+                existing_id[s_idx[ok], b_idx[ok]] = df['planning_id'].to_numpy()[ok]
+                manual = ok & df['is_manual'].fillna(False).astype(bool).to_numpy()
+                manual_open[s_idx[manual], b_idx[manual]] = df['opening'].fillna(0).to_numpy(dtype=float)[manual]
+                manual = ok & df['is_manual_planned'].fillna(False).astype(bool).to_numpy()
+                manual_planned[s_idx[manual], b_idx[manual]] = df['planned'].fillna(0).to_numpy(dtype=float)[manual]
+
+            # 6. Latest Snapshots
+            rows = self.db.query(FactInventorySnapshots.sku_id, FactInventorySnapshots.quantity_on_hand).filter(
+                FactInventorySnapshots.sku_id.in_(chunk)
+            ).order_by(FactInventorySnapshots.snapshot_date).all()
+            for sku, qty in rows:
+                latest_stock[sku_pos[sku]] = qty or 0
+
+        return {
+            "month_forecast": month_forecast,
+            "sold": sold,
+            "imported": imported,
+            "incoming_planned": incoming_planned,
+            "checkpoint": checkpoint,
+            "manual_open": manual_open,
+            "manual_planned": manual_planned,
+            "existing_id": existing_id,
+            "latest_stock": latest_stock,
+        }
+
+    def project_vectorized(self, inputs, bucket_starts, bucket_ends, ratios, moq, policy_days, today):
+        """
+        Rolling projection for all SKUs at once.
+        Arrays are (sku x bucket); the closing -> opening carry makes this a scan over the
+        bucket axis (~48 steps for 12 months) while every step is vectorized across SKUs.
+        Mirrors the rules of the per-SKU Python loop in run_rolling_calculation.
+        """
+        n_sku, n_bucket = inputs["sold"].shape
+
+        # Forecast: monthly total (fallback 40) split by profile week ratios
+        month_fc = inputs["month_forecast"].copy()
+        month_fc[month_fc == 0] = 40
+        week_ratio = np.tile(np.asarray(ratios, dtype=float), n_bucket // 4)
+        forecast = np.repeat(month_fc, 4, axis=1) * week_ratio
+
+        sold = inputs["sold"]
+        actual_import = inputs["imported"]
+        incoming_planned = inputs["incoming_planned"]
+        incoming = np.where(actual_import > 0, actual_import, incoming_planned)
+
+        has_checkpoint = ~np.isnan(inputs["checkpoint"])
+        use_manual = ~np.isnan(inputs["manual_open"]) & ~has_checkpoint
+        moq = np.nan_to_num(np.asarray(moq, dtype=float))
+
+        opening = np.zeros((n_sku, n_bucket))
+        closing = np.zeros((n_sku, n_bucket))
+        planned = np.zeros((n_sku, n_bucket))
+        net_req = np.zeros((n_sku, n_bucket))
+        target = np.zeros((n_sku, n_bucket))
+
+        rolling_open = inputs["latest_stock"].astype(float).copy()
+        for b in range(n_bucket):
+            # A/B. Opening overrides (checkpoint first, then manual edit)
+            rolling_open = np.where(has_checkpoint[:, b], inputs["checkpoint"][:, b], rolling_open)
+            rolling_open = np.where(use_manual[:, b], inputs["manual_open"][:, b], rolling_open)
+
+            # C. Outflow by bucket position relative to today
+            is_past = bucket_ends[b] < today
+            is_current = bucket_starts[b] <= today <= bucket_ends[b]
+            if is_past:
+                outflow = sold[:, b]
+            elif is_current:
+                outflow = np.maximum(sold[:, b], forecast[:, b])
+            else:
+                outflow = forecast[:, b]
+
+            # E. Closing & Net Requirement (MOQ floor)
+            tgt = np.where(outflow > 0, outflow / 7, 0.1) * policy_days
+            close_b = rolling_open + incoming[:, b] - outflow
+            short = close_b < tgt
+            req = np.where(short, tgt - close_b, 0.0)
+            req = np.where(short & (moq > 0) & (req < moq), moq, req)
+            plan_b = np.zeros(n_sku) if is_past else req
+            # F. Manual planned supply replaces the suggestion
+            plan_b = np.where(np.isnan(inputs["manual_planned"][:, b]), plan_b, inputs["manual_planned"][:, b])
+            close_b = close_b + plan_b
+
+            opening[:, b] = rolling_open
+            closing[:, b] = close_b
+            planned[:, b] = plan_b
+            net_req[:, b] = np.where(plan_b > 0, req, 0.0)
+            target[:, b] = tgt
+
+            # ROLLOVER
+            rolling_open = close_b
+
+        return {
+            "opening_stock": opening,
+            "forecast_demand": forecast,
+            "incoming_supply": incoming_planned,
+            "planned_supply": planned,
+            "actual_sold_qty": sold,
+            "actual_imported_qty": actual_import,
+            "closing_stock": closing,
+            "min_stock_policy": target,
+            "net_requirement": net_req,
+        }
+
+    def run_vectorized_calculation(self, sku_list=None, horizon_months=12, profile_id='STD', group_id=None, warehouse_id='ALL', run_date=None):
+        """
+        NumPy implementation of the Python fallback.
+        Produces the same Fact_Rolling_Inventory rows, but loads inputs as grouped
+        aggregates, computes all SKUs at once and writes with bulk mappings.
+        """
+        print(f"Starting Rolling Calculation (Profile: {profile_id})... [VECTORIZED]")
+        w_id = warehouse_id if warehouse_id else 'ALL'
+
+        # 1. Profile & Policy
+        profile = get_profile(self.db, profile_id)
+        ratios = [0.25, 0.25, 0.25, 0.25]
+        if profile:
+            ratios = [profile.week1, profile.week2, profile.week3, profile.week4]
+
+        policy = get_default_policy(self.db)
+        policy_days = policy.safety_stock_days if policy else 90
+
+        # 2. Products
+        query = self.db.query(DimProducts.sku_id, DimProducts.moq)
+        if sku_list:
+            query = query.filter(DimProducts.sku_id.in_(sku_list))
+        if group_id and group_id != 'ALL':
+            query = query.filter((DimProducts.group_id == group_id) | (DimProducts.category == group_id))
+        products = query.order_by(DimProducts.sku_id).all()
+        if not products:
+            print("No products found.")
+            return {"skus": 0, "rows": 0}
+        sku_ids = [p.sku_id for p in products]
+        moq = np.array([p.moq or 0 for p in products], dtype=float)
+
+        # 3. Buckets & Dense Inputs
+        today = run_date if run_date else date.today()
+        start_date = date(today.year, today.month, 1)
+        bucket_starts, bucket_ends = self.get_horizon_buckets(start_date, horizon_months)
+        inputs = self.load_dense_inputs(sku_ids, bucket_starts, bucket_ends, profile_id, w_id)
+
+        # 4. Projection
+        result = self.project_vectorized(inputs, bucket_starts, bucket_ends, ratios, moq, policy_days, today)
+
+        # 5. Bulk Write
+        rows = self.write_projection(sku_ids, bucket_starts, result, inputs["existing_id"], profile_id, w_id)
+        print(f"Rolling Calculation Complete. {len(sku_ids)} SKUs, {rows} rows.")
+        return {"skus": len(sku_ids), "rows": rows}
+
+    def run_incremental_calculation(self, dirty, horizon_months=12, profile_id='STD', warehouse_id='ALL', run_date=None, procedure_version='v1'):
+        """
+        Recompute only the SKUs in dirty ({sku_id: earliest changed date}).
+        Same stored procedure, weekly grid and lookback run date as the full run, scoped to
+        the dirty SKUs (@SkuList): their rows come out exactly as a full run would write them.
+        Changes older than the lookback are picked up from the lookback week, like the full run.
+        """
+        if not dirty:
+            return {"skus": 0}
+
+        run_date = run_date or self.lookback_run_date()
+        skus = sorted(dirty)
+        print(f"[INCREMENTAL] {len(skus)} SKUs, earliest change {min(dirty.values())}, run date {run_date} (Profile: {profile_id}, Warehouse: {warehouse_id})")
+        self.run_sql_procedure(horizon_months, profile_id, None, warehouse_id, run_date, procedure_version, sku_list=skus)
+        return {"skus": len(skus)}
+
+    def write_projection(self, sku_ids, bucket_starts, result, existing_id, profile_id, warehouse_id):
+        """Persist a projection: bulk update rows that exist, bulk insert the rest."""
+        n_sku, n_bucket = existing_id.shape
+        frame = pd.DataFrame({k: v.ravel() for k, v in result.items()})
+        frame["planning_id"] = existing_id.ravel()
+        frame["status"] = 'OK'
+        frame["updated_at"] = datetime.now()
+
+        is_new = frame["planning_id"].to_numpy() == 0
+        updates = frame[~is_new].to_dict('records')
+
+        new_rows = frame[is_new].drop(columns=["planning_id"])
+        new_rows["sku_id"] = np.repeat(np.array(sku_ids, dtype=object), n_bucket)[is_new]
+        new_rows["bucket_date"] = np.tile(np.array(bucket_starts, dtype=object), n_sku)[is_new]
+        new_rows["profile_id"] = profile_id
+        new_rows["warehouse_id"] = warehouse_id
+        new_rows["is_manual_opening"] = False
+        new_rows["is_manual_planned"] = False
+        inserts = new_rows.to_dict('records')
+
+        batch_size = 5000
+        try:
+            for i in range(0, len(updates), batch_size):
+                self.db.bulk_update_mappings(FactRollingInventory, updates[i:i + batch_size])
+            for i in range(0, len(inserts), batch_size):
+                self.db.bulk_insert_mappings(FactRollingInventory, inserts[i:i + batch_size])
+            self.db.commit()
+        except Exception:
+            self.db.rollback()
+            raise
+        return len(updates) + len(inserts)
+
+    def run_rolling_calculation(self, sku_list=None, horizon_months=12, profile_id='STD', group_id=None, warehouse_id='ALL', run_date=None, engine_mode=None):
         # Legacy Python Method - Keeping for reference or fallback partial updates
         # But for "Run All" or main usage, we prefer SQL now.
+        # engine_mode='vectorized' runs the NumPy engine for both full and partial runs.
+        # engine_mode='sql_v2' runs the set-based stored procedure for full runs.
+        if engine_mode == 'vectorized':
+            return self.run_vectorized_calculation(sku_list, horizon_months, profile_id, group_id, warehouse_id, run_date)
+
         if sku_list is None:
              # If running for ALL, use SQL Procedure for speed
-             return self.run_sql_procedure(horizon_months, profile_id, group_id, warehouse_id, run_date)
+             procedure_version = 'v2' if engine_mode == 'sql_v2' else 'v1'
+             return self.run_sql_procedure(horizon_months, profile_id, group_id, warehouse_id, run_date, procedure_version)
         
         # ... Only use Python loop for specific SKU list updates ...
         print(f"Starting Rolling Calculation (Profile: {profile_id})... [PYTHON FALLBACK]")
         
         # 1. Fetch Profile Logic
-        profile = self.db.query(PlanningDistributionProfile).filter_by(profile_id=profile_id).first()
+        profile = get_profile(self.db, profile_id)
         ratios = [0.25, 0.25, 0.25, 0.25]
         if profile:
             ratios = [profile.week1, profile.week2, profile.week3, profile.week4]
 
         # 1b. Fetch Planning Policy
-        from backend.models import PlanningPolicies
-        policy = self.db.query(PlanningPolicies).filter_by(is_default=True).first()
-        if not policy:
-            policy = self.db.query(PlanningPolicies).first()
+        policy = get_default_policy(self.db)
         policy_days = policy.safety_stock_days if policy else 90
         
         # 2. Get Products
@@ -248,7 +601,7 @@ class RollingPlanningEngine:
              end_date = end_date + timedelta(days=32)
         end_date = end_date.replace(day=1) - timedelta(days=1) # Last day of horizon
 
-        forecast_map, sales_map, purchases_map, checkpoint_map, existing_map, latest_stock_map = \
+        forecast_map, sales_map, purchases_map, checkpoint_map, existing_map, latest_stock_map, _ = \
             self.prefetch_data(all_sku_ids, start_date, end_date)
 
         # 4. PROCESSING LOOP (Pure Python)
@@ -334,6 +687,11 @@ class RollingPlanningEngine:
                         if not is_past:
                             planned = net_req
                             closing = rolling_open + incoming + planned - outflow
+
+                    # F2. MANUAL PLANNED SUPPLY (user edit replaces the suggestion)
+                    if existing_rec and existing_rec.is_manual_planned:
+                        planned = existing_rec.planned_supply or 0
+                        closing = rolling_open + incoming + planned - outflow
                     
                     # F. UPDATE / CREATE OBJECT
                     if existing_rec:
@@ -363,6 +721,7 @@ class RollingPlanningEngine:
                             net_requirement=net_req if planned > 0 else 0,
                             status='OK',
                             is_manual_opening=False,
+                            is_manual_planned=False,
                             profile_id=profile_id,
                             warehouse_id=warehouse_id
                         )
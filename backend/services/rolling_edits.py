@@ -0,0 +1,123 @@
+from datetime import datetime
+from sqlalchemy.orm import Session
+from backend.models import FactRollingInventory
+from backend.services.change_tracker import ChangeTracker
+from backend.services.db_lock import db_lock, LockTimeout, ROLLING_CALC_LOCK
+
+EDIT_FIELDS = {
+    'planned_supply': 'is_manual_planned',
+    'opening_stock': 'is_manual_opening'
+}
+EDIT_LOCK_TIMEOUT_SECONDS = 30 # Wait this long for a running calculation, then defer to the auto-calc
+
+class RollingEditSession:
+    """
+    Batched manual edits of the rolling plan (planned supply / opening stock) for one profile.
+    1. apply(): one bulk upsert of every edited cell (keyed on uq_rolling_inventory), flagged manual
+       so recalculations keep the value (the stored procedures carry is_manual_* cells over, moved to
+       the weekly bucket containing them when the cell is off their grid, e.g. a vectorized 1/8/15/22 row)
+    2. recompute(): each affected SKU once, with the same procedure and weekly grid as the full run
+       (run now, or deferred to the debounced auto-calculation)
+    """
+    def __init__(self, db: Session, profile_id='STD'):
+        self.db = db
+        self.profile_id = profile_id
+
+    @staticmethod
+    def _merge(edits):
+        """One change set per (sku, warehouse, bucket); later edits of the same field win."""
+        cells = {}
+        for e in edits:
+            key = (e['sku_id'], e.get('warehouse_id') or 'ALL', e['bucket_date'])
+            values = {f: e[f] for f in EDIT_FIELDS if e.get(f) is not None}
+            if values:
+                cells.setdefault(key, {}).update(values)
+        return cells
+
+    def apply(self, edits):
+        """
+        edits: iterable of dicts {sku_id, warehouse_id, bucket_date, planned_supply?, opening_stock?}.
+        Returns {(sku_id, warehouse_id): earliest edited bucket_date}. Commits.
+        """
+        cells = self._merge(edits)
+        if not cells:
+            return {}
+
+        # 1. Existing rows of the edited cells (chunked by SKU, SQL Server param limit)
+        skus = sorted({k[0] for k in cells})
+        warehouses = sorted({k[1] for k in cells})
+        dates = [k[2] for k in cells]
+        existing = {}
+        chunk_size = 500
+        for i in range(0, len(skus), chunk_size):
+            rows = self.db.query(
+                FactRollingInventory.planning_id, FactRollingInventory.sku_id,
+                FactRollingInventory.warehouse_id, FactRollingInventory.bucket_date
+            ).filter(
+                FactRollingInventory.profile_id == self.profile_id,
+                FactRollingInventory.sku_id.in_(skus[i:i + chunk_size]),
+                FactRollingInventory.warehouse_id.in_(warehouses),
+                FactRollingInventory.bucket_date >= min(dates),
+                FactRollingInventory.bucket_date <= max(dates)
+            ).all()
+            existing.update({(r.sku_id, r.warehouse_id, r.bucket_date): r.planning_id for r in rows})
+
+        # 2. One bulk update + one bulk insert
+        now = datetime.now()
+        updates, inserts = [], []
+        for key, values in cells.items():
+            row = {**values, **{EDIT_FIELDS[f]: True for f in values}, 'updated_at': now}
+            if key in existing:
+                updates.append({'planning_id': existing[key], **row})
+            else:
+                # Cell the calculation has not produced yet (beyond the last run's horizon)
+                inserts.append({
+                    'sku_id': key[0], 'warehouse_id': key[1], 'bucket_date': key[2],
+                    'profile_id': self.profile_id, 'status': 'OK', **row
+                })
+        try:
+            if updates:
+                self.db.bulk_update_mappings(FactRollingInventory, updates)
+            if inserts:
+                self.db.bulk_insert_mappings(FactRollingInventory, inserts)
+            self.db.commit()
+        except Exception:
+            self.db.rollback()
+            raise
+
+        earliest = {}
+        for sku, wh, d in cells:
+            if (sku, wh) not in earliest or d < earliest[(sku, wh)]:
+                earliest[(sku, wh)] = d
+        print(f"[ROLLING-EDITS] {len(cells)} cells ({len(updates)} updated, {len(inserts)} new), {len(earliest)} SKUs (Profile: {self.profile_id}).")
+        return earliest
+
+    def recompute(self, earliest, defer=False):
+        """
+        Recompute each edited SKU once (SKU-scoped run_incremental_calculation, so the rows match
+        a full run; the edited cells keep their manual values).
+        defer=True (or a calculation holding the lock): mark the SKUs dirty and let the
+        debounced AUTO_CALC job pick them up together with other pending changes.
+        Returns 'done' or 'deferred'.
+        """
+        if not earliest:
+            return 'done'
+        if not defer:
+            from backend.services.rolling_calc import RollingPlanningEngine
+            by_warehouse = {}
+            for (sku, wh), d in earliest.items():
+                by_warehouse.setdefault(wh, {})[sku] = d
+            try:
+                with db_lock(self.db.get_bind(), ROLLING_CALC_LOCK, EDIT_LOCK_TIMEOUT_SECONDS):
+                    engine = RollingPlanningEngine(self.db)
+                    for wh, dirty in by_warehouse.items():
+                        engine.run_incremental_calculation(dirty, profile_id=self.profile_id, warehouse_id=wh)
+                return 'done'
+            except LockTimeout:
+                print("[ROLLING-EDITS] Rolling calculation busy, deferring the recompute.")
+
+        from backend.services.auto_calc import schedule_auto_calculation
+        ChangeTracker(self.db).mark([(sku, wh, d) for (sku, wh), d in earliest.items()], 'MANUAL_EDIT')
+        self.db.commit()
+        schedule_auto_calculation(self.db)
+        return 'deferred'
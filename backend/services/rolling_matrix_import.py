@@ -0,0 +1,147 @@
+import re
+from datetime import datetime
+import pandas as pd
+from sqlalchemy import text
+from sqlalchemy.orm import Session
+
+SKU_COLUMNS = ('sku', 'sku_id', 'product code')
+PLANNED_COLUMN = re.compile(r'^(\d{4}-\d{2}-\d{2})\s*\(Planned\)$') # "YYYY-MM-DD (Planned)", as exported
+MAX_REPORTED_KEYS = 500
+
+class RollingMatrixImport:
+    """
+    Applies a planner's rolling matrix upload (one row per SKU, "YYYY-MM-DD (Planned)" columns)
+    to Fact_Rolling_Inventory.planned_supply of one profile/warehouse:
+    1. Melt every batch into long (sku_id, bucket_date, planned_supply) rows (vectorized)
+    2. Load them into a staging temp table (fast_executemany on MSSQL)
+    3. One set-based UPDATE joined on the uq_rolling_inventory key, one query for the unmatched keys
+    Only existing rows are updated (the rolling calculation creates them); uploaded values are
+    flagged is_manual_planned so recalculations (full and incremental procedure runs) keep them.
+    """
+    def __init__(self, db: Session):
+        self.db = db
+
+    @staticmethod
+    def find_sku_column(columns):
+        return next((c for c in columns if str(c).strip().lower() in SKU_COLUMNS), None)
+
+    @staticmethod
+    def planned_columns(columns):
+        """{column: bucket_date} of the "(Planned)" columns."""
+        planned = {}
+        for col in columns:
+            match = PLANNED_COLUMN.match(str(col).strip())
+            if not match:
+                continue
+            try:
+                planned[col] = datetime.strptime(match.group(1), "%Y-%m-%d").date()
+            except ValueError:
+                continue # Not a real date
+        return planned
+
+    def melt(self, frame, sku_col, planned, errors):
+        """Long frame (sku_id, bucket_date, planned_supply) of the non-empty cells; bad numbers go to errors."""
+        skus = frame[sku_col].fillna('').astype(str).str.strip()
+        frame = frame.loc[(skus != '') & (skus.str.lower() != 'nan'), list(planned)].assign(sku_id=skus)
+        long = frame.melt(id_vars='sku_id', var_name='column', value_name='raw')
+        long = long[long['raw'].notna() & (long['raw'].astype(str).str.strip() != '')]
+        long['planned_supply'] = pd.to_numeric(long['raw'], errors='coerce')
+
+        bad = long[long['planned_supply'].isna()]
+        errors.extend(f"SKU {r.sku_id} col {r.column}: invalid number '{r.raw}'" for r in bad.head(MAX_REPORTED_KEYS).itertuples())
+        long = long[long['planned_supply'].notna()]
+        long['bucket_date'] = long['column'].map(planned)
+        return long[['sku_id', 'bucket_date', 'planned_supply']]
+
+    def apply(self, long, profile_id, warehouse_id):
+        """Stage + set-based UPDATE. Returns (updated rows, unmatched [(sku_id, bucket_date)], unmatched count)."""
+        rows = [
+            {'sku_id': s, 'bucket_date': d, 'planned_supply': float(q)}
+            for s, d, q in zip(long['sku_id'], long['bucket_date'], long['planned_supply'])
+        ]
+        if not rows:
+            return 0, [], 0
+
+        if self.db.get_bind().dialect.name == 'mssql':
+            stage = '#matrix_stage'
+            self.db.execute(text("IF OBJECT_ID('tempdb..#matrix_stage') IS NOT NULL DROP TABLE #matrix_stage"))
+            self.db.execute(text(
+                "CREATE TABLE #matrix_stage (sku_id NVARCHAR(50) COLLATE DATABASE_DEFAULT NOT NULL, bucket_date DATE NOT NULL, "
+                "planned_supply FLOAT NOT NULL, PRIMARY KEY (sku_id, bucket_date))"
+            ))
+        else:
+            stage = 'matrix_stage'
+            self.db.execute(text("DROP TABLE IF EXISTS temp.matrix_stage"))
+            self.db.execute(text(
+                "CREATE TEMP TABLE matrix_stage (sku_id VARCHAR(50) NOT NULL, bucket_date DATE NOT NULL, "
+                "planned_supply FLOAT NOT NULL, PRIMARY KEY (sku_id, bucket_date))"
+            ))
+
+        try:
+            self.db.execute(
+                text(f"INSERT INTO {stage} (sku_id, bucket_date, planned_supply) VALUES (:sku_id, :bucket_date, :planned_supply)")
+                .execution_options(fast_executemany=True),
+                rows
+            )
+            key = {'p': profile_id, 'w': warehouse_id}
+            updated = self.db.execute(text(f"""
+                UPDATE Fact_Rolling_Inventory
+                SET planned_supply = S.planned_supply, is_manual_planned = 1, updated_at = :now
+                FROM {stage} AS S
+                WHERE Fact_Rolling_Inventory.sku_id = S.sku_id
+                  AND Fact_Rolling_Inventory.warehouse_id = :w
+                  AND Fact_Rolling_Inventory.bucket_date = S.bucket_date
+                  AND Fact_Rolling_Inventory.profile_id = :p
+            """), {**key, 'now': datetime.now()}).rowcount
+
+            unmatched_filter = f"""
+                FROM {stage} AS S
+                WHERE NOT EXISTS (
+                    SELECT 1 FROM Fact_Rolling_Inventory T
+                    WHERE T.sku_id = S.sku_id AND T.warehouse_id = :w AND T.bucket_date = S.bucket_date AND T.profile_id = :p
+                )
+            """
+            unmatched_count = self.db.execute(text(f"SELECT COUNT(*) {unmatched_filter}"), key).scalar()
+            unmatched = self.db.execute(text(
+                f"SELECT S.sku_id, S.bucket_date {unmatched_filter} ORDER BY S.sku_id, S.bucket_date"
+            ), key).fetchmany(MAX_REPORTED_KEYS)
+        finally:
+            self.db.execute(text(f"DROP TABLE {stage}"))
+        return updated, [(r[0], r[1]) for r in unmatched], unmatched_count
+
+    def run(self, open_batches, profile_id='STD', warehouse_id='ALL'):
+        """
+        open_batches: iterator of DataFrame batches (UploadReader.iter_batches).
+        Commits on success, rolls back on error (raises ValueError for a missing SKU column).
+        """
+        errors = []
+        parts = []
+        sku_col, planned = None, None
+        for batch in open_batches:
+            if sku_col is None:
+                sku_col = self.find_sku_column(batch.columns)
+                if not sku_col:
+                    raise ValueError("Could not find 'SKU' column.")
+                planned = self.planned_columns(batch.columns)
+            if planned:
+                parts.append(self.melt(batch, sku_col, planned, errors))
+
+        if not parts:
+            return {"updated": 0, "cells": 0, "unmatched": [], "unmatched_count": 0, "errors": errors}
+
+        # Same (sku, bucket) twice in the file: the last one wins, as with the old row-by-row loop
+        long = pd.concat(parts, ignore_index=True).drop_duplicates(['sku_id', 'bucket_date'], keep='last')
+        try:
+            updated, unmatched, unmatched_count = self.apply(long, profile_id, warehouse_id)
+            self.db.commit()
+        except Exception:
+            self.db.rollback()
+            raise
+        print(f"[MATRIX-IMPORT] {len(long)} cells: {updated} updated, {unmatched_count} unmatched (Profile: {profile_id}, Warehouse: {warehouse_id}).")
+        return {
+            "updated": updated,
+            "cells": len(long),
+            "unmatched": [{"sku_id": s, "bucket_date": d} for s, d in unmatched],
+            "unmatched_count": unmatched_count,
+            "errors": errors
+        }
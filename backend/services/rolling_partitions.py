@@ -0,0 +1,87 @@
+import time
+from concurrent.futures import ThreadPoolExecutor, as_completed
+from sqlalchemy.orm import Session
+from backend.services.dimension_cache import get_config, get_profiles
+
+DEFAULT_ROLLING_WORKERS = 4
+
+class RollingPartitionRunner:
+    """
+    Runs the rolling calculation for independent (profile, warehouse) partitions in parallel.
+    Partitions write disjoint Fact_Rolling_Inventory rows, so each one runs on its own
+    session/connection; wall-clock time is roughly that of the slowest partition.
+    Config: ROLLING_WORKERS (max concurrent partitions, default 4),
+            ROLLING_WAREHOUSES (comma-separated warehouse_ids to plan, default 'ALL').
+    """
+    def __init__(self, db: Session):
+        self.db = db
+
+    def _workers(self):
+        value = get_config(self.db, 'ROLLING_WORKERS')
+        try:
+            workers = int(value) if value not in (None, '') else DEFAULT_ROLLING_WORKERS
+        except ValueError:
+            print(f"  ! Invalid ROLLING_WORKERS='{value}', using {DEFAULT_ROLLING_WORKERS}")
+            workers = DEFAULT_ROLLING_WORKERS
+        if self.db.get_bind().dialect.name == 'sqlite':
+            workers = 1 # Single writer: parallel sessions would only wait on each other
+        return max(workers, 1)
+
+    def partitions(self, profile_ids=None, warehouse_ids=None):
+        """All (profile_id, warehouse_id) pairs to plan: active profiles x configured warehouses."""
+        if profile_ids is None:
+            profile_ids = [p.profile_id for p in get_profiles(self.db)] or ['STD'] # Fallback
+        if warehouse_ids is None:
+            configured = get_config(self.db, 'ROLLING_WAREHOUSES') or 'ALL'
+            warehouse_ids = [w.strip() for w in configured.split(',') if w.strip()] or ['ALL']
+        return [(pid, wh) for pid in profile_ids for wh in warehouse_ids]
+
+    def run(self, task, partitions, job=None, workers=None):
+        """
+        task(engine, profile_id, warehouse_id) -> result, called once per partition with a
+        RollingPlanningEngine bound to a fresh session.
+        Every partition runs even if others fail; returns
+        {"partitions": [{profile_id, warehouse_id, status, seconds, result|error}], "errors": [...], "seconds": wall}.
+        Partitions not yet started when the job is cancelled are reported as CANCELLED.
+        """
+        from backend.database import SessionLocal
+        from backend.services.rolling_calc import RollingPlanningEngine
+
+        workers = min(workers or self._workers(), len(partitions)) or 1
+
+        def run_one(pid, wh):
+            entry = {"profile_id": pid, "warehouse_id": wh}
+            if job and job.cancelled():
+                entry["status"] = 'CANCELLED'
+                return entry
+            started = time.perf_counter()
+            session = SessionLocal()
+            try:
+                entry["result"] = task(RollingPlanningEngine(session), pid, wh)
+                entry["status"] = 'OK'
+            except Exception as e:
+                session.rollback()
+                entry["status"] = 'ERROR'
+                entry["error"] = str(e)
+            finally:
+                session.close()
+                entry["seconds"] = round(time.perf_counter() - started, 2)
+            return entry
+
+        print(f"[ROLLING-PARTITIONS] {len(partitions)} partitions on {workers} workers.")
+        wall = time.perf_counter()
+        entries = []
+        with ThreadPoolExecutor(max_workers=workers) as pool:
+            futures = [pool.submit(run_one, pid, wh) for pid, wh in partitions]
+            for future in as_completed(futures):
+                entry = future.result()
+                entries.append(entry)
+                print(f"[ROLLING-PARTITIONS] {entry['profile_id']}/{entry['warehouse_id']}: {entry['status']} "
+                      f"({entry.get('seconds', 0)}s){' - ' + entry['error'] if entry.get('error') else ''}")
+                if job: job.progress(done=len(entries), total=len(partitions), stage='PARTITIONS')
+
+        entries.sort(key=lambda e: (e["profile_id"], e["warehouse_id"]))
+        errors = [f"{e['profile_id']}/{e['warehouse_id']}: {e['error']}" for e in entries if e["status"] == 'ERROR']
+        wall = round(time.perf_counter() - wall, 2)
+        print(f"[ROLLING-PARTITIONS] Done in {wall}s ({len(errors)} failed).")
+        return {"partitions": entries, "errors": errors, "seconds": wall}
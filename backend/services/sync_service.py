@@ -1,4 +1,8 @@
 import time
+import queue
+import threading
+from collections import deque
+from concurrent.futures import ThreadPoolExecutor
 from datetime import datetime
 from sqlalchemy.orm import Session
 from backend.models import (
@@ -8,14 +12,43 @@ from backend.models import (
 # Use the new Client
 from backend.amis_accounting_client import AmisAccountingClient
 from backend.misa_crm_v2_client import MisaCrmV2Client # [NEW]
+from backend import misa_http
+from backend.services.group_closure import GroupClosure
+from backend.services.dimension_cache import dimension_cache, get_config, WAREHOUSES
+from backend.services.order_plan import OrderPlanSnapshot
 from backend.database import engine
 
+DEFAULT_PREFETCH_PAGES = 3 # Pages requested ahead of the one being upserted (0 = sequential)
+DEFAULT_MAX_RPS = 5.0 # MISA dictionary requests per second (0 = unlimited)
+DEFAULT_CRM_WORKERS = 4 # Warehouses fetched concurrently by sync_crm_inventory
+DEFAULT_CRM_PAGE_SIZE = 100
+CLOSURE_REBUILD_THRESHOLD = 50 # Changed groups per page above which the closure is rebuilt instead of patched
+
+class RateLimiter:
+    """Spaces request starts at least 1/max_per_second apart (shared by all fetch workers)."""
+    def __init__(self, max_per_second):
+        self.interval = 1.0 / max_per_second if max_per_second and max_per_second > 0 else 0
+        self._lock = threading.Lock()
+        self._next_slot = 0.0
+
+    def wait(self):
+        if not self.interval:
+            return
+        with self._lock:
+            slot = max(time.monotonic(), self._next_slot)
+            self._next_slot = slot + self.interval
+        delay = slot - time.monotonic()
+        if delay > 0:
+            time.sleep(delay)
+
 class SyncService:
-    def __init__(self, db: Session):
+    def __init__(self, db: Session, job=None):
         """
         Service đồng bộ dữ liệu Master Data từ MISA AMIS Accounting & CRM.
+        job: JobContext when run from the job queue (progress + cancellation).
         """
         self.db = db
+        self.job = job
         # Load AMIS ACT Config
         self.app_id = self._get_config('MISA_AMIS_ACT_APP_ID')
         self.access_code = self._get_config('MISA_AMIS_ACT_ACCESS_CODE')
@@ -34,9 +67,20 @@ class SyncService:
 
         self.seen_groups = set() # Cache for deduplication within a sync run
 
+        # Pipelined dictionary paging (see _generic_sync)
+        self.prefetch_pages = self._get_number_config('MISA_SYNC_PREFETCH_PAGES', DEFAULT_PREFETCH_PAGES, int)
+        self.rate_limiter = RateLimiter(self._get_number_config('MISA_SYNC_MAX_RPS', DEFAULT_MAX_RPS, float))
+
     def _get_config(self, key):
-        config = self.db.query(SystemConfig).filter(SystemConfig.config_key == key).first()
-        return config.config_value if config else None
+        return get_config(self.db, key) # Cached map (one query for all keys)
+
+    def _get_number_config(self, key, default, cast):
+        value = self._get_config(key)
+        try:
+            return max(cast(value), 0) if value not in (None, '') else default
+        except ValueError:
+            print(f"  ! Invalid {key}='{value}', using {default}")
+            return default
 
     # --- MAIN SYNC ORCHESTRATOR ---
     def sync_all_master_data(self):
@@ -57,20 +101,23 @@ class SyncService:
         try: self.sync_products() # Depends on Unit/Group
         except Exception as e: print(f"  ! Skip PRODUCTS: {e}")
         print("[SYNC] Master Data Sync Completed.")
+        for base_url, stats in misa_http.get_stats().items():
+            print(f"[SYNC] {base_url}: {stats['requests']} requests, {stats['bytes_received'] / 1024:.0f} KB received ({stats['bytes_decoded'] / 1024:.0f} KB decoded)")
 
     # --- DICTIONARY SYNC METHODS ---
 
     def sync_units(self):
-        self._generic_sync('SYNC_UNITS', self.client.get_units, self._upsert_unit)
+        self._generic_sync('SYNC_UNITS', self.client.get_units, self._upsert_unit_page)
 
     def sync_product_groups(self):
-        self._generic_sync('SYNC_PROD_GROUPS', self.client.get_inventory_item_categories, self._upsert_product_group)
+        self._generic_sync('SYNC_PROD_GROUPS', self.client.get_inventory_item_categories, self._upsert_product_group_page)
 
     def sync_warehouses(self):
-        self._generic_sync('SYNC_STOCKS', self.client.get_stocks, self._upsert_warehouse)
+        self._generic_sync('SYNC_STOCKS', self.client.get_stocks, self._upsert_warehouse_page)
+        dimension_cache.invalidate(WAREHOUSES)
 
     def sync_products(self):
-        self._generic_sync('SYNC_PRODUCTS', self.client.get_inventory_items, self._upsert_product)
+        self._generic_sync('SYNC_PRODUCTS', self.client.get_inventory_items, self._upsert_product_page)
 
     def sync_customers_and_vendors(self):
         """
@@ -78,10 +125,10 @@ class SyncService:
         We fetch ONCE, then route to specific Upsert logic.
         Also extracts Customer Groups implicitly.
         """
-        self._generic_sync('SYNC_PARTNERS', self.client.get_account_objects, self._upsert_account_object_dispatcher)
+        self._generic_sync('SYNC_PARTNERS', self.client.get_account_objects, self._upsert_account_object_page)
 
     # --- GENERIC RUNNER ---
-    def _generic_sync(self, action_type, fetch_func, upsert_func):
+    def _generic_sync(self, action_type, fetch_func, upsert_page_func):
         start_time = datetime.now()
         # Create Log Entry
         log = SystemSyncLogs(source='MISA_ACT', action_type=action_type, status='RUNNING', start_time=start_time)
@@ -91,91 +138,75 @@ class SyncService:
         log_id = log.log_id
         
         total_count = 0
+        type_id = self._get_type_id_from_func(fetch_func)
+        take = 500
+        # Pipelined paging: the next `prefetch_pages` pages are fetched by worker threads
+        # while the current page is upserted. Pages are still consumed strictly in order.
+        window = self.prefetch_pages + 1
+        pool = ThreadPoolExecutor(max_workers=window, thread_name_prefix=f"misa-{type_id}")
+        pending = deque() # (skip, future) in page order
+        next_skip = 0
         try:
-            skip = 0
-            take = 500 
-            
+            # Token is shared by the workers: fetch/refresh it once before fanning out
+            self.client.ensure_token()
+
             while True:
-                # 0. Check Cancellation
-                # Refresh log status from DB
-                current_log = self.db.query(SystemSyncLogs).filter(SystemSyncLogs.log_id == log_id).first()
-                if current_log and current_log.status == 'CANCEL_REQUESTED':
+                # 0. Check Cancellation (job queue flag)
+                if self._cancelled():
                     print(f"  > {action_type}: Cancellation requested. Stopping.")
+                    current_log = self.db.query(SystemSyncLogs).filter(SystemSyncLogs.log_id == log_id).first()
                     current_log.status = 'CANCELLED'
                     current_log.end_time = datetime.now()
                     self.db.commit()
-                    return # Exit function completely
+                    return # Exit function completely (pending prefetches are cancelled below)
 
-                # 1. Fetch Batch from MISA (WITH RETRY)
-                print(f"  > {action_type}: Fetching skip={skip}, take={take}...")
-                
-                batch = None
-                max_retries = 4 # User requested 3 retries (1 initial + 3 retries)
-                for attempt in range(max_retries):
-                    try:
-                        batch = self.client.get_dictionary(
-                            data_type=self._get_type_id_from_func(fetch_func), 
-                            skip=skip, 
-                            take=take
-                        )
-                        break # Success -> Exit retry loop
-                    except Exception as e:
-                        print(f"    ! [Attempt {attempt+1}/{max_retries}] Fetch Failed: {e}")
-                        if attempt < max_retries - 1:
-                            time.sleep(2 * (attempt + 1)) # Backoff
-                        else:
-                            raise e # Propagate error after max retries ensure breaking generic_sync
+                # 1. Fetch Batch from MISA (keep `window` pages in flight)
+                while len(pending) < window:
+                    pending.append((next_skip, pool.submit(self._fetch_page, action_type, type_id, next_skip, take)))
+                    next_skip += take
+
+                skip, future = pending.popleft()
+                batch = future.result() # Raises after max retries -> breaks generic_sync
 
-                
                 fetched_count = len(batch) if batch else 0
                 print(f"  > {action_type}: Received {fetched_count} items.")
                 
                 if not batch: 
                     print(f"  > {action_type}: No more data. Loop finished.")
                     break # No more data
-                    
-                # 2. Process Batch
-                current_batch_count = 0
-                seen_ids = set() 
-                
-                for item in batch:
-                    try:
-                        upsert_func(item, seen_ids)
-                        current_batch_count += 1
-                    except Exception as row_err:
-                        print(f"    ! Error processing row: {row_err}")
-                        self.db.rollback()
-                        # Continue to next row
-                
-                # 3. Commit Batch
+
+                # A short page is not the end (MISA may cap the page below `take`): the prefetched
+                # offsets assumed full pages, so drop them and page sequentially from here on
+                if fetched_count < take and window > 1:
+                    print(f"  > {action_type}: Short page ({fetched_count} < {take}), switching to sequential paging.")
+                    for _, stale in pending:
+                        stale.cancel()
+                    pending.clear()
+                    window = 1
+                if window == 1:
+                    next_skip = skip + fetched_count # Advance by what was actually received
+
+                # 2. Process Batch (one set-based upsert per page)
                 try:
+                    current_batch_count = upsert_page_func(batch)
                     self.db.commit() # Commit every page
                     total_count += current_batch_count
                     print(f"  > {action_type}: Processed batch {skip} - {skip + len(batch)} ({current_batch_count} upserted)")
+                    self._report(total_count, action_type)
                 except Exception as batch_err:
-                    print(f"  ! Batch Commit Failed: {batch_err}")
+                    print(f"  ! Batch Upsert Failed: {batch_err}")
                     self.db.rollback()
                     print(f"  > {action_type}: Retrying batch row-by-row...")
-                    
-                    # FAILURE POINT 2: seen_ids contains items from the failed batch attempt!
-                    # We must clear it because we are re-processing them.
-                    seen_ids.clear()
 
-                    # Fallback: Row-by-Row Commit
+                    # Fallback: Row-by-Row Commit (isolates the bad records)
                     for r_item in batch:
                         try:
-                            upsert_func(r_item, seen_ids)
+                            total_count += upsert_page_func([r_item])
                             self.db.commit()
-                            total_count += 1
                         except Exception as single_err:
                             self.db.rollback()
                             print(f"    ! Row Skip: {single_err}")
 
-                # if len(batch) < take:
-                #     break # Last batch
-                    
-                skip += len(batch)
-            
             # Final Status Update - Refresh to ensure we don't overwrite
             final_log = self.db.query(SystemSyncLogs).filter(SystemSyncLogs.log_id == log_id).first()
             if final_log.status != 'CANCELLED':
@@ -198,6 +229,23 @@ class SyncService:
             except:
                 pass
             print(f"  > {action_type} CRITICAL FAIL: {e}")
+        finally:
+            pool.shutdown(wait=False, cancel_futures=True)
+
+    def _fetch_page(self, action_type, type_id, skip, take):
+        """One dictionary page (runs in a worker thread): rate limited, with retry/backoff."""
+        print(f"  > {action_type}: Fetching skip={skip}, take={take}...")
+        max_retries = 4 # User requested 3 retries (1 initial + 3 retries)
+        for attempt in range(max_retries):
+            self.rate_limiter.wait()
+            try:
+                return self.client.get_dictionary(data_type=type_id, skip=skip, take=take)
+            except Exception as e:
+                print(f"    ! [skip={skip}] [Attempt {attempt+1}/{max_retries}] Fetch Failed: {e}")
+                if attempt < max_retries - 1:
+                    time.sleep(2 * (attempt + 1)) # Backoff
+                else:
+                    raise e # Propagate error after max retries ensure breaking generic_sync
 
     def _get_type_id_from_func(self, func):
         # Helper to map func back to ID for paging loop
@@ -209,334 +257,324 @@ class SyncService:
         return 0
 
     # --- UPSERT LOGIC ---
+    # Each page is upserted with ONE set-based statement (instead of SELECT .first() per record):
+    #   MSSQL : stage rows in a #temp table (fast_executemany), then a single MERGE
+    #   SQLite: INSERT ... ON CONFLICT DO UPDATE (executemany)
+    # updated_at only moves when a compared column really changed.
 
-    def _upsert_unit(self, item: dict, seen_ids: set = None) -> bool:
-        unit_id = item.get("UnitID")
-        unit_name = item.get("UnitName")
-        
-        # DEBUG UNICODE
-        if unit_name and ('Cặp' in unit_name or '?' in unit_name):
-            print(f"[UNICODE-DEBUG] Raw UnitName: '{unit_name}' (Codes: {[ord(c) for c in unit_name]})")
+    def _merge_rows(self, model, key, rows, compare_cols, keep_if_null=()):
+        """
+        Set-based upsert of rows (list of dicts with key + compare_cols) into model's table.
+        key: column name or list of columns (composite PK).
+        keep_if_null: compare_cols whose existing value is kept when the incoming one is NULL.
+        """
+        if not rows:
+            return 0
+        table = model.__table__
+        keys = [key] if isinstance(key, str) else list(key)
+        cols = keys + list(compare_cols)
+        stamp = 'updated_at' in table.c # Not every table has updated_at (e.g. snapshots)
+        now = datetime.now()
+        dialect = self.db.get_bind().dialect.name
+
+        if dialect == 'mssql':
+            from sqlalchemy import text
+            # Python-side scalar defaults (e.g. moq=1, is_active=1) that ORM inserts used to apply
+            defaults = {
+                c.name: c.default.arg for c in table.columns
+                if c.name not in cols and c.name != 'updated_at' and c.default is not None and c.default.is_scalar
+            }
+            source = {c: f"ISNULL(S.{c}, T.{c})" if c in keep_if_null else f"S.{c}" for c in compare_cols}
+            col_list = ", ".join(cols)
+            self.db.execute(text("IF OBJECT_ID('tempdb..#sync_stage') IS NOT NULL DROP TABLE #sync_stage"))
+            self.db.execute(text(f"SELECT TOP 0 {col_list} INTO #sync_stage FROM {table.name}"))
+            self.db.execute(
+                text(f"INSERT INTO #sync_stage ({col_list}) VALUES ({', '.join(':' + c for c in cols)})").execution_options(fast_executemany=True),
+                [{c: r.get(c) for c in cols} for r in rows]
+            )
+            insert_cols = cols + list(defaults.keys()) + (['updated_at'] if stamp else [])
+            insert_vals = [f"S.{c}" for c in cols] + [f":d_{c}" for c in defaults.keys()] + ([':now'] if stamp else [])
+            set_list = [f"T.{c} = {source[c]}" for c in compare_cols] + (['T.updated_at = :now'] if stamp else [])
+            merge_sql = f"""
+                MERGE {table.name} WITH (HOLDLOCK) AS T
+                USING #sync_stage AS S ON {' AND '.join(f'T.{k} = S.{k}' for k in keys)}
+                WHEN MATCHED AND EXISTS (
+                    SELECT {', '.join(source[c] for c in compare_cols)}
+                    EXCEPT
+                    SELECT {', '.join('T.' + c for c in compare_cols)}
+                ) THEN UPDATE SET {', '.join(set_list)}
+                WHEN NOT MATCHED BY TARGET THEN
+                    INSERT ({', '.join(insert_cols)}) VALUES ({', '.join(insert_vals)});
+            """
+            params = {f"d_{c}": v for c, v in defaults.items()}
+            params['now'] = now
+            self.db.execute(text(merge_sql), params)
+            self.db.execute(text("DROP TABLE #sync_stage"))
+        else:
+            from sqlalchemy import or_, func
+            from sqlalchemy.dialects.sqlite import insert as sqlite_insert
+            stmt = sqlite_insert(table)
+            source = {c: func.coalesce(stmt.excluded[c], table.c[c]) if c in keep_if_null else stmt.excluded[c] for c in compare_cols}
+            set_ = dict(source)
+            if stamp:
+                set_['updated_at'] = stmt.excluded.updated_at
+            stmt = stmt.on_conflict_do_update(
+                index_elements=keys,
+                set_=set_,
+                where=or_(*[table.c[c].is_distinct_from(source[c]) for c in compare_cols])
+            )
+            extra = {'updated_at': now} if stamp else {}
+            self.db.execute(stmt, [{**{c: r.get(c) for c in cols}, **extra} for r in rows])
+        return len(rows)
+
+    @staticmethod
+    def _dedupe(rows, key):
+        """First occurrence wins (same as the old per-row seen_ids check)."""
+        out = {}
+        for r in rows:
+            if r.get(key) and r[key] not in out:
+                out[r[key]] = r
+        return list(out.values())
+
+    def _upsert_unit_page(self, items) -> int:
+        rows = [{
+            'unit_id': item.get('unit_id') or item.get('UnitID'),
+            'unit_name': item.get('unit_name') or item.get('UnitName'),
+            'description': item.get('description')
+        } for item in items]
+        return self._merge_rows(DimUnits, 'unit_id', self._dedupe(rows, 'unit_id'), ['unit_name', 'description'])
+
+    def _upsert_product_group_page(self, items) -> int:
+        rows = [{
+            'group_id': item.get('inventory_category_id'), # Type 14 keys
+            'group_name': item.get('inventory_category_name'),
+            'misa_code': item.get('inventory_category_code'),
+            # Map Parent ID: MISA usually returns 'parent_id' or 'ParentID'
+            'parent_id': item.get('parent_id') or item.get('ParentID')
+        } for item in items]
+        rows = self._dedupe(rows, 'group_id')
+
+        # Parent changes (and new groups) must be reflected in the closure table
+        page_ids = [r['group_id'] for r in rows]
+        current = dict(self.db.query(DimProductGroups.group_id, DimProductGroups.parent_id).filter(DimProductGroups.group_id.in_(page_ids)).all())
+        moved = [(r['group_id'], r['parent_id']) for r in rows if r['group_id'] not in current or current[r['group_id']] != r['parent_id']]
+
+        count = self._merge_rows(DimProductGroups, 'group_id', rows, ['group_name', 'misa_code', 'parent_id'])
+
+        closure = GroupClosure(self.db)
+        if len(moved) > CLOSURE_REBUILD_THRESHOLD:
+            closure.rebuild() # Initial sync / big reorganisation: one pass is cheaper than N moves
+        else:
+            for gid, parent_id in moved:
+                closure.move(gid, parent_id)
+        return count
+
+    def _upsert_warehouse_page(self, items) -> int:
+        rows = [{
+            'warehouse_id': item.get('stock_id'),
+            'warehouse_name': item.get('stock_name'),
+            'address': item.get('address')
+        } for item in items]
+        return self._merge_rows(DimWarehouses, 'warehouse_id', self._dedupe(rows, 'warehouse_id'), ['warehouse_name', 'address'])
+
+    def _upsert_product_page(self, items) -> int:
+        rows = []
+        for item in items:
+            # Group Mapping: Pick first ID (handle list or string "id;id")
+            g_raw = item.get('inventory_item_category_id_list')
+            parts = (g_raw.split(';') if isinstance(g_raw, str) else g_raw) if g_raw else None
+            rows.append({
+                'sku_id': (item.get('inventory_item_code') or '')[:50], # DB Limit
+                'product_name': item.get('inventory_item_name'),
+                'amis_act_id': item.get('inventory_item_id'),
+                'base_unit_id': item.get('unit_id'),
+                'group_id': parts[0] if parts else None
+            })
+        return self._merge_rows(DimProducts, 'sku_id', self._dedupe(rows, 'sku_id'), ['product_name', 'amis_act_id', 'base_unit_id', 'group_id'])
+
+    def _upsert_account_object_page(self, items) -> int:
+        """
+        Account Objects (Type 1) mix Customers and Vendors; groups are extracted implicitly.
+        Groups are merged first so customer/vendor FKs resolve.
+        """
+        groups, customers, vendors = [], [], []
+        seen_codes = set()
+        for item in items:
+            # 1. EXTRACT GROUP (MISA returns delimited strings "id1;id2")
+            g_ids = item.get('account_object_group_id_list')
+            g_names = item.get('account_object_group_name_list')
+            primary_group_id = None
+            if g_ids and g_names:
+                ids = [i.strip() for i in g_ids.split(';')] if isinstance(g_ids, str) else g_ids
+                names = g_names.split(';') if isinstance(g_names, str) else g_names
+                if ids:
+                    primary_group_id = ids[0]
+                    for i, gid in enumerate(ids):
+                        groups.append({'group_id': gid, 'group_name': names[i] if i < len(names) else "Unknown"})
+
+            # account_object_code is the Partner ID (first occurrence wins)
+            code = (item.get('account_object_code') or '')[:50]
+            if not code or code in seen_codes:
+                continue
+            seen_codes.add(code)
+
+            common = {'address': item.get('address'), 'phone': item.get('tel'), 'group_id': primary_group_id}
+            # 2. CUSTOMER
+            if item.get('is_customer'):
+                customers.append({'customer_id': code, 'customer_name': item.get('account_object_name'), 'misa_code': code, **common})
+            # 3. VENDOR
+            if item.get('is_vendor'):
+                vendors.append({'vendor_id': code, 'vendor_name': item.get('account_object_name'), 'tax_code': item.get('company_tax_code'), **common})
+
+        self._merge_rows(DimCustomerGroups, 'group_id', self._dedupe(groups, 'group_id'), ['group_name'])
+        self._merge_rows(DimCustomers, 'customer_id', customers, ['customer_name', 'misa_code', 'address', 'phone', 'group_id'])
+        self._merge_rows(DimVendors, 'vendor_id', vendors, ['vendor_name', 'address', 'phone', 'tax_code', 'group_id'])
+        return len(seen_codes)
 
-        if not unit_id: 
-            return False
-        
-        if seen_ids is not None:
-             if unit_id in seen_ids: 
-                 return False
-             seen_ids.add(unit_id)
-             
-        obj = self.db.query(DimUnits).filter(DimUnits.unit_id == unit_id).first()
-        if not obj:
-            obj = DimUnits(unit_id=unit_id)
-            self.db.add(obj)
-        
-        # Check changes
-        new_name = data.get('unit_name')
-        new_desc = data.get('description')
-        
-        if obj.unit_name != new_name or obj.description != new_desc:
-            obj.unit_name = new_name
-            obj.description = new_desc
-            obj.updated_at = datetime.now()
-
-    def _upsert_product_group(self, data, seen_ids=None):
-        gid = data.get('inventory_category_id') # Type 14 keys
-        if not gid: return
-        if seen_ids is not None:
-             if gid in seen_ids: return
-             seen_ids.add(gid)
-
-        obj = self.db.query(DimProductGroups).filter(DimProductGroups.group_id == gid).first()
-        if not obj:
-            obj = DimProductGroups(group_id=gid)
-            self.db.add(obj)
-        
-        new_name = data.get('inventory_category_name')
-        new_code = data.get('inventory_category_code')
-        # Map Parent ID: MISA usually returns 'parent_id' or 'ParentID'
-        new_parent = data.get('parent_id')
-        if not new_parent:
-             new_parent = data.get('ParentID')
-        
-        if (obj.group_name != new_name or 
-            obj.misa_code != new_code or
-            obj.parent_id != new_parent):
-            
-            obj.group_name = new_name
-            obj.misa_code = new_code
-            obj.parent_id = new_parent
-            obj.updated_at = datetime.now()
-
-    def _upsert_warehouse(self, data, seen_ids=None):
-        wid = data.get('stock_id')
-        if not wid: return
-        # Simple check - usually few warehouses
-        obj = self.db.query(DimWarehouses).filter(DimWarehouses.warehouse_id == wid).first()
-        if not obj:
-            obj = DimWarehouses(warehouse_id=wid)
-            self.db.add(obj)
-        
-        new_name = data.get('stock_name')
-        new_addr = data.get('address')
-        
-        if obj.warehouse_name != new_name or obj.address != new_addr:
-            obj.warehouse_name = new_name
-            obj.address = new_addr
-            obj.updated_at = datetime.now()
-
-    def _upsert_product(self, data, seen_ids=None):
-        sku_id = data.get('inventory_item_code', '')[:50] # DB Limit
-        if not sku_id: return
-        if seen_ids is not None:
-             if sku_id in seen_ids: return
-             seen_ids.add(sku_id)
-        
-        amis_id = data.get('inventory_item_id')
-        
-        obj = self.db.query(DimProducts).filter(DimProducts.sku_id == sku_id).first()
-        if not obj:
-            obj = DimProducts(sku_id=sku_id)
-            self.db.add(obj)
-            
-        # Group Mapping: Pick first ID
-        g_raw = data.get('inventory_item_category_id_list')
-        new_group_id = None
-        if g_raw:
-             # handle list or string "id;id"
-             parts = g_raw.split(';') if isinstance(g_raw, str) else g_raw
-             if parts and len(parts) > 0:
-                 new_group_id = parts[0]
-        
-        new_name = data.get('inventory_item_name')
-        new_unit = data.get('unit_id')
-        
-        if (obj.product_name != new_name or 
-            obj.amis_act_id != amis_id or 
-            obj.base_unit_id != new_unit or 
-            obj.group_id != new_group_id):
-            
-            obj.product_name = new_name
-            obj.amis_act_id = amis_id
-            obj.base_unit_id = new_unit
-            obj.group_id = new_group_id
-            obj.updated_at = datetime.now()
-
-    def _upsert_account_object_dispatcher(self, data, seen_ids=None):
-        # 1. EXTRACT GROUP
-        g_ids = data.get('account_object_group_id_list')
-        g_names = data.get('account_object_group_name_list')
-        
-        primary_group_id = None
-        
-        if g_ids and g_names:
-            # Simplify: Split and Zip
-            # Note: MISA returns delimited strings "id1;id2"
-             ids = [i.strip() for i in g_ids.split(';')] if isinstance(g_ids, str) else g_ids
-             names = g_names.split(';') if isinstance(g_names, str) else g_names
-             
-             if ids:
-                 primary_group_id = ids[0]
-                 # Upsert Groups implicit
-                 for i, gid in enumerate(ids):
-                     gname = names[i] if i < len(names) else "Unknown"
-                     self._upsert_customer_group_implicit(gid, gname)
-
-        # We use seen_ids to track account_object_code (Partner ID)
-        code = data.get('account_object_code', '')[:50]
-        if seen_ids is not None and code:
-            if code in seen_ids: return
-            seen_ids.add(code)
-
-        # 2. UPSERT CUSTOMER
-        if data.get('is_customer'):
-            self._upsert_customer(data, primary_group_id)
-            
-        # 3. UPSERT VENDOR
-        if data.get('is_vendor'):
-            self._upsert_vendor(data, primary_group_id)
-
-    def _upsert_customer_group_implicit(self, gid, gname):
-        if not gid: return
-        # FAILURE POINT: If we rollback, this cache is stale.
-        # if gid in self.seen_groups: return 
-        # self.seen_groups.add(gid)
-        
-        # Use merge strategy for robust upsert (handles sessions/DB state better)
-        # This creates a transient object, merges it into session (finding existing or creating new)
-        pending_obj = DimCustomerGroups(group_id=gid)
-        obj = self.db.merge(pending_obj)
-            
-        if obj.group_name != gname:
-            obj.group_name = gname
-            obj.updated_at = datetime.now()
-
-    def _upsert_customer(self, data, group_id):
-        cid = data.get('account_object_code', '')[:50]
-        if not cid: return
-        
-        obj = self.db.query(DimCustomers).filter(DimCustomers.customer_id == cid).first()
-        if not obj:
-            print(f"    + [NEW-CUST] {cid} - {data.get('account_object_name')}")
-            obj = DimCustomers(customer_id=cid)
-            self.db.add(obj)
-        
-        new_name = data.get('account_object_name')
-        new_addr = data.get('address')
-        new_phone = data.get('tel')
-        
-        if (obj.customer_name != new_name or 
-            obj.group_id != group_id or 
-            obj.address != new_addr or 
-            obj.phone != new_phone):
-            
-            # print(f"    * [UPD-CUST] {cid}")
-            obj.customer_name = new_name
-            obj.misa_code = cid
-            obj.address = new_addr
-            obj.phone = new_phone
-            obj.group_id = group_id
-            obj.updated_at = datetime.now()
-
-    def _upsert_vendor(self, data, group_id):
-        vid = data.get('account_object_code', '')[:50]
-        if not vid: return
-        
-        obj = self.db.query(DimVendors).filter(DimVendors.vendor_id == vid).first()
-        if not obj:
-            print(f"    + [NEW-VEND] {vid} - {data.get('account_object_name')}")
-            obj = DimVendors(vendor_id=vid)
-            self.db.add(obj)
-            
-        new_name = data.get('account_object_name')
-        new_addr = data.get('address')
-        new_phone = data.get('tel')
-        new_tax = data.get('company_tax_code')
-        
-        if (obj.vendor_name != new_name or 
-            obj.group_id != group_id or 
-            obj.address != new_addr or 
-            obj.phone != new_phone or 
-            obj.tax_code != new_tax):
-
-            # print(f"    * [UPD-VEND] {vid}")
-            obj.vendor_name = new_name
-            obj.address = new_addr
-            obj.phone = new_phone
-            obj.tax_code = new_tax
-            obj.group_id = group_id
-            obj.updated_at = datetime.now()
     # --- CRM SYNC ---
     def sync_crm_inventory(self):
         """
         Sync Inventory from MISA CRM V2 (Per Warehouse).
         Steps:
         1. Fetch list of Stocks (Warehouses).
-        2. Iterate and fetch product ledger for each Stock.
-        3. Upsert into Fact_Inventory_Snapshots.
+        2. Fetch product ledger pages for several Stocks concurrently (worker threads, HTTP only).
+        3. Upsert each page into Fact_Inventory_Snapshots with one bulk MERGE (this thread, this session).
         """
         today = datetime.now().date()
-        self._create_log("MISA_CRM", "SYNC_INVENTORY", f"Starting Sync for {today}...")
+        log_id = self._create_log("MISA_CRM", "SYNC_INVENTORY")
+        print(f"[SYNC CRM] Starting Sync for {today}...")
 
+        if not self.crm_client:
+            self._update_log_error(log_id, "MISA CRM credentials are not configured.")
+            return False
+
+        workers = self._get_number_config('MISA_CRM_SYNC_WORKERS', DEFAULT_CRM_WORKERS, int) or 1
+        page_size = self._get_number_config('MISA_CRM_PAGE_SIZE', DEFAULT_CRM_PAGE_SIZE, int) or DEFAULT_CRM_PAGE_SIZE
+        pool = ThreadPoolExecutor(max_workers=workers, thread_name_prefix="misa-crm")
         try:
             # 1. Fetch Stocks
-            url_stocks = f"{self.crm_client.base_url}/Stocks"
-            headers_stocks = {
-                "authorization": f"Bearer {self.crm_client.token or self.crm_client.authenticate()}",
-                "clientid": self.crm_client.client_id,
-                "companycode": self.crm_client.company_code
-            }
-            resp_stocks = requests.get(url_stocks, headers=headers_stocks)
-            stocks = []
-            if resp_stocks.status_code == 200:
-                s_data = resp_stocks.json()
-                if s_data.get("success") or s_data.get("code") == 0:
-                    stocks = s_data.get("data", [])
-            
+            stocks = self.crm_client.get_stocks()
             if not stocks:
                 print("! No stocks found or error fetching stocks. Defaulting to 'ALL' sync.")
                 # Fallback to previous logic if no stocks (optional, but better to be safe)
                 stocks = [{'stock_id': None, 'stock_code': 'ALL', 'stock_name': 'Default'}]
 
-            total_records = 0
-            
+            valid_stocks = []
             for stock in stocks:
                 stock_id = stock.get('stock_id') or stock.get('act_database_id')
                 stock_code = stock.get('stock_code', 'ALL')
-                stock_name = stock.get('stock_name', 'Unknown')
-                
                 if not stock_id and stock_code != 'ALL':
                     continue # Skip invalid stocks
+                valid_stocks.append((stock_id, stock_code, stock.get('stock_name', 'Unknown')))
 
-                print(f"  > Syncing Warehouse: {stock_code} ({stock_name})...")
-                
-                page = 1
-                page_size = 100
-                
-                while True:
-                    try:
-                        items = self.crm_client.get_product_ledger(stock_id=stock_id, page=page, page_size=page_size)
-                        
-                        if not items:
-                            break
-                        
-                        for item in items:
-                            try:
-                                # Fallback mapping for various API versions
-                                sku = item.get('product_code') or item.get('inventory_item_code') or item.get('sku') or item.get('code')
-                                # Ensure we use the current loop's warehouse ID
-                                wh_id = stock_code 
-                                
-                                # Correct Keys based on Debug Output
-                                qty_hand = item.get('main_stock_quantity') or item.get('quantity') or item.get('balance') or 0
-                                qty_order = item.get('order_quantity') or 0
-                                qty_alloc = item.get('delivery_quantity') or 0
-                                unit = item.get('unit_name') or item.get('unit_id') or item.get('uom_name') or ''
-                                
-                                if not sku: 
-                                    continue
-
-                                # UPSERT into Fact_Inventory_Snapshots
-                                snap = self.db.query(FactInventorySnapshots).filter(
-                                    FactInventorySnapshots.snapshot_date == today,
-                                    FactInventorySnapshots.warehouse_id == wh_id,
-                                    FactInventorySnapshots.sku_id == sku
-                                ).first()
-                                
-                                if not snap:
-                                    snap = FactInventorySnapshots(
-                                        snapshot_date=today,
-                                        warehouse_id=wh_id,
-                                        sku_id=sku
-                                    )
-                                    self.db.add(snap)
-                                
-                                snap.quantity_on_hand = float(qty_hand)
-                                snap.quantity_on_order = float(qty_order)
-                                snap.quantity_allocated = float(qty_alloc)
-                                if unit:
-                                    snap.unit = unit
-                                snap.notes = f"MISA Sync: {stock_name}"
-                            except Exception as row_e:
-                                print(f"    ! Error processing row: {row_e}")
-                                continue
-                        
-                        self.db.commit()
-                        total_records += len(items)
-                        print(f"    - Page {page}: {len(items)} items processed.")
-                        page += 1
-                        
-                    except Exception as page_e:
-                        print(f"    ! Error fetching page {page}: {page_e}")
-                        break
-
-            self._update_log_success(total_records)
+            # 2. Fan out: one producer per warehouse, pages come back through a queue
+            # (unbounded so a failing writer can never leave a producer blocked on put)
+            pages = queue.Queue()
+            for stock in valid_stocks:
+                pool.submit(self._fetch_ledger_pages, stock, page_size, pages)
+
+            # 3. Write pages as they arrive
+            total_records = 0
+            remaining = len(valid_stocks)
+            while remaining:
+                (stock_id, stock_code, stock_name), page, items = pages.get()
+                if items is None:
+                    remaining -= 1 # Warehouse finished
+                    continue
+                if self._cancelled():
+                    print("[SYNC CRM] Cancellation requested. Stopping.")
+                    log = self.db.query(SystemSyncLogs).filter(SystemSyncLogs.log_id == log_id).first()
+                    log.status = 'CANCELLED'
+                    log.records_processed = total_records
+                    log.end_time = datetime.now()
+                    self.db.commit()
+                    return False
+                try:
+                    written = self._upsert_snapshot_page(today, stock_code, stock_name, items)
+                    self.db.commit()
+                    total_records += len(items)
+                    self._report(total_records, 'SYNC_INVENTORY')
+                    print(f"    - [{stock_code}] Page {page}: {len(items)} items processed ({written} snapshots).")
+                except Exception as page_e:
+                    self.db.rollback()
+                    print(f"    ! [{stock_code}] Error writing page {page}: {page_e}")
+
+            self._update_log_success(log_id, total_records)
+            print(f"[SYNC CRM] DONE. {total_records} items across {len(valid_stocks)} warehouses.")
+
+            # 4. Order plan reads the latest snapshot
+            try:
+                OrderPlanSnapshot(self.db).refresh()
+                self.db.commit()
+            except Exception as plan_e:
+                self.db.rollback()
+                print(f"[ORDER-PLAN] Refresh after inventory sync failed: {plan_e}")
             return True
 
         except Exception as e:
-            self._update_log_error(str(e))
+            self._update_log_error(log_id, str(e))
             print(f"SYNC_INVENTORY ERROR: {e}")
             return False
+        finally:
+            pool.shutdown(wait=False, cancel_futures=True)
+
+    def _fetch_ledger_pages(self, stock, page_size, pages):
+        """Worker: pages get_product_ledger for one warehouse into the queue, then a (stock, None, None) marker."""
+        stock_id, stock_code, stock_name = stock
+        print(f"  > Syncing Warehouse: {stock_code} ({stock_name})...")
+        page = 1
+        try:
+            while True:
+                self.rate_limiter.wait()
+                try:
+                    items = self.crm_client.get_product_ledger(stock_id=stock_id, page=page, page_size=page_size)
+                except Exception as page_e:
+                    print(f"    ! [{stock_code}] Error fetching page {page}: {page_e}")
+                    break
+                if not items:
+                    break
+                pages.put((stock, page, items))
+                page += 1
+        finally:
+            pages.put((stock, page, None))
+
+    def _upsert_snapshot_page(self, snapshot_date, wh_id, stock_name, items) -> int:
+        rows = {}
+        for item in items:
+            try:
+                # Fallback mapping for various API versions
+                sku = item.get('product_code') or item.get('inventory_item_code') or item.get('sku') or item.get('code')
+                if not sku or sku in rows:
+                    continue
+                # Correct Keys based on Debug Output
+                rows[sku] = {
+                    'snapshot_date': snapshot_date,
+                    'warehouse_id': wh_id, # Ensure we use the current loop's warehouse ID
+                    'sku_id': sku,
+                    'quantity_on_hand': float(item.get('main_stock_quantity') or item.get('quantity') or item.get('balance') or 0),
+                    'quantity_on_order': float(item.get('order_quantity') or 0),
+                    'quantity_allocated': float(item.get('delivery_quantity') or 0),
+                    'unit': item.get('unit_name') or item.get('unit_id') or item.get('uom_name') or None,
+                    'notes': f"MISA Sync: {stock_name}"
+                }
+            except Exception as row_e:
+                print(f"    ! Error processing row: {row_e}")
+                continue
+
+        return self._merge_rows(
+            FactInventorySnapshots, ['snapshot_date', 'warehouse_id', 'sku_id'], list(rows.values()),
+            ['quantity_on_hand', 'quantity_on_order', 'quantity_allocated', 'unit', 'notes'],
+            keep_if_null=['unit']
+        )
+
+    # --- JOB HOOKS (no-ops outside the job queue) ---
+    def _cancelled(self):
+        return self.job is not None and self.job.cancelled()
+
+    def _report(self, done, stage):
+        if self.job is not None:
+            self.job.progress(done=done, stage=stage)
+
     # --- HELPER LOGGING methods ---
     def _create_log(self, source, action_type):
         log = SystemSyncLogs(source=source, action_type=action_type, status='RUNNING', start_time=datetime.now())
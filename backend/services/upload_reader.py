@@ -0,0 +1,150 @@
+import os
+import codecs
+import tempfile
+import pandas as pd
+
+SPOOL_CHUNK_BYTES = 1024 * 1024 # 1 MB per read from the upload stream
+DEFAULT_BATCH_ROWS = 20000
+
+async def spool_upload(file) -> str:
+    """
+    Copy an UploadFile to a temp file in fixed-size chunks (never the whole body in memory).
+    Returns the temp path; the caller (UploadReader) deletes it.
+    """
+    suffix = os.path.splitext(file.filename or '')[1].lower()
+    tmp = tempfile.NamedTemporaryFile(delete=False, suffix=suffix)
+    try:
+        while True:
+            chunk = await file.read(SPOOL_CHUNK_BYTES)
+            if not chunk:
+                break
+            tmp.write(chunk)
+    finally:
+        tmp.close()
+    return tmp.name
+
+class UploadReader:
+    """
+    Reads a spooled Excel/CSV upload as bounded-size DataFrame batches.
+    Batches look like slices of pd.read_excel/read_csv output: the first row is the header,
+    column names are the same for every batch and the index keeps counting across batches.
+
+    - .xlsx: openpyxl read_only + iter_rows (one row in memory at a time)
+    - .csv:  pd.read_csv(chunksize=...)
+    - .xls:  xlrd has no streaming mode; read once, then sliced into batches
+    """
+    def __init__(self, path, filename, batch_rows=DEFAULT_BATCH_ROWS, csv_encodings=('utf-8-sig', 'utf-16', 'cp1252')):
+        self.path = path
+        self.filename = (filename or '').lower()
+        self.batch_rows = batch_rows
+        self.csv_encodings = csv_encodings
+        self._encoding = None
+
+    def __enter__(self):
+        return self
+
+    def __exit__(self, exc_type, exc, tb):
+        self.close()
+
+    def close(self):
+        try:
+            os.remove(self.path)
+        except OSError:
+            pass
+
+    def iter_batches(self):
+        if self.filename.endswith('.csv'):
+            return self._iter_csv()
+        if self.filename.endswith('.xlsx'):
+            return self._iter_xlsx()
+        if self.filename.endswith('.xls'):
+            return self._iter_frame(pd.read_excel(self.path, engine='xlrd'))
+        raise ValueError(f"Invalid file format: {self.filename}")
+
+    def read_all(self) -> pd.DataFrame:
+        """Whole file as one DataFrame (for processors that need every row at once)."""
+        batches = list(self.iter_batches())
+        if not batches:
+            return pd.DataFrame()
+        return pd.concat(batches) if len(batches) > 1 else batches[0]
+
+    # --- CSV ---
+
+    def _detect_encoding(self):
+        """First candidate that decodes the whole file (streamed, same order as the old try/except chain)."""
+        if self._encoding:
+            return self._encoding
+        for enc in self.csv_encodings:
+            decoder = codecs.getincrementaldecoder(enc)()
+            try:
+                with open(self.path, 'rb') as f:
+                    while True:
+                        chunk = f.read(SPOOL_CHUNK_BYTES)
+                        if not chunk:
+                            break
+                        decoder.decode(chunk)
+                decoder.decode(b'', final=True)
+                self._encoding = enc
+                return enc
+            except UnicodeDecodeError:
+                continue
+        self._encoding = self.csv_encodings[-1]
+        return self._encoding
+
+    def _iter_csv(self):
+        encoding = self._detect_encoding()
+        with pd.read_csv(self.path, encoding=encoding, chunksize=self.batch_rows) as chunks:
+            for chunk in chunks:
+                yield chunk
+
+    # --- XLSX ---
+
+    @staticmethod
+    def _header_names(header):
+        """Column names the way read_excel builds them (Unnamed: i, duplicates -> name.1)."""
+        names, seen = [], {}
+        for i, h in enumerate(header):
+            name = f"Unnamed: {i}" if h is None or (isinstance(h, str) and not h.strip()) else h
+            if name in seen:
+                seen[name] += 1
+                name = f"{name}.{seen[name]}"
+            else:
+                seen[name] = 0
+            names.append(name)
+        return names
+
+    def _iter_xlsx(self):
+        from openpyxl import load_workbook
+        wb = load_workbook(self.path, read_only=True, data_only=True)
+        try:
+            ws = wb.active
+            width = ws.max_column
+            if not width:
+                # No <dimension> tag: find the widest row with a streamed pre-pass
+                ws.reset_dimensions()
+                width = max((len(r) for r in ws.iter_rows(values_only=True)), default=0)
+            rows = ws.iter_rows(values_only=True)
+            header = next(rows, None)
+            if header is None:
+                return
+            header = tuple(header[:width]) + (None,) * (width - len(header))
+            columns = self._header_names(header)
+
+            batch, start = [], 0
+            for row in rows:
+                row = tuple(row[:width]) + (None,) * (width - len(row))
+                batch.append(row)
+                if len(batch) >= self.batch_rows:
+                    yield pd.DataFrame(batch, columns=columns, index=range(start, start + len(batch)))
+                    start += len(batch)
+                    batch = []
+            if batch:
+                yield pd.DataFrame(batch, columns=columns, index=range(start, start + len(batch)))
+        finally:
+            wb.close()
+
+    # --- Fallback ---
+
+    def _iter_frame(self, df):
+        for i in range(0, len(df), self.batch_rows):
+            yield df.iloc[i:i + self.batch_rows]
@@ -0,0 +1,54 @@
+import pandas as pd
+from datetime import date
+from sqlalchemy import create_engine
+from sqlalchemy.orm import sessionmaker
+from backend.database import Base
+from backend.models import FactSales, FactSalesDaily, FactPurchases, FactPurchasesDaily
+from backend.services.daily_aggregates import DailyAggregates
+import backend.routers.data_management as dm
+
+def make_session(tmp_path, monkeypatch):
+    engine = create_engine(f"sqlite:///{tmp_path / 'daily.db'}")
+    Base.metadata.create_all(engine)
+    monkeypatch.setattr(dm, 'trigger_auto_calculation', lambda db, **kwargs: None)
+    db = sessionmaker(bind=engine)()
+    DailyAggregates(db).ensure_built()
+    return db
+
+def daily_total(db, model, day):
+    return sum(r.quantity for r in db.query(model).filter(model.day == day).all())
+
+def test_sales_blank_date_reaches_daily_table(tmp_path, monkeypatch):
+    db = make_session(tmp_path, monkeypatch)
+    df = pd.DataFrame({
+        'Ngày chứng từ': ['05/01/2025', None, 'not a date'],
+        'Số chứng từ': ['HD1', 'HD2', 'HD3'],
+        'Mã hàng': ['A100', 'A100', 'A200'],
+        'Số lượng': [1, 2, 3]
+    })
+    count, errors = dm.process_sales_details_file(df, db)
+    assert count == 3 and not errors
+    assert daily_total(db, FactSalesDaily, date(2025, 1, 5)) == 1
+    assert daily_total(db, FactSalesDaily, date.today()) == 5 # Rows stamped with the import time
+    assert db.query(FactSales).count() == 3
+
+def test_sales_no_parseable_date_reaches_daily_table(tmp_path, monkeypatch):
+    db = make_session(tmp_path, monkeypatch)
+    df = pd.DataFrame({'Ngày chứng từ': [None], 'Số chứng từ': ['HD1'], 'Mã hàng': ['A100'], 'Số lượng': [4]})
+    count, _ = dm.process_sales_details_file(df, db)
+    assert count == 1
+    assert daily_total(db, FactSalesDaily, date.today()) == 4
+
+def test_purchase_blank_date_reaches_daily_table(tmp_path, monkeypatch):
+    db = make_session(tmp_path, monkeypatch)
+    df = pd.DataFrame({
+        'Ngày chứng từ': ['05/01/2025', None],
+        'Số chứng từ': ['PN1', 'PN2'],
+        'Mã hàng': ['A100', 'A200'],
+        'Số lượng': [6, 7]
+    })
+    count, errors = dm.process_purchase_details_file(df, db)
+    assert count == 2 and not errors
+    assert daily_total(db, FactPurchasesDaily, date(2025, 1, 5)) == 6
+    assert daily_total(db, FactPurchasesDaily, date.today()) == 7
+    assert db.query(FactPurchases).count() == 2
@@ -0,0 +1,39 @@
+import numpy as np
+import pandas as pd
+from datetime import datetime
+from backend.routers.data_management import clean_text_column, _sales_dates, _sales_frame, _purchase_frame
+
+NOW = datetime(2026, 1, 1)
+
+def test_clean_text_column_blanks():
+    # pandas 3: astype(str) keeps None/NaN as missing values instead of 'None'/'nan'
+    series = pd.Series([' A1 ', None, np.nan, 'nan', 'NaT', pd.NaT, 'B2'], dtype=object)
+    assert clean_text_column(series).tolist() == ['A1', '', '', '', '', '', 'B2']
+
+def test_sales_frame_blank_transaction_ids():
+    data = pd.DataFrame({
+        'Ngày': ['01/02/2026', '02/02/2026', '03/02/2026'],
+        'Số': ['HD1', None, np.nan],
+        'Mã': ['SKU1', 'SKU2', None],
+        'SL': [1, 2, 3]
+    })
+    layout = {"date": 'Ngày', "tx": 'Số', "sku": 'Mã', "qty": 'SL', "amount": None, "unmapped": []}
+    frame = _sales_frame(data, layout, NOW)
+    assert frame['sku_id'].tolist() == ['SKU1', 'SKU2'] # Row without SKU skipped
+    assert frame['transaction_id'].tolist() == ['HD1_SKU1_0', 'IMP-SALE-1_SKU2_1']
+    assert frame['transaction_id'].notna().all()
+    assert _sales_dates(data, layout).dt.day.tolist() == [1, 2] # Pass 1 reads the same rows as pass 2
+
+def test_purchase_frame_blank_warehouse():
+    data = pd.DataFrame({
+        'Ngày': ['01/02/2026', '02/02/2026'],
+        'Số': [None, 'PN2'],
+        'Mã hàng': ['A100', 'A200'],
+        'Kho': [np.nan, 'KHO2'],
+        'Số lượng': [5, 6]
+    })
+    layout = {"date": 'Ngày', "tx": 'Số', "sku": 'Mã hàng', "wh": 'Kho', "qty": 'Số lượng'}
+    frame, _ = _purchase_frame(data, layout, NOW)
+    assert frame['warehouse_id'].tolist() == ['66 An dương vương', 'KHO2']
+    assert frame['order_id'].tolist() == ['IMP-PUR-0', 'PN2']
+    assert frame['transaction_id'].notna().all()
@@ -7,7 +7,7 @@ import { Table, TableBody, TableCell, TableHead, TableHeader, TableRow } from "@
 import { Button } from "@/components/ui/button";
 import { Card, CardContent, CardHeader, CardTitle, CardDescription } from "@/components/ui/card";
 import { Input } from "@/components/ui/input";
-import { Loader2, Download, Search, RefreshCw } from "lucide-react";
+import { Loader2, Download, Search, RefreshCw, ArrowLeft, ArrowRight } from "lucide-react";
 import * as XLSX from "xlsx";
 
 interface OrderPlanRow {
@@ -25,20 +25,38 @@ interface OrderPlanRow {
     notes: string;
 }
 
+const PAGE_SIZE = 100;
+
 export default function OrderPlanningPage() {
     const [data, setData] = useState<OrderPlanRow[]>([]);
+    const [total, setTotal] = useState(0);
     const [loading, setLoading] = useState(false);
     const [searchTerm, setSearchTerm] = useState("");
+    const [search, setSearch] = useState("");
+    const [page, setPage] = useState(1);
+    const pageCount = Math.max(1, Math.ceil(total / PAGE_SIZE));
+
+    // De-bounce search (filtering, sorting and paging happen on the server snapshot)
+    useEffect(() => {
+        const timer = setTimeout(() => {
+            setSearch(searchTerm);
+            setPage(1);
+        }, 500);
+        return () => clearTimeout(timer);
+    }, [searchTerm]);
 
     useEffect(() => {
         fetchData();
-    }, []);
+    }, [page, search]);
 
     const fetchData = async () => {
         setLoading(true);
         try {
-            const res = await axios.get(`${API_BASE_URL}/api/planning/order-plan`);
-            setData(res.data);
+            const res = await axios.get(`${API_BASE_URL}/api/planning/order-plan`, {
+                params: { skip: (page - 1) * PAGE_SIZE, limit: PAGE_SIZE, search: search || undefined }
+            });
+            setData(res.data.data || []);
+            setTotal(res.data.total || 0);
         } catch (error) {
             console.error(error);
         } finally {
@@ -46,18 +64,26 @@ export default function OrderPlanningPage() {
         }
     };
 
-    const handleExport = () => {
-        const ws = XLSX.utils.json_to_sheet(data);
+    const refreshPlan = async () => {
+        setLoading(true);
+        try {
+            await axios.post(`${API_BASE_URL}/api/planning/order-plan/refresh`);
+        } catch (error) {
+            console.error(error);
+        }
+        fetchData();
+    };
+
+    const handleExport = async () => {
+        const res = await axios.get(`${API_BASE_URL}/api/planning/order-plan`, {
+            params: { limit: total || PAGE_SIZE, search: search || undefined }
+        });
+        const ws = XLSX.utils.json_to_sheet(res.data.data || []);
         const wb = XLSX.utils.book_new();
         XLSX.utils.book_append_sheet(wb, ws, "Order Plan");
         XLSX.writeFile(wb, "Order_Plan.xlsx");
     };
 
-    const filteredData = data.filter(r =>
-        r.sku_id.toLowerCase().includes(searchTerm.toLowerCase()) ||
-        r.product_name.toLowerCase().includes(searchTerm.toLowerCase())
-    );
-
     return (
         <div className="container mx-auto p-4 space-y-6">
             <div className="flex justify-between items-center">
@@ -66,7 +92,7 @@ export default function OrderPlanningPage() {
                     <Button variant="outline" onClick={handleExport}>
                         <Download className="mr-2 h-4 w-4" /> Export
                     </Button>
-                    <Button onClick={fetchData} disabled={loading}>
+                    <Button onClick={refreshPlan} disabled={loading}>
                         {loading ? <Loader2 className="animate-spin mr-2 h-4 w-4" /> : <RefreshCw className="mr-2 h-4 w-4" />}
                         Refresh
                     </Button>
@@ -109,12 +135,12 @@ export default function OrderPlanningPage() {
                                     <TableRow>
                                         <TableCell colSpan={9} className="text-center py-8">Loading...</TableCell>
                                     </TableRow>
-                                ) : filteredData.length === 0 ? (
+                                ) : data.length === 0 ? (
                                     <TableRow>
                                         <TableCell colSpan={9} className="text-center py-8 text-muted-foreground">No records found.</TableCell>
                                     </TableRow>
                                 ) : (
-                                    filteredData.map(row => (
+                                    data.map(row => (
                                         <TableRow key={row.sku_id}>
                                             <TableCell className="font-medium">{row.sku_id}</TableCell>
                                             <TableCell>{row.product_name}</TableCell>
@@ -133,6 +159,15 @@ export default function OrderPlanningPage() {
                             </TableBody>
                         </Table>
                     </div>
+
+                    <div className="flex items-center justify-between">
+                        <div className="text-sm text-muted-foreground">{total.toLocaleString()} SKUs</div>
+                        <div className="flex items-center space-x-2">
+                            <Button variant="outline" size="sm" onClick={() => setPage(p => Math.max(1, p - 1))} disabled={page === 1 || loading}><ArrowLeft className="h-4 w-4" /></Button>
+                            <div className="text-sm">Page {page} of {pageCount}</div>
+                            <Button variant="outline" size="sm" onClick={() => setPage(p => p + 1)} disabled={page >= pageCount || loading}><ArrowRight className="h-4 w-4" /></Button>
+                        </div>
+                    </div>
                 </CardContent>
             </Card>
         </div>
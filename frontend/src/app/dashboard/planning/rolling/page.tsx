@@ -469,17 +469,17 @@ export default function RollingPlanningPage() {
         try {
             const updates = Object.entries(edits).map(([key, val]) => {
                 const [sku_id, bucket_date] = key.split('|');
-                return {
-                    sku_id,
-                    warehouse_id: selectedWarehouse === 'ALL' ? 'ALL' : selectedWarehouse, // Caution: If ALL, assuming global update or default 'ALL' WH
-                    bucket_date,
-                    planned_supply: val
-                };
+                return { sku_id, bucket_date, planned_supply: val };
             });
 
-            const res = await axios.post(`${API_BASE_URL}/api/planning/rolling/update`, updates);
+            // One edit session: bulk upsert + one recompute per edited SKU
+            const res = await axios.post(`${API_BASE_URL}/api/planning/rolling/edits`, {
+                profile_id: selectedProfile,
+                warehouse_id: selectedWarehouse || 'ALL',
+                edits: updates
+            });
             if (res.data.status === 'success') {
-                alert(`Saved ${res.data.updated} changes!`);
+                alert(`Saved ${res.data.cells} changes!`);
                 setEdits({});
                 fetchData(); // Refresh
             }
@@ -494,13 +494,22 @@ export default function RollingPlanningPage() {
     const handleRunCalculation = async () => {
         setCalculating(true);
         try {
-            await axios.post(`${API_BASE_URL}/api/planning/rolling/run`, {
+            const res = await axios.post(`${API_BASE_URL}/api/planning/rolling/run`, {
                 horizon_months: 12,
                 profile_id: selectedProfile,
                 group_id: selectedGroup,
                 warehouse_id: selectedWarehouse,
                 run_date: runDate
             });
+            // Runs are background jobs: poll until it finishes
+            let job = res.data;
+            while (job.status === "started" || job.status === "running" || job.status === "QUEUED" || job.status === "RUNNING") {
+                await new Promise(resolve => setTimeout(resolve, 2000));
+                job = (await axios.get(`${API_BASE_URL}/api/jobs/${res.data.job_id}`)).data;
+            }
+            if (job.status !== "SUCCESS") {
+                throw new Error(job.error || `Calculation ${job.status}`);
+            }
             await fetchData(); // Refresh
             alert(`Calculation Complete (Mode: ${selectedProfile})!`);
         } catch (error) {